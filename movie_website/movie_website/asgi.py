@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movie_website.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from movies.coalescing import flush_on_shutdown  # noqa: E402 (needs the app registry ready)
+
+application = flush_on_shutdown(django_application)
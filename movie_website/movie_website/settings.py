@@ -18,6 +18,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movies.middleware.QueryBudgetMiddleware',
+    'movies.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -47,13 +49,78 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'movie_website.wsgi.application'
 
+# Run on every new SQLite connection. WAL lets readers and the writer work
+# concurrently; with WAL, synchronous=NORMAL only risks the last commits on
+# an OS crash, never corruption.
+SQLITE_PRAGMAS = ';'.join([
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',  # read up to 256 MiB of the file through the OS page cache
+    'PRAGMA cache_size=-20000',  # 20 MB page cache per connection
+])
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            # atomic() takes the write lock at BEGIN, so a transaction that
+            # reads before writing waits for the lock instead of failing with
+            # "database is locked" when it tries to upgrade
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,  # busy timeout, seconds
+        },
     }
 }
 
+# Read-only copies of the default database, e.g.
+# DATABASE_REPLICA_PATHS=/srv/replica1.sqlite3:/srv/replica2.sqlite3 adds the
+# aliases replica1 and replica2 (see movies/routers.py). In tests they mirror
+# default; movie_website/settings_replica.py tests with a separate file.
+DATABASE_REPLICAS = []
+for number, path in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_PATHS', '').split(os.pathsep)), start=1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'NAME': path, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['movies.routers.ReplicaRouter']
+
+# Seconds a browser keeps reading from the primary after it changed something
+REPLICA_PIN_SECONDS = 5
+
+# Set REDIS_URL or CACHE_DIR to choose the cache shared by the worker
+# processes. Cache scope versions live in it, so each process keeping its own
+# (local memory) would serve stale fragments and 304s after another one
+# bumped them: local memory is only the default for the DEBUG runserver.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+elif os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+        }
+    }
+elif DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'movie-hub',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator','OPTIONS': {
@@ -79,4 +146,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# Send X-Query-* headers from QueryBudgetMiddleware
+QUERY_STATS_HEADERS = DEBUG
+
+# Run COUNT(*) for "Page x of y" on cursor-paginated lists; turn off for very large tables
+PAGINATION_COUNTS = True
+
+# Run background tasks inline instead of queueing them for manage.py run_tasks
+TASK_QUEUE_EAGER = False
+
+# Seconds rating and watchlist clicks are buffered and coalesced before being written; 0 writes each one
+WRITE_COALESCE_WINDOW = 0.5
+
+# Where train_recommender writes the latent-factor model
+RECOMMENDER_MODEL_DIR = BASE_DIR / 'recommender'
+
+# Memory-mapped recommendation arrays written by build_embedding_store
+EMBEDDING_STORE_PATH = RECOMMENDER_MODEL_DIR / 'embeddings.bin'
@@ -0,0 +1,29 @@
+"""
+The primary and a replica as two SQLite files, a stand-in for a replicated
+database when testing movies/routers.py:
+
+    python manage.py test movies.tests.ReplicaDatabaseTests --settings=movie_website.settings_replica
+
+Nothing copies the primary to the replica by itself; the tests replicate
+explicitly, so they can observe replica lag.
+"""
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+TEST_DATABASE_DIR = Path(tempfile.gettempdir())
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],
+        'TEST': {'NAME': str(TEST_DATABASE_DIR / 'movies-test-primary.sqlite3')},
+    },
+    'replica': {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+        'TEST': {'NAME': str(TEST_DATABASE_DIR / 'movies-test-replica.sqlite3')},
+    },
+}
+DATABASE_REPLICAS = ['replica']
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Movie, UserProfile, Rating, Review, Watchlist, UpcomingMovie
+from .models import Category, Movie, UserProfile, Rating, Review, Watchlist, UpcomingMovie, MovieSimilarity, Actor, Task, FeedItem, ContentSimilarity, TrendingCounter, TrendingRank
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -12,6 +12,11 @@ class MovieAdmin(admin.ModelAdmin):
     list_filter = ['category', 'created_at']
     search_fields = ['title', 'actors']
 
+@admin.register(Actor)
+class ActorAdmin(admin.ModelAdmin):
+    list_display = ['name', 'created_at']
+    search_fields = ['name']
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'bio']
@@ -30,7 +35,39 @@ class ReviewAdmin(admin.ModelAdmin):
 class WatchlistAdmin(admin.ModelAdmin):
     list_display = ['user', 'movie', 'added_at']
 
+@admin.register(MovieSimilarity)
+class MovieSimilarityAdmin(admin.ModelAdmin):
+    list_display = ['movie', 'similar_movie', 'score']
+    raw_id_fields = ['movie', 'similar_movie']
+
+@admin.register(ContentSimilarity)
+class ContentSimilarityAdmin(admin.ModelAdmin):
+    list_display = ['movie', 'similar_movie', 'score']
+    raw_id_fields = ['movie', 'similar_movie']
+
+@admin.register(FeedItem)
+class FeedItemAdmin(admin.ModelAdmin):
+    list_display = ['user', 'movie', 'score']
+    raw_id_fields = ['user', 'movie']
+
+@admin.register(TrendingCounter)
+class TrendingCounterAdmin(admin.ModelAdmin):
+    list_display = ['movie', 'activity', 'rating_count', 'watchlist_adds', 'decayed_to']
+    raw_id_fields = ['movie']
+
+@admin.register(TrendingRank)
+class TrendingRankAdmin(admin.ModelAdmin):
+    list_display = ['board', 'position', 'movie', 'score']
+    list_filter = ['board']
+    raw_id_fields = ['movie']
+
 @admin.register(UpcomingMovie)
 class UpcomingMovieAdmin(admin.ModelAdmin):
     list_display = ['title', 'expected_release_date', 'category', 'added_by']
-    list_filter = ['category', 'expected_release_date']
\ No newline at end of file
+    list_filter = ['category', 'expected_release_date']
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key', 'status', 'attempts', 'created_at', 'started_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['key']
@@ -0,0 +1,135 @@
+"""
+Approximate nearest-neighbour search over movie vectors.
+
+LSHIndex is random-hyperplane locality-sensitive hashing for cosine
+similarity. Each of TABLES hash tables signs the vector against `bits`
+random hyperplanes, so vectors at a small angle usually share a bucket.
+Each table keeps its codes sorted, which makes a bucket a contiguous slice
+found with searchsorted.
+
+A query also probes the buckets reached by flipping the bits whose
+hyperplanes pass closest to the query (multi-probe LSH). This buys the
+recall of many more tables without the memory. The union of the buckets
+is then re-ranked exactly by cosine, so the index only decides which
+movies get scored, never their order.
+
+more_like_this() runs the index over the ALS item factors in the shared
+embedding store. The index is built once per worker for each store file
+it sees.
+"""
+import numpy as np
+
+TABLES = 12
+BUCKET_SIZE = 32  # movies per bucket the number of bits aims for
+PROBES = 4  # extra buckets probed per table
+
+
+class LSHIndex:
+    """Cosine nearest-neighbour index over (id, vector) pairs; zero vectors are left out"""
+
+    def __init__(self, ids, vectors, tables=TABLES, bits=None, probes=PROBES, seed=0):
+        ids, vectors = np.asarray(ids, dtype=np.int64), np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        keep = norms > 0
+        order = np.argsort(ids[keep], kind='stable')
+        self.ids = ids[keep][order]
+        self.vectors = (vectors[keep] / norms[keep, None])[order]
+
+        count, dimensions = self.vectors.shape if self.vectors.ndim == 2 else (0, 0)
+        if bits is None:
+            bits = int(np.clip(np.round(np.log2(max(count, 1) / BUCKET_SIZE)), 1, 30))
+        self.bits, self.probes = bits, min(probes, bits)
+        self.weights = np.left_shift(1, np.arange(bits, dtype=np.int64))
+        self.planes = np.random.default_rng(seed).normal(size=(tables, dimensions, bits)).astype(np.float32)
+
+        # All tables in one sorted array: table t's codes are offset by t << bits
+        self.offsets = np.left_shift(np.arange(tables, dtype=np.int64), bits)[:, None]
+        codes = (self.hash(self.vectors).T + self.offsets).ravel()
+        self.members = np.argsort(codes, kind='stable')
+        self.codes = codes[self.members]
+        self.members %= max(count, 1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def hash(self, vectors):
+        """movies x tables array of bucket codes"""
+        projections = np.einsum('nd,tdb->ntb', vectors, self.planes)
+        return (projections > 0).astype(np.int64) @ self.weights
+
+    def candidates(self, vector):
+        """Rows of the movies sharing a probed bucket with vector"""
+        projections = np.einsum('d,tdb->tb', vector, self.planes)
+        codes = (projections > 0).astype(np.int64) @ self.weights
+        # Flip the `probes` least certain bits, one at a time
+        closest = np.argsort(np.abs(projections), axis=1)[:, :self.probes]
+        probed = (np.concatenate([codes[:, None], codes[:, None] ^ self.weights[closest]], axis=1)
+                  + self.offsets).ravel()
+        starts = np.searchsorted(self.codes, probed, 'left')
+        stops = np.searchsorted(self.codes, probed, 'right')
+        slices = [self.members[start:stop] for start, stop in zip(starts, stops) if stop > start]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        rows = np.sort(np.concatenate(slices))
+        return rows[np.concatenate(([True], rows[1:] != rows[:-1]))]  # much faster than np.unique here
+
+    def row(self, item_id):
+        row = int(np.searchsorted(self.ids, item_id))
+        return row if row < len(self.ids) and self.ids[row] == item_id else None
+
+    def query(self, vector, k=10, exclude=(), exact=False):
+        """[(id, cosine)] of the k nearest indexed vectors, best first; exact=True scans everything"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm or not len(self.ids):
+            return []
+        vector = vector / norm
+        rows = np.arange(len(self.ids)) if exact else self.candidates(vector)
+        if not len(rows):
+            return []
+        scores = self.vectors.take(rows, axis=0) @ vector
+        for item_id in exclude:
+            row = self.row(item_id)
+            if row is not None:
+                scores[rows == row] = -np.inf
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def query_id(self, item_id, k=10, exact=False):
+        """Nearest neighbours of an indexed id, leaving the id itself out"""
+        row = self.row(item_id)
+        if row is None:
+            return []
+        return self.query(self.vectors[row], k, exclude=(item_id,), exact=exact)
+
+
+_indexes = {}
+
+
+def get_index():
+    """An LSHIndex over the item factors of the current embedding store, or None"""
+    from .embeddings import get_store
+
+    store = get_store()
+    if store is None or not store.factors:
+        return None
+    cached = _indexes.get(store.path)
+    if cached is None or cached[0] != store.identity:
+        cached = _indexes[store.path] = (store.identity, LSHIndex(store.movie_ids, store.item_factors))
+    return cached[1]
+
+
+def more_like_this(movie, limit=6):
+    """Movies whose rating factors point the same way as this one's, most similar first"""
+    from .models import Movie
+
+    index = get_index()
+    if index is None:
+        return []
+    ids = [other for other, score in index.query_id(movie.pk, limit) if score > 0]
+    if not ids:
+        return []
+    movies = Movie.objects.in_bulk(ids)
+    return [movies[pk] for pk in ids if pk in movies]
@@ -0,0 +1,272 @@
+"""
+Read-only JSON API for movies, categories and upcoming movies.
+
+Every response carries a strong ETag and a public Cache-Control header, and
+a matching If-None-Match is answered with 304 before the view runs. The
+movie detail ETag comes from the movie's own updated_at and rating totals;
+list ETags come from the scope versions the model signals bump (see
+caching.py) plus the query string, so revalidating an unchanged list costs
+a cache lookup and no SQL.
+
+?fields=a,b picks the fields returned for each object.
+
+The movie list and detail endpoints are async views: under ASGI they wait on
+the database without holding a worker thread.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, F, Prefetch
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+
+from .caching import all_movies_scope, category_scope, get_version, source_tag, upcoming_scope
+from .models import Category, Movie, MovieCast, UpcomingMovie
+from .pagination import CursorPaginator
+from .search import asearch_queryset, search_queryset
+
+API_PAGE_SIZE = 50
+API_MAX_AGE = 60
+
+
+def poster_url(obj):
+    return obj.poster.url if obj.poster else None
+
+
+MOVIE_FIELDS = {
+    'id': lambda movie: movie.pk,
+    'url': lambda movie: reverse('movie_detail', args=[movie.pk]),
+    'title': lambda movie: movie.title,
+    'description': lambda movie: movie.description,
+    'release_date': lambda movie: movie.release_date,
+    'category': lambda movie: {'id': movie.category_id, 'name': movie.category.name},
+    'cast': lambda movie: [credit.actor.name for credit in movie.cast_credits.all()],
+    'rating': lambda movie: movie.rating,
+    'average_rating': lambda movie: movie.average_rating(),
+    'total_ratings': lambda movie: movie.rating_count,
+    'poster': poster_url,
+    'youtube_trailer': lambda movie: movie.youtube_trailer,
+    'created_at': lambda movie: movie.created_at,
+    'updated_at': lambda movie: movie.updated_at,
+}
+MOVIE_LIST_FIELDS = ('id', 'title', 'category', 'release_date', 'average_rating', 'total_ratings', 'poster')
+
+CATEGORY_FIELDS = {
+    'id': lambda category: category.pk,
+    'url': lambda category: reverse('movies_by_category', args=[category.pk]),
+    'name': lambda category: category.name,
+    'description': lambda category: category.description,
+    'movie_count': lambda category: category.movie_count,
+}
+
+UPCOMING_FIELDS = {
+    'id': lambda upcoming: upcoming.pk,
+    'title': lambda upcoming: upcoming.title,
+    'description': lambda upcoming: upcoming.description,
+    'expected_release_date': lambda upcoming: upcoming.expected_release_date,
+    'category': lambda upcoming: {'id': upcoming.category_id, 'name': upcoming.category.name},
+    'actors': lambda upcoming: upcoming.actors,
+    'poster': poster_url,
+    'youtube_trailer': lambda upcoming: upcoming.youtube_trailer,
+}
+UPCOMING_LIST_FIELDS = ('id', 'title', 'expected_release_date', 'category', 'poster')
+
+
+class InvalidRequest(ValueError):
+    pass
+
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def selected_fields(request, available, default):
+    """Field names from ?fields=, or the default set"""
+    names = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise InvalidRequest(f"Unknown fields: {', '.join(unknown)}")
+    return names or list(default)
+
+
+def serialize(obj, spec, fields):
+    return {name: spec[name](obj) for name in fields}
+
+
+def category_filter(request):
+    category = request.GET.get('category', '')
+    if category and not category.isdigit():
+        raise InvalidRequest("category must be a category id")
+    return category
+
+
+def etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def query_key(request):
+    """Canonical form of the query string, so parameter order doesn't split ETags"""
+    return sorted(request.GET.lists())
+
+
+def movie_list_etag(request):
+    category = request.GET.get('category', '')
+    scope = category_scope(category) if category.isdigit() else all_movies_scope()
+    return etag('movies', get_version(scope), query_key(request), source_tag())
+
+
+async def movie_detail_etag(request, pk):
+    row = await (
+        Movie.objects.filter(pk=pk)
+        .values_list('updated_at', 'rating_sum', 'rating_count', 'category__name')
+        .afirst()
+    )
+    if row is None:
+        return None
+    updated_at, rating_sum, rating_count, category_name = row
+    return etag('movie', pk, updated_at.timestamp(), rating_sum, rating_count, category_name, query_key(request))
+
+
+def category_list_etag(request):
+    return etag('categories', get_version(all_movies_scope()), query_key(request), source_tag())
+
+
+def upcoming_list_etag(request):
+    return etag('upcoming', get_version(upcoming_scope()), query_key(request), source_tag())
+
+
+def async_condition(etag_func):
+    """condition() for async views whose ETag function is a coroutine (condition() calls it synchronously)"""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            res_etag = await etag_func(request, *args, **kwargs)
+            res_etag = quote_etag(res_etag) if res_etag is not None else None
+            response = get_conditional_response(request, etag=res_etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if res_etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', res_etag)
+            return response
+        return inner
+    return decorator
+
+
+def with_cast(movies):
+    return movies.prefetch_related(
+        Prefetch('cast_credits', queryset=MovieCast.objects.select_related('actor'))
+    )
+
+
+def page_response(page, spec, fields):
+    return api_response({
+        'results': [serialize(obj, spec, fields) for obj in page],
+        'next': page.next_cursor or None,
+        'previous': page.previous_cursor or None,
+    })
+
+
+def paginated_response(queryset, ordering, request, spec, fields):
+    page = CursorPaginator(queryset, API_PAGE_SIZE, ordering, with_count=False).get_page(request.GET.get('cursor'))
+    return page_response(page, spec, fields)
+
+
+async def apaginated_response(queryset, ordering, request, spec, fields):
+    paginator = CursorPaginator(queryset, API_PAGE_SIZE, ordering, with_count=False)
+    return page_response(await paginator.aget_page(request.GET.get('cursor')), spec, fields)
+
+
+@require_safe
+@cache_control(public=True, max_age=API_MAX_AGE)
+@condition(etag_func=movie_list_etag)
+async def movie_list(request):
+    """Movies, newest first; supports the home page's search, category and sort parameters"""
+    try:
+        fields = selected_fields(request, MOVIE_FIELDS, MOVIE_LIST_FIELDS)
+        category = category_filter(request)
+    except InvalidRequest as exc:
+        return api_response({'error': str(exc)}, status=400)
+
+    movies = Movie.objects.select_related('category')
+    ordering = ('-created_at', '-id')
+
+    if category:
+        movies = movies.filter(category_id=category)
+
+    top_rated = request.GET.get('sort') == 'top_rated'
+    if top_rated:
+        movies = movies.filter(rating_count__gt=0).annotate(
+            rating_average=F('rating_sum') * 1.0 / F('rating_count')
+        )
+        ordering = ('-rating_average', '-rating_count', '-id')
+
+    # After the filters, so the index only returns matches they keep
+    search_query = request.GET.get('search', '')
+    if search_query:
+        movies = await asearch_queryset(movies, search_query)
+        ordering = ordering if top_rated else ('search_rank', 'id')
+
+    if 'cast' in fields:
+        movies = with_cast(movies)
+    return await apaginated_response(movies, ordering, request, MOVIE_FIELDS, fields)
+
+
+@require_safe
+@cache_control(public=True, max_age=API_MAX_AGE)
+@async_condition(movie_detail_etag)
+async def movie_detail(request, pk):
+    """A single movie with every field unless ?fields= narrows it"""
+    try:
+        fields = selected_fields(request, MOVIE_FIELDS, MOVIE_FIELDS)
+    except InvalidRequest as exc:
+        return api_response({'error': str(exc)}, status=400)
+
+    movies = Movie.objects.select_related('category')
+    if 'cast' in fields:
+        movies = with_cast(movies)
+    movie = await movies.filter(pk=pk).afirst()
+    if movie is None:
+        return api_response({'error': 'Movie not found'}, status=404)
+    return api_response(serialize(movie, MOVIE_FIELDS, fields))
+
+
+@require_safe
+@cache_control(public=True, max_age=API_MAX_AGE)
+@condition(etag_func=category_list_etag)
+def category_list(request):
+    """Every category with its movie count"""
+    try:
+        fields = selected_fields(request, CATEGORY_FIELDS, CATEGORY_FIELDS)
+    except InvalidRequest as exc:
+        return api_response({'error': str(exc)}, status=400)
+
+    categories = Category.objects.annotate(movie_count=Count('movies'))
+    return api_response({'results': [serialize(category, CATEGORY_FIELDS, fields) for category in categories]})
+
+
+@require_safe
+@cache_control(public=True, max_age=API_MAX_AGE)
+@condition(etag_func=upcoming_list_etag)
+def upcoming_list(request):
+    """Upcoming movies, soonest first"""
+    try:
+        fields = selected_fields(request, UPCOMING_FIELDS, UPCOMING_LIST_FIELDS)
+        category = category_filter(request)
+    except InvalidRequest as exc:
+        return api_response({'error': str(exc)}, status=400)
+
+    upcoming = UpcomingMovie.objects.select_related('category')
+    ordering = ('expected_release_date', 'id')
+
+    if category:
+        upcoming = upcoming.filter(category_id=category)
+
+    search_query = request.GET.get('search', '')
+    if search_query:
+        upcoming = search_queryset(upcoming, search_query)
+        ordering = ('search_rank', 'id')
+    return paginated_response(upcoming, ordering, request, UPCOMING_FIELDS, fields)
@@ -0,0 +1,130 @@
+"""
+Template fragment caching with targeted invalidation.
+
+Fragments are cached under keys built from their name and vary-on values.
+Per-object fragments (movie cards, cast) vary on the object's own version, so
+edits produce new keys. Fragments that aggregate many objects (list pages,
+review lists) vary on a version counter per scope that the model signal
+handlers bump, which invalidates only the scopes a change touches.
+
+Hit and miss counts per fragment name are kept in the cache as well, so they
+are shared by every worker using the same backend.
+
+The same scope versions double as the aggregate part of the JSON API's ETags.
+
+A write bumps its scopes on the primary straight away, but a request served
+from a read replica may render the rows from before it. Values built from a
+replica are therefore cached under keys of their own (source_key), never
+read by requests on the primary such as a writer's pinned ones, and kept no
+longer than REPLICA_PIN_SECONDS, the lag replicas are assumed to stay
+within. ETags built from them (source_tag) change as often.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import current_replica
+
+FRAGMENT_TIMEOUT = 60 * 60
+FRAGMENT_NAMES = ('movie_card', 'movie_list', 'category_list', 'movie_cast', 'movie_reviews')
+
+
+def fragment_key(name, vary_on):
+    digest = hashlib.md5(':'.join(str(value) for value in vary_on).encode()).hexdigest()
+    return f'fragment:{name}:{digest}'
+
+
+def version_key(scope):
+    return f'fragment-version:{scope}'
+
+
+def stats_key(name, outcome):
+    return f'fragment-stats:{name}:{outcome}'
+
+
+def source_key(key):
+    """Cache key for a value built from what the current request reads"""
+    replica = current_replica()
+    return key if replica is None else f'{key}@{replica}'
+
+
+def source_timeout(timeout):
+    """Cache timeout for a value built from what the current request reads"""
+    return timeout if current_replica() is None else min(timeout, settings.REPLICA_PIN_SECONDS)
+
+
+def source_tag():
+    """ETag part telling responses read from a replica apart, renewed every REPLICA_PIN_SECONDS"""
+    replica = current_replica()
+    if replica is None:
+        return ''
+    return f'{replica}@{int(time.time() // settings.REPLICA_PIN_SECONDS)}'
+
+
+def all_movies_scope():
+    return 'movies'
+
+
+def category_scope(category_id):
+    return f'category:{category_id}'
+
+
+def reviews_scope(movie_id):
+    return f'reviews:{movie_id}'
+
+
+def upcoming_scope():
+    return 'upcoming'
+
+
+def trending_scope():
+    return 'trending'
+
+
+def get_version(scope):
+    """
+    Current version of a scope.
+
+    Missing versions start from the clock rather than from 1, so a version
+    counter evicted before its fragments can never come back to a value an
+    old fragment was stored under.
+    """
+    key = version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_versions(*scopes):
+    """Invalidate every fragment cached under the given scopes"""
+    for scope in set(scopes):
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            cache.add(version_key(scope), time.time_ns(), timeout=None)
+
+
+def record(name, hit):
+    key = stats_key(name, 'hits' if hit else 'misses')
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_stats():
+    """Return {fragment name: (hits, misses)}"""
+    keys = [stats_key(name, outcome) for name in FRAGMENT_NAMES for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    return {
+        name: (values.get(stats_key(name, 'hits'), 0), values.get(stats_key(name, 'misses'), 0))
+        for name in FRAGMENT_NAMES
+    }
+
+
+def reset_stats():
+    cache.delete_many([stats_key(name, outcome) for name in FRAGMENT_NAMES for outcome in ('hits', 'misses')])
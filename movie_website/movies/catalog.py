@@ -0,0 +1,268 @@
+"""
+Streaming bulk import and export of the movie catalog.
+
+Files are CSV or JSON Lines with one movie per row:
+
+    title, description, release_date (YYYY-MM-DD), actors, rating (0-10),
+    category (by name), youtube_trailer, poster (URL or file path)
+
+Rows are read and written one at a time, so memory use doesn't grow with the
+file. Imports collect rows into batches, fetch the batch's posters on a
+bounded thread pool, then insert the batch with bulk_create in a single
+transaction. bulk_create skips the model signals, so the cast credits,
+search documents and list cache versions that post_save would maintain are
+written here in bulk instead, and renditions are queued for the posters.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .caching import all_movies_scope, bump_versions, category_scope
+from .images import schedule_renditions
+from .models import Category, Movie, bulk_create_cast
+from .search import get_backend
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CATALOG_FIELDS = ('title', 'description', 'release_date', 'actors', 'rating', 'category', 'youtube_trailer', 'poster')
+FORMATS = ('csv', 'jsonl')
+MAX_POSTER_BYTES = 10 * 1024 * 1024
+MAX_REPORTED_ERRORS = 20
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path):
+    """Format implied by a file name's extension"""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return 'jsonl' if extension in ('jsonl', 'ndjson', 'json') else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict or RowError) for every record in the stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, RowError(f'invalid JSON: {exc}')
+            continue
+        yield number, row if isinstance(row, dict) else RowError('expected a JSON object')
+
+
+def clean_row(row):
+    """Validate a raw row and convert it to Movie field values"""
+    values = {field: str(row.get(field) or '').strip() for field in CATALOG_FIELDS}
+    for field in ('title', 'category', 'release_date'):
+        if not values[field]:
+            raise RowError(f'{field} is required')
+    for field, limit in (('title', 200), ('actors', 500), ('category', 100), ('youtube_trailer', 200)):
+        if len(values[field]) > limit:
+            raise RowError(f'{field} is longer than {limit} characters')
+    try:
+        values['release_date'] = date.fromisoformat(values['release_date'])
+    except ValueError:
+        raise RowError(f"release_date must be YYYY-MM-DD, got {values['release_date']!r}")
+    try:
+        values['rating'] = float(values['rating'] or 0)
+    except ValueError:
+        raise RowError(f"rating must be a number, got {values['rating']!r}")
+    if not 0 <= values['rating'] <= 10:
+        raise RowError('rating must be between 0 and 10')
+    return values
+
+
+class CategoryCache:
+    """Category ids by case-insensitive name, creating missing categories once"""
+
+    def __init__(self):
+        self.ids = {name.casefold(): pk for name, pk in Category.objects.values_list('name', 'pk')}
+
+    def resolve(self, name):
+        key = name.casefold()
+        if key not in self.ids:
+            category, _ = Category.objects.get_or_create(name__iexact=name, defaults={'name': name})
+            self.ids[key] = category.pk
+        return self.ids[key]
+
+
+def fetch_poster(source, root='.', timeout=10, max_bytes=MAX_POSTER_BYTES):
+    """Download or read a poster and store it as a Movie poster, returning the storage name"""
+    if urlparse(source).scheme in ('http', 'https'):
+        with urlopen(source, timeout=timeout) as response:
+            data = response.read(max_bytes + 1)
+        filename = os.path.basename(urlparse(source).path) or 'poster.jpg'
+    else:
+        path = Path(root, source)
+        if path.stat().st_size > max_bytes:
+            raise ValueError(f'{source} is larger than {max_bytes} bytes')
+        data = path.read_bytes()
+        filename = path.name
+    if len(data) > max_bytes:
+        raise ValueError(f'{source} is larger than {max_bytes} bytes')
+
+    field = Movie._meta.get_field('poster')
+    return field.storage.save(field.generate_filename(None, filename), ContentFile(data))
+
+
+class CatalogImporter:
+    """Import rows in batches; counters are available on the instance afterwards"""
+
+    def __init__(self, added_by, batch_size=1000, poster_workers=8, poster_root='.', poster_timeout=10):
+        self.added_by = added_by
+        self.batch_size = batch_size
+        self.poster_workers = poster_workers
+        self.poster_root = poster_root
+        self.poster_timeout = poster_timeout
+        self.categories = CategoryCache()
+        self.touched_categories = set()
+        self.rows = self.imported = self.skipped = 0
+        self.posters = self.poster_failures = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def error(self, number, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'line {number}: {message}')
+
+    def run(self, rows):
+        started = time.perf_counter()
+        batch = []
+        with ThreadPoolExecutor(max_workers=max(1, self.poster_workers)) as pool:
+            for number, row in rows:
+                self.rows += 1
+                try:
+                    if isinstance(row, RowError):
+                        raise row
+                    batch.append((number, clean_row(row)))
+                except RowError as exc:
+                    self.skipped += 1
+                    self.error(number, exc)
+                    continue
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch, pool)
+                    batch = []
+            if batch:
+                self.import_batch(batch, pool)
+
+        if self.touched_categories:
+            bump_versions(all_movies_scope(), *(category_scope(pk) for pk in self.touched_categories))
+        self.elapsed = time.perf_counter() - started
+        return self
+
+    def fetch_posters(self, batch, pool):
+        futures = {
+            index: pool.submit(fetch_poster, values['poster'], self.poster_root, self.poster_timeout)
+            for index, (_, values) in enumerate(batch) if values['poster']
+        }
+        posters = {}
+        for index, future in futures.items():
+            try:
+                posters[index] = future.result()
+                self.posters += 1
+            except (OSError, ValueError) as exc:
+                self.poster_failures += 1
+                self.error(batch[index][0], f'poster not imported: {exc}')
+        return posters
+
+    def import_batch(self, batch, pool):
+        posters = self.fetch_posters(batch, pool)
+        movies = []
+        for index, (_, values) in enumerate(batch):
+            category_id = self.categories.resolve(values['category'])
+            self.touched_categories.add(category_id)
+            movies.append(Movie(
+                title=values['title'],
+                description=values['description'],
+                release_date=values['release_date'],
+                actors=values['actors'],
+                rating=values['rating'],
+                category_id=category_id,
+                youtube_trailer=values['youtube_trailer'],
+                poster=posters.get(index, ''),
+                added_by=self.added_by,
+            ))
+
+        try:
+            with transaction.atomic():
+                Movie.objects.bulk_create(movies)
+                bulk_create_cast(movies)
+                get_backend().index_new(movies)
+                for movie in movies:
+                    schedule_renditions(movie.poster)
+        except Exception:
+            for name in posters.values():
+                Movie._meta.get_field('poster').storage.delete(name)
+            raise
+        self.imported += len(movies)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def export_rows(queryset):
+    """Yield catalog rows for movies, streaming from the database"""
+    movies = queryset.select_related('category').order_by('pk')
+    for movie in movies.iterator(chunk_size=2000):
+        poster = ''
+        if movie.poster:
+            try:
+                poster = movie.poster.path
+            except NotImplementedError:
+                poster = movie.poster.url
+        yield {
+            'title': movie.title,
+            'description': movie.description,
+            'release_date': movie.release_date.isoformat(),
+            'actors': movie.actors,
+            'rating': movie.rating,
+            'category': movie.category.name,
+            'youtube_trailer': movie.youtube_trailer,
+            'poster': poster,
+        }
+
+
+def write_rows(stream, fmt, rows):
+    """Write rows to a text stream; return how many were written"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=CATALOG_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def peak_memory_mib():
+    """Peak resident set size of this process, where the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / 1024 / 1024 if os.uname().sysname == 'Darwin' else peak / 1024
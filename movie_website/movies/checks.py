@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCAL_MEMORY = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Cache scope versions must be shared by every worker process, which local memory isn't"""
+    if settings.DEBUG or settings.CACHES.get('default', {}).get('BACKEND') != LOCAL_MEMORY:
+        return []
+    return [Error(
+        'The default cache is local memory, so each worker process keeps its own cache versions '
+        'and serves stale fragments and 304s after another one changes the data.',
+        hint='Set REDIS_URL or CACHE_DIR, or configure a shared backend in CACHES.',
+        id='movies.E001',
+    )]
@@ -0,0 +1,268 @@
+"""
+Coalescing of rapid rating and watchlist writes.
+
+Users double-click the watchlist heart and scrub across the rating stars,
+and each event used to be a separate write transaction fighting over the
+SQLite lock. rate_movie and toggle_watchlist instead record the change in a
+per-process WriteBuffer, keyed by (user, movie), and answer from the
+buffer. Only the last rating of each key survives; for the watchlist the
+buffer keeps whether the entry was toggled an odd number of times, and the
+flush flips the row as it is then.
+
+A background thread flushes everything buffered every
+WRITE_COALESCE_WINDOW seconds, in one transaction. The flush goes through
+the normal model save and delete paths, so the rating totals, similarity
+changes and queued tasks follow as before. A rating that ends where it
+started, or a watchlist entry toggled back, is not written at all; a
+double-click costs nothing.
+
+Pending writes are not lost on a normal worker shutdown:
+
+- WSGI workers flush them when the process exits. gunicorn workers exit
+  normally on SIGTERM and SIGINT.
+- uvicorn re-raises the signal once it has drained, which skips exit
+  handlers. asgi.py therefore wraps the application in
+  flush_on_shutdown(), which flushes on the ASGI lifespan shutdown event.
+- A failed flush keeps its entries for the next attempt.
+
+The buffer is per process. A request served by another worker within the
+window reads the state from before the flush, so with several workers the
+state and totals these endpoints answer are best-effort. What is stored is
+not: toggles buffered by different workers combine, as each flush flips the
+current row, and the last rating flushed wins. Pages other than these two
+endpoints read the database, so they show a new rating or watchlist entry
+once it has been flushed.
+
+With WRITE_COALESCE_WINDOW = 0 every event is flushed inside its own
+request, which the tests use.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.util import Finalize
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .models import Movie, Rating, Watchlist
+
+logger = logging.getLogger('movies.coalescing')
+
+
+def coalesce_window():
+    return getattr(settings, 'WRITE_COALESCE_WINDOW', 0)
+
+
+class WriteBuffer:
+    """Latest rating and watchlist state per (user id, movie id), waiting to be written"""
+
+    def __init__(self):
+        self.reset()
+        os.register_at_fork(after_in_child=self.reset)
+        # Runs at interpreter exit, and also when a multiprocessing child
+        # finishes, which skips atexit
+        Finalize(None, self.flush, exitpriority=10)
+
+    def reset(self):
+        """Start empty; a forked child leaves the parent's entries to the parent"""
+        self.lock = threading.Lock()
+        self.ratings = {}  # key: (rating, stored rating or None)
+        self.watchlist = {}  # key: (in watchlist, toggled an odd number of times)
+        self.flushing = ({}, {})  # taken by a flush but not committed yet
+        self.thread = None
+
+    def _entry(self, entries, flushing, key):
+        return entries.get(key) or flushing.get(key)
+
+    def rating(self, user_id, movie_id):
+        """(rating, stored rating) while a rating is buffered, else None"""
+        with self.lock:
+            return self._entry(self.ratings, self.flushing[0], (user_id, movie_id))
+
+    def in_watchlist(self, user_id, movie_id):
+        """(in watchlist, toggled an odd number of times) while toggles are buffered, else None"""
+        with self.lock:
+            return self._entry(self.watchlist, self.flushing[1], (user_id, movie_id))
+
+    def rate(self, user_id, movie_id, rating, stored):
+        """Buffer a rating; stored is the rating in the database. Return the rating it replaces"""
+        key = (user_id, movie_id)
+        with self.lock:
+            previous, stored = self._entry(self.ratings, self.flushing[0], key) or (stored, stored)
+            self.ratings[key] = (rating, stored)
+        self.schedule()
+        return previous
+
+    def toggle_watchlist(self, user_id, movie_id, stored):
+        """Flip the watchlist state; stored is the state in the database. Return the new state"""
+        key = (user_id, movie_id)
+        with self.lock:
+            if key in self.watchlist:
+                current, flipped = self.watchlist[key]
+            else:
+                # A batch being flushed applies its own flip
+                current, flipped = self.flushing[1].get(key, (stored, False))[0], False
+            self.watchlist[key] = (not current, not flipped)
+        self.schedule()
+        return not current
+
+    def rating_totals(self, movie_id):
+        """A movie's (rating sum, rating count) as stored, plus what the buffered ratings add"""
+        with self.lock:
+            # flush() holds the lock from before its commit until the batch is
+            # retired, so the batch shows in the stored totals or in the buffer
+            rating_sum, rating_count = Movie.objects.filter(pk=movie_id).values_list(
+                'rating_sum', 'rating_count',
+            ).first() or (0, 0)
+            # A newer entry carries the stored rating of the one being flushed
+            entries = {**self.flushing[0], **self.ratings}
+        for (_, other_id), (rating, stored) in entries.items():
+            if other_id == movie_id:
+                rating_sum += rating - (stored or 0)
+                rating_count += stored is None
+        return rating_sum, rating_count
+
+    def schedule(self):
+        """Make sure this process has a flusher thread running"""
+        if not coalesce_window():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='write-buffer', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(coalesce_window() or 1)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered writes failed; retrying in the next window')
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write every buffered state in one transaction; return the number of rows written"""
+        with self.lock:
+            if not self.ratings and not self.watchlist:
+                return 0
+            ratings, watchlist = self.flushing = (self.ratings, self.watchlist)
+            self.ratings, self.watchlist = {}, {}
+        try:
+            written = self._write(ratings, watchlist)
+        except BaseException:
+            with self.lock:
+                # Keep the batch, under anything recorded since
+                self.ratings = {**ratings, **self.ratings}
+                for key, (state, flipped) in watchlist.items():
+                    if key in self.watchlist:
+                        state, newer_flipped = self.watchlist[key]
+                        flipped = flipped != newer_flipped
+                    self.watchlist[key] = (state, flipped)
+                self.flushing = ({}, {})
+            raise
+        # _write() returns holding the lock; see rating_totals()
+        try:
+            # The stored rating is now the flushed one
+            for key in self.ratings.keys() & ratings.keys():
+                self.ratings[key] = (self.ratings[key][0], ratings[key][0])
+            self.flushing = ({}, {})
+        finally:
+            self.lock.release()
+        return written
+
+    def _write(self, ratings, watchlist):
+        """Write the batch; return the number of rows written, holding the lock"""
+        ratings = {key: rating for key, (rating, stored) in ratings.items() if rating != stored}
+        flips = {key for key, (state, flipped) in watchlist.items() if flipped}
+        if not ratings and not flips:
+            self.lock.acquire()
+            return 0
+        try:
+            return self._write_changes(ratings, flips)
+        except IntegrityError:
+            # A user or movie deleted since, or a row another worker created
+            # meanwhile: drop the orphans and retry against what is stored now
+            keys = ratings.keys() | flips
+            users = set(User.objects.filter(pk__in={user_id for user_id, _ in keys}).values_list('pk', flat=True))
+            movies = set(Movie.objects.filter(pk__in={movie_id for _, movie_id in keys}).values_list('pk', flat=True))
+            ratings = {key: rating for key, rating in ratings.items() if key[0] in users and key[1] in movies}
+            flips = {key for key in flips if key[0] in users and key[1] in movies}
+            return self._write_changes(ratings, flips)
+
+    @contextmanager
+    def _committing(self):
+        """
+        A transaction that commits with the lock held, and keeps it held if the
+        commit succeeds: the batch is then retired before anyone can read the
+        stored totals that already include it
+        """
+        held = False
+        try:
+            with transaction.atomic():
+                yield
+                self.lock.acquire()
+                held = True
+        except BaseException:
+            if held:
+                self.lock.release()
+            raise
+
+    def _write_changes(self, ratings, flips):
+        """Save {key: rating} and flip the watchlist rows of the keys in flips, through the models so their signals run"""
+        with self._committing():
+            stored = stored_rows(Rating, ratings)
+            for (user_id, movie_id), value in ratings.items():
+                rating = stored.get((user_id, movie_id))
+                if rating is None:
+                    Rating.objects.create(user_id=user_id, movie_id=movie_id, rating=value)
+                elif rating.rating != value:
+                    rating.rating = value
+                    rating.save(update_fields=['rating', 'updated_at'])
+
+            stored = stored_rows(Watchlist, flips)
+            for user_id, movie_id in flips:
+                item = stored.get((user_id, movie_id))
+                if item is None:
+                    Watchlist.objects.create(user_id=user_id, movie_id=movie_id)
+                else:
+                    item.delete()
+        return len(ratings) + len(flips)
+
+
+def stored_rows(model, keys):
+    """{(user id, movie id): row} of the model's rows for the keys"""
+    if not keys:
+        return {}
+    rows = model.objects.filter(
+        user_id__in={user_id for user_id, _ in keys}, movie_id__in={movie_id for _, movie_id in keys},
+    ).order_by()
+    return {(row.user_id, row.movie_id): row for row in rows if (row.user_id, row.movie_id) in keys}
+
+
+write_buffer = WriteBuffer()
+
+
+def flush_on_shutdown(application):
+    """Wrap an ASGI application to answer lifespan events, flushing the buffer on shutdown"""
+    async def wrapper(scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await sync_to_async(write_buffer.flush)()
+                except Exception as exc:
+                    logger.exception('Flushing buffered writes on shutdown failed')
+                    await send({'type': 'lifespan.shutdown.failed', 'message': str(exc)})
+                else:
+                    await send({'type': 'lifespan.shutdown.complete'})
+                return
+    return wrapper
@@ -0,0 +1,302 @@
+"""
+Content-based movie similarity for titles nobody has rated yet.
+
+Every movie becomes a sparse TF-IDF vector over three kinds of term:
+
+- description words (lower-cased, stop words dropped), with sublinear
+  term frequency 1 + log(count)
+- one ``actor:<name>`` term per credited actor
+- one ``category:<id>`` term
+
+Description words found in more than MAX_DOCUMENT_FREQUENCY of the catalog
+are dropped as corpus-specific stop words. Rows are L2-normalized, so a sparse product of two rows is their cosine
+similarity. The top-K neighbours of a block of rows come from one sparse
+matrix product against the whole matrix, CHUNK_SIZE rows at a time, so
+memory is bounded by the block and never by movies x movies.
+
+The vectors, vocabulary and neighbour lists are saved in
+RECOMMENDER_MODEL_DIR/content.npz by ``manage.py build_content_similarity``.
+The lists are also copied into ContentSimilarity for the detail page.
+
+When a movie is created, deleted, or has its description, cast or category
+edited, the update_content_similarity task patches the saved model. It
+re-vectorizes that one movie against the current document frequencies,
+then recomputes the lists that can have changed: the movie's own list,
+the lists it was on, and the lists it now scores above the last entry of.
+Other rows keep the IDF weights from when they were computed until the
+next full build. Incremental updates assume a single task worker, since
+each one rewrites the model file.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from .models import ContentSimilarity, Movie, parse_actor_names
+from .recommendations import DEFAULT_NEIGHBOURS
+
+CHUNK_SIZE = 500
+# Description words in more than this share of the catalog say little about
+# a movie but make every block product nearly dense, so full builds drop them
+MAX_DOCUMENT_FREQUENCY = 0.05
+MIN_PRUNED_FREQUENCY = 100  # never drop a term found in fewer movies than this
+TOKEN = re.compile(r'[^\W\d_]{2,}')
+STOP_WORDS = frozenset('''
+    a about after again against all an and any are as at be because been before being between both but by can
+    did do does doing down during each few for from further had has have having he her here hers him his how if in
+    into is it its just me more most my no nor not now of off on once only or other our out over own same she
+    should so some such than that the their them then there these they this those through to too under until up
+    very was we were what when where which while who whom why will with you your
+'''.split())
+
+
+def content_path():
+    return os.path.join(str(settings.RECOMMENDER_MODEL_DIR), 'content.npz')
+
+
+def movie_terms(description, actors, category_id):
+    """{term: weight} for a movie's content fields"""
+    counts = Counter(word for word in TOKEN.findall((description or '').casefold()) if word not in STOP_WORDS)
+    terms = {word: 1 + math.log(count) for word, count in counts.items()}
+    for name in parse_actor_names(actors or ''):
+        terms[f'actor:{name.casefold()}'] = 1.0
+    if category_id is not None:
+        terms[f'category:{category_id}'] = 1.0
+    return terms
+
+
+def inverse_document_frequency(document_frequency, documents):
+    """Smoothed IDF, so a term in every document still counts a little"""
+    return np.log((1 + documents) / (1 + np.asarray(document_frequency, dtype=np.float64))) + 1
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sparse.csr_matrix(sparse.diags(inverse.astype(np.float32)) @ matrix, dtype=np.float32)
+
+
+def top_k_similar(matrix, rows, k=DEFAULT_NEIGHBOURS, chunk_size=CHUNK_SIZE):
+    """
+    Return (neighbours, scores) arrays of shape (len(rows), k).
+
+    Entry i lists the matrix rows most similar to rows[i], best first, with
+    slots without a positively similar row set to -1 / 0.0.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    neighbours = np.full((len(rows), k), -1, dtype=np.int64)
+    scores = np.zeros((len(rows), k), dtype=np.float32)
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        block = (matrix[chunk] @ transposed).tocsr()
+        for offset, row in enumerate(chunk):
+            lo, hi = block.indptr[offset], block.indptr[offset + 1]
+            columns, values = block.indices[lo:hi], block.data[lo:hi]
+            keep = (columns != row) & (values > 0)
+            columns, values = columns[keep], values[keep]
+            if not len(values):
+                continue
+            count = min(k, len(values))
+            top = np.argpartition(-values, count - 1)[:count]
+            top = top[np.lexsort((columns[top], -values[top]))]
+            neighbours[start + offset, :count] = columns[top]
+            scores[start + offset, :count] = values[top]
+    return neighbours, scores
+
+
+class ContentModel:
+    """Normalized TF-IDF rows for every movie plus their top-K neighbour lists (as movie ids)"""
+
+    def __init__(self, movie_ids, terms, matrix, neighbours, scores, stop_terms=()):
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        self.terms = list(terms)
+        self.stop_terms = set(stop_terms)
+        self.vocabulary = {term: column for column, term in enumerate(self.terms)}
+        self.matrix = matrix
+        self.neighbours = neighbours
+        self.scores = scores
+        self.rows = {int(movie_id): row for row, movie_id in enumerate(self.movie_ids)}
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    @classmethod
+    def build(cls, movies, k=DEFAULT_NEIGHBOURS, chunk_size=CHUNK_SIZE):
+        """Vectorize (pk, description, actors, category_id) rows and compute every neighbour list"""
+        movie_ids, vocabulary, indptr, indices, data = [], {}, [0], [], []
+        for pk, description, actors, category_id in movies:
+            for term, weight in movie_terms(description, actors, category_id).items():
+                indices.append(vocabulary.setdefault(term, len(vocabulary)))
+                data.append(weight)
+            movie_ids.append(pk)
+            indptr.append(len(indices))
+        counts = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+            shape=(len(movie_ids), len(vocabulary)),
+        )
+        frequency = np.bincount(counts.indices, minlength=len(vocabulary))
+        idf = inverse_document_frequency(frequency, len(movie_ids))
+        pruned = frequency > max(MAX_DOCUMENT_FREQUENCY * len(movie_ids), MIN_PRUNED_FREQUENCY)
+        pruned &= np.array([':' not in term for term in vocabulary], dtype=bool)
+        idf[pruned] = 0
+        matrix = counts @ sparse.diags(idf.astype(np.float32))
+        matrix.eliminate_zeros()
+        matrix = normalize_rows(matrix)
+
+        stop_terms = [term for term, column in vocabulary.items() if pruned[column]]
+        model = cls(movie_ids, vocabulary, matrix, None, None, stop_terms)
+        neighbours, model.scores = top_k_similar(matrix, np.arange(len(movie_ids)), k, chunk_size)
+        model.neighbours = np.where(neighbours >= 0, model.movie_ids[neighbours], -1)
+        return model
+
+    def vectorize(self, terms, documents, exclude_row=None):
+        """A normalized 1 x terms row for new content; unseen terms are added to the vocabulary"""
+        terms = {term: weight for term, weight in terms.items() if term not in self.stop_terms}
+        for term in terms:
+            if term not in self.vocabulary:
+                self.vocabulary[term] = len(self.terms)
+                self.terms.append(term)
+        if self.matrix.shape[1] < len(self.terms):
+            self.matrix.resize((self.matrix.shape[0], len(self.terms)))
+
+        frequency = np.bincount(self.matrix.indices, minlength=len(self.terms))
+        if exclude_row is not None:
+            lo, hi = self.matrix.indptr[exclude_row], self.matrix.indptr[exclude_row + 1]
+            frequency[self.matrix.indices[lo:hi]] -= 1
+        columns = np.array([self.vocabulary[term] for term in terms], dtype=np.int64)
+        weights = np.array(list(terms.values()), dtype=np.float64) * inverse_document_frequency(
+            frequency[columns] + 1, documents)
+        vector = sparse.csr_matrix((weights.astype(np.float32), (np.zeros(len(columns), dtype=np.int64), columns)),
+                                   shape=(1, len(self.terms)))
+        return normalize_rows(vector)
+
+    def update(self, movie_id, fields, chunk_size=CHUNK_SIZE):
+        """
+        Apply one movie's new (description, actors, category_id), or its
+        removal when fields is None; return the ids of the movies whose
+        neighbour lists were recomputed.
+        """
+        row = self.rows.get(movie_id)
+        listing = set(np.flatnonzero((self.neighbours == movie_id).any(axis=1)).tolist())
+
+        if fields is None:
+            if row is None:
+                return set()
+            keep = np.arange(len(self.movie_ids)) != row
+            self.matrix = self.matrix[keep]
+            self.movie_ids, self.neighbours, self.scores = (
+                self.movie_ids[keep], self.neighbours[keep], self.scores[keep])
+            self.rows = {int(pk): index for index, pk in enumerate(self.movie_ids)}
+            affected = {index - (index > row) for index in listing if index != row}
+        else:
+            documents = len(self.movie_ids) + (row is None)
+            vector = self.vectorize(movie_terms(*fields), documents, exclude_row=row)
+            if row is None:
+                row = len(self.movie_ids)
+                self.matrix = sparse.vstack([self.matrix, vector], format='csr')
+                self.movie_ids = np.append(self.movie_ids, movie_id)
+                self.neighbours = np.vstack([self.neighbours, np.full((1, self.k), -1, dtype=np.int64)])
+                self.scores = np.vstack([self.scores, np.zeros((1, self.k), dtype=np.float32)])
+                self.rows[movie_id] = row
+            else:
+                self.matrix = sparse.vstack([self.matrix[:row], vector, self.matrix[row + 1:]], format='csr')
+            similarity = np.asarray((self.matrix @ vector.T).todense()).ravel()
+            similarity[row] = 0
+            # Lists the movie now beats the last entry of (or that still have room)
+            entering = np.flatnonzero(similarity > self.scores[:, -1]).tolist()
+            affected = listing | set(entering) | {row}
+
+        affected = np.array(sorted(affected), dtype=np.int64)
+        if len(affected):
+            neighbours, self.scores[affected] = top_k_similar(self.matrix, affected, self.k, chunk_size)
+            self.neighbours[affected] = np.where(neighbours >= 0, self.movie_ids[neighbours], -1)
+        return {int(self.movie_ids[index]) for index in affected}
+
+    def pairs(self, movie_ids=None):
+        """(movie id, similar movie id, score) for the stored lists, optionally only some movies'"""
+        rows = range(len(self.movie_ids)) if movie_ids is None else (self.rows[pk] for pk in movie_ids)
+        for row in rows:
+            for other, score in zip(self.neighbours[row], self.scores[row]):
+                if other < 0:
+                    break
+                yield int(self.movie_ids[row]), int(other), float(score)
+
+    def save(self, path=None):
+        path = path or content_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.tmp.npz'
+        np.savez(
+            temporary, movie_ids=self.movie_ids, terms=np.array(self.terms, dtype=str),
+            data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+            shape=np.array(self.matrix.shape), neighbours=self.neighbours, scores=self.scores,
+            stop_terms=np.array(sorted(self.stop_terms), dtype=str),
+        )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path=None):
+        """The saved model, or None if none has been built"""
+        try:
+            saved = np.load(path or content_path())
+        except FileNotFoundError:
+            return None
+        with saved:
+            matrix = sparse.csr_matrix((saved['data'], saved['indices'], saved['indptr']),
+                                       shape=tuple(saved['shape']))
+            return cls(saved['movie_ids'], saved['terms'].tolist(), matrix, saved['neighbours'], saved['scores'],
+                       saved['stop_terms'].tolist())
+
+
+def movie_content(queryset=None):
+    queryset = Movie.objects.all() if queryset is None else queryset
+    return queryset.order_by('pk').values_list('pk', 'description', 'actors', 'category_id')
+
+
+def store_neighbours(model, movie_ids=None):
+    """Replace ContentSimilarity rows from the model, for every movie or only the given ones"""
+    existing = set(Movie.objects.values_list('pk', flat=True))
+    objects = [
+        ContentSimilarity(movie_id=movie_id, similar_movie_id=other, score=score)
+        for movie_id, other, score in model.pairs(movie_ids)
+        if movie_id in existing and other in existing
+    ]
+    with transaction.atomic():
+        stale = ContentSimilarity.objects.all()
+        if movie_ids is not None:
+            stale = stale.filter(movie_id__in=list(movie_ids))
+        stale.delete()
+        ContentSimilarity.objects.bulk_create(objects, batch_size=5000)
+    return len(objects)
+
+
+def rebuild_content_similarity(k=DEFAULT_NEIGHBOURS, chunk_size=CHUNK_SIZE):
+    """Vectorize the whole catalog, save the model and replace the stored table; return the model"""
+    model = ContentModel.build(movie_content().iterator(), k=k, chunk_size=chunk_size)
+    model.save()
+    store_neighbours(model)
+    return model
+
+
+def update_content_similarity(movie_id):
+    """Patch the saved model for one movie; return the ids whose lists changed (None without a model)"""
+    model = ContentModel.load()
+    if model is None:
+        return None
+    fields = Movie.objects.filter(pk=movie_id).values_list('description', 'actors', 'category_id').first()
+    changed = model.update(movie_id, fields)
+    model.save()
+    store_neighbours(model, changed)
+    return changed
+
+
+def schedule_content_update(movie_id):
+    """Queue a refresh of the content neighbours around a movie"""
+    from .tasks import enqueue
+    enqueue('update_content_similarity', {'movie_id': movie_id}, key=f'content:{movie_id}')
@@ -0,0 +1,213 @@
+"""
+Read-only store of the per-movie arrays used for recommendations.
+
+The store is a single binary file with a fixed layout:
+
+- a 64-byte header: magic, format version, movie count, factor count,
+  neighbours per movie and build time
+- movie ids (int64, ascending)
+- item factors (float32, movies x factors)
+- neighbour movie ids (int64, movies x neighbours, padded with -1)
+- neighbour scores (float32, movies x neighbours)
+- popularity (float32, movies)
+
+Every section starts on a 64-byte boundary, and its offset follows from the
+header alone. Readers mmap the file and wrap each section in a NumPy view.
+Nothing is parsed or copied, so opening the store is cheap, and every
+worker process on the machine shares the one copy in the page cache.
+
+A new store is written to a temporary file next to the live one and
+renamed over it. get_store() notices the new inode on its next call and
+maps the new file. Readers still holding arrays from the old mapping keep
+a valid view of the old file until they let go.
+"""
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+from django.conf import settings
+
+MAGIC = b'MOVIEEMB'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIId')
+ALIGNMENT = 64
+SECTIONS = (
+    # name, dtype, columns (None: one value per movie)
+    ('movie_ids', np.int64, None),
+    ('item_factors', np.float32, 'factors'),
+    ('neighbour_ids', np.int64, 'neighbours'),
+    ('neighbour_scores', np.float32, 'neighbours'),
+    ('popularity', np.float32, None),
+)
+
+
+def store_path():
+    return str(settings.EMBEDDING_STORE_PATH)
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def layout(movies, factors, neighbours):
+    """Return [(name, dtype, shape, offset)] for every section, and the total file size"""
+    sizes = {'factors': factors, 'neighbours': neighbours}
+    sections, offset = [], _aligned(HEADER.size)
+    for name, dtype, columns in SECTIONS:
+        shape = (movies,) if columns is None else (movies, sizes[columns])
+        sections.append((name, dtype, shape, offset))
+        offset = _aligned(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    return sections, offset
+
+
+def write_store(movie_ids, item_factors, neighbour_ids, neighbour_scores, popularity, path=None):
+    """Write a new store and atomically replace the current one; return the file size"""
+    path = path or store_path()
+    order = np.argsort(np.asarray(movie_ids, dtype=np.int64), kind='stable')
+    arrays = {
+        'movie_ids': np.asarray(movie_ids, dtype=np.int64)[order],
+        'item_factors': np.asarray(item_factors, dtype=np.float32)[order],
+        'neighbour_ids': np.asarray(neighbour_ids, dtype=np.int64)[order],
+        'neighbour_scores': np.asarray(neighbour_scores, dtype=np.float32)[order],
+        'popularity': np.asarray(popularity, dtype=np.float32)[order],
+    }
+    movies = len(order)
+    factors = arrays['item_factors'].shape[1] if arrays['item_factors'].ndim == 2 else 0
+    neighbours = arrays['neighbour_ids'].shape[1] if arrays['neighbour_ids'].ndim == 2 else 0
+    sections, size = layout(movies, factors, neighbours)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as stream:
+        stream.write(HEADER.pack(MAGIC, VERSION, movies, factors, neighbours, time.time()))
+        for name, dtype, shape, offset in sections:
+            stream.seek(offset)
+            stream.write(np.ascontiguousarray(arrays[name].reshape(shape), dtype=dtype).tobytes())
+        stream.truncate(size)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(temporary, path)
+    directory_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+    return size
+
+
+class EmbeddingStore:
+    """A memory-mapped store file; the section arrays are read-only views into the mapping"""
+
+    def __init__(self, path=None):
+        self.path = path or store_path()
+        with open(self.path, 'rb') as stream:
+            self.identity = os.fstat(stream.fileno()).st_ino
+            self.buffer = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, movies, factors, neighbours, self.built_at = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self.path} is not a version {VERSION} embedding store')
+        sections, size = layout(movies, factors, neighbours)
+        if len(self.buffer) < size:
+            raise ValueError(f'{self.path} is truncated: {len(self.buffer)} of {size} bytes')
+        self.size = size
+        for name, dtype, shape, offset in sections:
+            count = int(np.prod(shape))
+            setattr(self, name, np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset).reshape(shape))
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    @property
+    def factors(self):
+        return self.item_factors.shape[1]
+
+    def row(self, movie_id):
+        """Index of a movie in the arrays, or None"""
+        row = int(np.searchsorted(self.movie_ids, movie_id))
+        return row if row < len(self.movie_ids) and self.movie_ids[row] == movie_id else None
+
+    def vector(self, movie_id):
+        row = self.row(movie_id)
+        return None if row is None else self.item_factors[row]
+
+    def neighbours(self, movie_id, n=None):
+        """[(movie id, score)] of a movie's stored neighbours, best first"""
+        row = self.row(movie_id)
+        if row is None:
+            return []
+        ids, scores = self.neighbour_ids[row, :n], self.neighbour_scores[row, :n]
+        return [(int(other), float(score)) for other, score in zip(ids, scores) if other >= 0]
+
+    def most_popular(self, n=10, exclude=()):
+        """Movie ids with the highest popularity, best first"""
+        scores = self.popularity.copy()
+        for movie_id in exclude:
+            row = self.row(movie_id)
+            if row is not None:
+                scores[row] = -np.inf
+        n = min(n, len(scores))
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [int(self.movie_ids[row]) for row in top if np.isfinite(scores[row])]
+
+    def touch(self):
+        """Read every page of the mapping (for warm-up and measurement); return the checksum"""
+        return int(np.frombuffer(self.buffer, dtype=np.uint8)[::mmap.PAGESIZE].sum())
+
+
+_opened = {}
+
+
+def get_store():
+    """The current store, remapped after it has been replaced; None if it hasn't been built"""
+    path = store_path()
+    try:
+        identity = os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+    store = _opened.get(path)
+    if store is None or store.identity != identity:
+        # The old mapping is released once the last array viewing it is gone
+        store = _opened[path] = EmbeddingStore(path)
+    return store
+
+
+def build_store(path=None, neighbours=None):
+    """Assemble the store from the trained factor model, MovieSimilarity and rating totals"""
+    from .factorization import get_model
+    from .feed import popularity
+    from .models import Movie, MovieSimilarity
+    from .recommendations import DEFAULT_NEIGHBOURS
+
+    neighbours = DEFAULT_NEIGHBOURS if neighbours is None else neighbours
+    rows = np.array(list(Movie.objects.order_by('pk').values_list('pk', 'rating_sum', 'rating_count')),
+                    dtype=np.float64).reshape(-1, 3)
+    movie_ids = rows[:, 0].astype(np.int64)
+    index = {int(movie_id): row for row, movie_id in enumerate(movie_ids)}
+
+    model = get_model()
+    item_factors = np.zeros((len(movie_ids), model.factors if model else 0), dtype=np.float32)
+    if model is not None:
+        positions = np.searchsorted(movie_ids, model.movie_ids)
+        inside = positions < len(movie_ids)
+        inside[inside] = movie_ids[positions[inside]] == model.movie_ids[inside]
+        item_factors[positions[inside]] = model.item_factors[inside]
+
+    neighbour_ids = np.full((len(movie_ids), neighbours), -1, dtype=np.int64)
+    neighbour_scores = np.zeros((len(movie_ids), neighbours), dtype=np.float32)
+    filled = np.zeros(len(movie_ids), dtype=np.int64)
+    similarities = MovieSimilarity.objects.order_by('movie_id', '-score', 'similar_movie_id')
+    for movie_id, similar_id, score in similarities.values_list('movie_id', 'similar_movie_id', 'score').iterator():
+        row = index.get(movie_id)
+        if row is None or filled[row] >= neighbours:
+            continue
+        neighbour_ids[row, filled[row]], neighbour_scores[row, filled[row]] = similar_id, score
+        filled[row] += 1
+
+    return write_store(movie_ids, item_factors, neighbour_ids, neighbour_scores,
+                       popularity(rows[:, 1], rows[:, 2]), path=path)
@@ -0,0 +1,272 @@
+"""
+Latent-factor recommender trained offline with alternating least squares.
+
+Every user and movie gets a vector of FACTORS numbers, fitted so that their
+dot product predicts the user's rating. Training alternates between solving
+for all user vectors with the movie vectors fixed and the reverse. Each
+half-step builds one small k x k least-squares system per user (or movie)
+and NumPy solves them a few thousand at a time, so memory stays bounded.
+
+Two objectives are supported:
+
+- explicit: fit the observed 1-5 star ratings (minus their global mean),
+  regularized in proportion to how many ratings each row has (ALS-WR)
+- implicit: treat every rating as a positive interaction with confidence
+  1 + alpha * rating and every missing pair as a weak zero (Hu, Koren and
+  Volinsky), which ranks better when ratings are sparse
+
+Trained models are saved as .npy files and loaded memory-mapped, so scoring
+a user is one matrix-vector product over the movie factors followed by an
+argpartition for the top N. Each save writes a new factors-<version>
+directory and then swaps the CURRENT pointer file to it, so a loader always
+opens the arrays and metadata of one model, never a mix of two.
+"""
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+FACTORS = 32
+REGULARIZATION = 0.05
+ITERATIONS = 10
+ALPHA = 10.0
+CHUNK_ROWS = 4096  # systems per batched solve, 32 MB of k x k matrices at 32 factors
+ARTIFACTS = ('user_ids', 'movie_ids', 'user_factors', 'item_factors')
+VERSION_PREFIX = 'factors-'
+KEEP_VERSIONS = 2  # the current model and the one before it, which a loader may still be opening
+
+
+def model_dir():
+    return str(settings.RECOMMENDER_MODEL_DIR)
+
+
+def current_version(directory=None):
+    """Name of the directory the CURRENT pointer names, or None before the first save"""
+    try:
+        with open(os.path.join(directory or model_dir(), 'CURRENT')) as stream:
+            return stream.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def index_ratings(user_ids, movie_ids, ratings):
+    """Return (users x movies CSR matrix, user ids of the rows, movie ids of the columns)"""
+    users, user_index = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+    movies, movie_index = np.unique(np.asarray(movie_ids, dtype=np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.asarray(ratings, dtype=np.float32), (user_index, movie_index)),
+        shape=(len(users), len(movies)),
+    )
+    return matrix, users, movies
+
+
+def solve_factors(matrix, fixed, regularization, implicit=False, alpha=ALPHA, chunk_rows=CHUNK_ROWS):
+    """One ALS half-step: the least-squares factors of every row of matrix given the column factors"""
+    n_rows, k = matrix.shape[0], fixed.shape[1]
+    fixed = fixed.astype(np.float64)
+    solved = np.zeros((n_rows, k), dtype=np.float32)
+    identity = np.eye(k)
+    gram = fixed.T @ fixed if implicit else None
+    indptr, indices, data = matrix.indptr, matrix.indices, matrix.data.astype(np.float64)
+
+    for start in range(0, n_rows, chunk_rows):
+        rows = [row for row in range(start, min(start + chunk_rows, n_rows)) if indptr[row + 1] > indptr[row]]
+        if not rows:
+            continue
+        lhs = np.empty((len(rows), k, k))
+        rhs = np.empty((len(rows), k))
+        for i, row in enumerate(rows):
+            lo, hi = indptr[row], indptr[row + 1]
+            vectors, values = fixed[indices[lo:hi]], data[lo:hi]
+            if implicit:
+                confidence = alpha * values  # c - 1; unobserved pairs are covered by the Gram matrix
+                lhs[i] = gram + (vectors.T * confidence) @ vectors + regularization * identity
+                rhs[i] = (1 + confidence) @ vectors
+            else:
+                lhs[i] = vectors.T @ vectors + regularization * (hi - lo) * identity
+                rhs[i] = values @ vectors
+        solved[rows] = np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0]
+    return solved
+
+
+class FactorModel:
+    """Trained user and movie factors with the ids they belong to"""
+
+    def __init__(self, user_ids, movie_ids, user_factors, item_factors, global_mean=0.0, implicit=False):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.global_mean = global_mean
+        self.implicit = implicit
+
+    @property
+    def factors(self):
+        return self.item_factors.shape[1]
+
+    def user_row(self, user_id):
+        row = int(np.searchsorted(self.user_ids, user_id))
+        return row if row < len(self.user_ids) and self.user_ids[row] == user_id else None
+
+    def predict(self, user_ids, movie_ids):
+        """Predicted ratings for (user, movie) pairs; NaN where either side wasn't in the training data"""
+        user_ids, movie_ids = np.asarray(user_ids), np.asarray(movie_ids)
+        users = np.clip(np.searchsorted(self.user_ids, user_ids), 0, len(self.user_ids) - 1)
+        movies = np.clip(np.searchsorted(self.movie_ids, movie_ids), 0, len(self.movie_ids) - 1)
+        known = (self.user_ids[users] == user_ids) & (self.movie_ids[movies] == movie_ids)
+        scores = np.einsum('ij,ij->i', self.user_factors[users], self.item_factors[movies]) + self.global_mean
+        return np.where(known, scores, np.nan)
+
+    def recommend(self, user_id, n=10, exclude=()):
+        """Return [(movie id, score)] of the user's top n movies, best first, skipping excluded ids"""
+        row = self.user_row(user_id)
+        if row is None or n <= 0:
+            return []
+        scores = self.item_factors @ self.user_factors[row] + self.global_mean
+        exclude = np.fromiter(exclude, dtype=np.int64)
+        if len(exclude):
+            positions = np.searchsorted(self.movie_ids, exclude)
+            inside = positions < len(self.movie_ids)
+            positions, exclude = positions[inside], exclude[inside]
+            scores[positions[self.movie_ids[positions] == exclude]] = -np.inf
+        n = min(n, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(self.movie_ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def save(self, directory=None):
+        """
+        Write the model to a new version directory and point CURRENT at it.
+
+        Older versions beyond KEEP_VERSIONS are removed; processes that have
+        them memory-mapped keep reading them until they reload.
+        """
+        directory = directory or model_dir()
+        version = f'{VERSION_PREFIX}{time.time_ns()}-{os.getpid()}'
+        path = os.path.join(directory, version)
+        os.makedirs(path)
+        for name in ARTIFACTS:
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        meta = {'global_mean': float(self.global_mean), 'implicit': self.implicit, 'factors': self.factors,
+                'trained_at': time.time()}
+        with open(os.path.join(path, 'meta.json'), 'w') as stream:
+            json.dump(meta, stream)
+        pointer = os.path.join(directory, f'CURRENT.{os.getpid()}.tmp')
+        with open(pointer, 'w') as stream:
+            stream.write(version)
+        os.replace(pointer, os.path.join(directory, 'CURRENT'))
+
+        versions = sorted(name for name in os.listdir(directory) if name.startswith(VERSION_PREFIX))
+        for name in versions[:-KEEP_VERSIONS]:
+            if name != version:
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        return version
+
+    @classmethod
+    def load(cls, directory=None, version=None):
+        """Open a saved model (the current one by default) with its arrays memory-mapped read-only"""
+        directory = directory or model_dir()
+        path = os.path.join(directory, version or current_version(directory) or '')
+        with open(os.path.join(path, 'meta.json')) as stream:
+            meta = json.load(stream)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in ARTIFACTS}
+        return cls(global_mean=meta['global_mean'], implicit=meta['implicit'], **arrays)
+
+
+def train(user_ids, movie_ids, ratings, factors=FACTORS, regularization=REGULARIZATION, iterations=ITERATIONS,
+          implicit=False, alpha=ALPHA, seed=0, on_epoch=None):
+    """
+    Fit a FactorModel to rating triples.
+
+    on_epoch(epoch, seconds) is called after every iteration.
+    """
+    matrix, users, movies = index_ratings(user_ids, movie_ids, ratings)
+    global_mean = 0.0 if implicit or not matrix.nnz else float(matrix.data.mean())
+    if not implicit:
+        matrix.data -= global_mean
+    by_movie = matrix.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 0.1, (len(users), factors)).astype(np.float32)
+    item_factors = rng.normal(0, 0.1, (len(movies), factors)).astype(np.float32)
+    for epoch in range(iterations):
+        started = time.perf_counter()
+        user_factors = solve_factors(matrix, item_factors, regularization, implicit, alpha)
+        item_factors = solve_factors(by_movie, user_factors, regularization, implicit, alpha)
+        if on_epoch:
+            on_epoch(epoch + 1, time.perf_counter() - started)
+    return FactorModel(users, movies, user_factors, item_factors, global_mean, implicit)
+
+
+def split_ratings(user_ids, movie_ids, ratings, test_fraction=0.2, seed=0):
+    """Randomly hold out test_fraction of the ratings; return (train, test) triples of arrays"""
+    user_ids, movie_ids, ratings = (np.asarray(values) for values in (user_ids, movie_ids, ratings))
+    test = np.random.default_rng(seed).random(len(ratings)) < test_fraction
+    return (
+        (user_ids[~test], movie_ids[~test], ratings[~test]),
+        (user_ids[test], movie_ids[test], ratings[test]),
+    )
+
+
+def evaluate(model, train, test, k=10, relevant_rating=4):
+    """
+    Score a model on held-out ratings.
+
+    Returns RMSE over test pairs the model can predict (explicit models
+    only) and precision@k: the share of each test user's top k
+    recommendations, excluding movies they rated in training, that they
+    rated relevant_rating or higher in the test set.
+    """
+    test_users, test_movies, test_ratings = (np.asarray(values) for values in test)
+    results = {'test_ratings': len(test_ratings), 'rmse': None}
+    if not model.implicit:
+        predicted = np.clip(model.predict(test_users, test_movies), 1, 5)
+        known = ~np.isnan(predicted)
+        if known.any():
+            results['rmse'] = float(np.sqrt(np.mean((predicted[known] - test_ratings[known]) ** 2)))
+        results['coverage'] = float(known.mean()) if len(known) else 0.0
+
+    seen = {}
+    for user_id, movie_id in zip(*(np.asarray(values) for values in train[:2])):
+        seen.setdefault(int(user_id), set()).add(int(movie_id))
+    relevant = {}
+    for user_id, movie_id, rating in zip(test_users, test_movies, test_ratings):
+        if rating >= relevant_rating:
+            relevant.setdefault(int(user_id), set()).add(int(movie_id))
+
+    precisions = []
+    for user_id, liked in relevant.items():
+        recommended = model.recommend(user_id, k, exclude=seen.get(user_id, ()))
+        if recommended:
+            precisions.append(len(liked.intersection(movie_id for movie_id, _ in recommended)) / k)
+    results['precision_at_k'] = float(np.mean(precisions)) if precisions else None
+    results['evaluated_users'] = len(precisions)
+    return results
+
+
+_loaded = {}
+
+
+def get_model():
+    """The saved model, reopened when a newer one has been trained; None if none exists yet"""
+    version = current_version()
+    if version is None:
+        return None
+    if _loaded.get('version') != version:
+        _loaded.update(version=version, model=FactorModel.load(version=version))
+    return _loaded['model']
+
+
+def recommend_for_user(user, n=10):
+    """Top n (movie id, predicted score) for a user from the saved model, excluding movies they rated"""
+    from .models import Rating
+
+    model = get_model()
+    if model is None:
+        return []
+    rated = Rating.objects.filter(user=user).values_list('movie_id', flat=True)
+    return model.recommend(user.pk, n, exclude=set(rated))
@@ -0,0 +1,175 @@
+"""
+Personalized "For You" feed.
+
+Feeds are scored offline by the build_feed task and stored as FeedItem rows,
+so a page reads one with a single indexed query. The task is queued when a
+user rates a movie, changes their watchlist or edits their favorite genres;
+``manage.py build_feeds`` rescores every feed after the catalog or the
+similarity table changes.
+
+A candidate movie's score blends three signals:
+
+- collaborative: the MovieSimilarity neighbours of the user's rated and
+  watchlisted movies, weighted by how much the user liked each one. Ratings
+  are centred on 3 stars, so disliked movies count against their
+  neighbours, and a watchlist entry counts like a 4-star rating.
+- genre affinity: the user's favorite_genres plus the categories of the
+  movies they liked.
+- popularity: the Bayesian average rating, which carries the whole feed for
+  a user with no history yet.
+
+Movies the user has rated or put on their watchlist are left out, both when
+the feed is built and when it is read, so a movie disappears from the feed
+as soon as it is rated rather than when the rebuild runs.
+"""
+import heapq
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .caching import all_movies_scope, get_version, source_key, source_timeout
+from .models import Category, FeedItem, Movie, MovieSimilarity, Rating, UserProfile, Watchlist
+
+FEED_SIZE = 24
+REFRESH_DELAY = 5  # seconds, so a burst of ratings is scored once
+
+COLLABORATIVE_WEIGHT = 1.0
+GENRE_WEIGHT = 0.6
+POPULARITY_WEIGHT = 0.3
+WATCHLIST_SEED = 0.5  # same weight as a 4-star rating
+FAVORITE_GENRE_AFFINITY = 1.0
+
+PRIOR_MEAN = 3.0
+PRIOR_COUNT = 5
+POPULAR_CANDIDATES = 100
+CATEGORY_CANDIDATES = 50
+AFFINITY_CATEGORIES = 3
+NEIGHBOUR_CANDIDATES = 500
+POPULAR_TIMEOUT = 10 * 60
+
+
+def bayesian_average():
+    """Average rating shrunk towards PRIOR_MEAN, so a single 5-star rating doesn't top the charts"""
+    return (F('rating_sum') + PRIOR_MEAN * PRIOR_COUNT) / (F('rating_count') + PRIOR_COUNT)
+
+
+def popularity(rating_sum, rating_count):
+    """bayesian_average() computed in Python and scaled to 0-1"""
+    return ((rating_sum + PRIOR_MEAN * PRIOR_COUNT) / (rating_count + PRIOR_COUNT) - 1) / 4
+
+
+def popular_movies():
+    return Movie.objects.annotate(popularity=bayesian_average()).order_by('-popularity', '-rating_count', 'pk')
+
+
+def compute_feed(user_id, size=FEED_SIZE):
+    """Score candidate movies for a user; return [(movie id, score)] best first"""
+    ratings = list(Rating.objects.filter(user_id=user_id).values_list('movie_id', 'rating', 'movie__category_id'))
+    watchlist = list(Watchlist.objects.filter(user_id=user_id).values_list('movie_id', 'movie__category_id'))
+    favorite_genres = UserProfile.objects.filter(user_id=user_id).values_list('favorite_genres', flat=True).first()
+
+    seeds, seed_categories = {}, {}
+    for movie_id, rating, category_id in ratings:
+        seeds[movie_id], seed_categories[movie_id] = (rating - 3) / 2, category_id
+    for movie_id, category_id in watchlist:
+        seeds.setdefault(movie_id, WATCHLIST_SEED)
+        seed_categories[movie_id] = category_id
+
+    affinity = defaultdict(float)
+    favorites = {genre.strip().casefold() for genre in (favorite_genres or '').split(',') if genre.strip()}
+    if favorites:
+        for pk, name in Category.objects.values_list('pk', 'name'):
+            if name.casefold() in favorites:
+                affinity[pk] += FAVORITE_GENRE_AFFINITY
+    for movie_id, weight in seeds.items():
+        if weight > 0:
+            affinity[seed_categories[movie_id]] += weight
+    top_affinity = max(affinity.values(), default=0)
+    affinity = {category_id: value / top_affinity for category_id, value in affinity.items()}
+
+    collaborative = defaultdict(float)
+    if seeds:
+        neighbours = MovieSimilarity.objects.filter(
+            Q(movie_id__in=Rating.objects.filter(user_id=user_id).values('movie_id'))
+            | Q(movie_id__in=Watchlist.objects.filter(user_id=user_id).values('movie_id'))
+        )
+        for movie_id, similar_id, score in neighbours.values_list('movie_id', 'similar_movie_id', 'score'):
+            collaborative[similar_id] += seeds[movie_id] * score
+    top_collaborative = max(collaborative.values(), default=0)
+
+    # Candidates: the strongest neighbours, the most popular movies overall,
+    # and the most popular ones in the user's favourite categories
+    columns = ('pk', 'category_id', 'rating_sum', 'rating_count')
+    candidates = {}
+    liked = heapq.nlargest(NEIGHBOUR_CANDIDATES, (pk for pk, value in collaborative.items() if value > 0),
+                           key=collaborative.get)
+    if liked:
+        candidates.update((row[0], row[1:]) for row in Movie.objects.filter(pk__in=liked).values_list(*columns))
+    candidates.update((row[0], row[1:]) for row in popular_movies().values_list(*columns)[:POPULAR_CANDIDATES])
+    for category_id in heapq.nlargest(AFFINITY_CATEGORIES, affinity, key=affinity.get):
+        in_category = popular_movies().filter(category_id=category_id).values_list(*columns)
+        candidates.update((row[0], row[1:]) for row in in_category[:CATEGORY_CANDIDATES])
+
+    scored = []
+    for pk, (category_id, rating_sum, rating_count) in candidates.items():
+        if pk in seeds:
+            continue
+        score = POPULARITY_WEIGHT * popularity(rating_sum, rating_count) + GENRE_WEIGHT * affinity.get(category_id, 0)
+        if top_collaborative > 0:
+            score += COLLABORATIVE_WEIGHT * collaborative.get(pk, 0) / top_collaborative
+        scored.append((pk, score))
+    return heapq.nlargest(size, scored, key=lambda item: (item[1], -item[0]))
+
+
+def build_feed(user_id):
+    """Recompute and store a user's feed; return the number of movies in it"""
+    if not User.objects.filter(pk=user_id).exists():
+        return 0
+    items = compute_feed(user_id)
+    with transaction.atomic():
+        FeedItem.objects.filter(user_id=user_id).delete()
+        FeedItem.objects.bulk_create([FeedItem(user_id=user_id, movie_id=pk, score=score) for pk, score in items])
+        UserProfile.objects.filter(user_id=user_id).update(feed_built_at=timezone.now())
+    return len(items)
+
+
+def schedule_feed(user_id):
+    """Queue a rebuild of the user's feed"""
+    from .tasks import enqueue
+    enqueue('build_feed', {'user_id': user_id}, key=f'feed:{user_id}', delay=REFRESH_DELAY)
+
+
+def unseen(movies, user):
+    return movies.exclude(user_ratings__user=user).exclude(in_watchlists__user=user)
+
+
+def popular_for(user, limit):
+    """The most popular movies the user hasn't rated or saved, from a list cached for everyone"""
+    key = source_key(f'popular-movies:{get_version(all_movies_scope())}')
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(popular_movies().values_list('pk', flat=True)[:FEED_SIZE * 2])
+        cache.set(key, ids, source_timeout(POPULAR_TIMEOUT))
+    movies = unseen(Movie.objects.select_related('category'), user).in_bulk(ids)
+    return [movies[pk] for pk in ids if pk in movies][:limit]
+
+
+def feed_for(user, limit=FEED_SIZE):
+    """
+    The user's feed as Movie objects, best first.
+
+    While it is empty this returns the popular movies instead. Only a user
+    whose feed has never been built gets a build queued; a feed that is
+    empty after a build is rebuilt when the user rates or saves a movie.
+    """
+    feed = unseen(Movie.objects.filter(feed_items__user=user), user)
+    movies = list(feed.select_related('category').order_by('-feed_items__score', 'pk')[:limit])
+    if movies:
+        return movies
+    if not UserProfile.objects.filter(user=user, feed_built_at__isnull=False).exists():
+        schedule_feed(user.pk)
+    return popular_for(user, limit)
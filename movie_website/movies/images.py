@@ -0,0 +1,171 @@
+"""
+Resized renditions of uploaded posters and profile pictures.
+
+Originals are kept as uploaded; renditions are written next to them under
+renditions/, addressed by a digest of the original's bytes, so re-uploading
+the same image (or sharing it between movies) reuses existing files. Every
+source image gets one file per width and format, and each model stores a
+small manifest in its <field>_renditions JSON column recording which source
+the files belong to. The {% picture %} tag turns that manifest into a
+<picture> element with srcset; a missing or stale manifest makes it fall back
+to the original and queue generation.
+
+Decoding, validation and encoding are CPU bound, so they run as a
+generate_renditions task on the background queue and uploads return as soon
+as the original is saved. A file Pillow cannot decode is removed from the
+row there, which the templates then show as a missing image.
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+RENDITION_ROOT = 'renditions'
+
+# Widths to emit for each display size, and the sizes attribute that goes with them
+RENDITIONS = {
+    'thumb': ((80, 160), '80px'),
+    'avatar': ((160, 300), '150px'),
+    'card': ((300, 600), '(max-width: 576px) 100vw, 300px'),
+    'detail': ((500, 1000), '(max-width: 768px) 100vw, 500px'),
+}
+WIDTHS = sorted({width for widths, _ in RENDITIONS.values() for width in widths})
+
+# Most preferred first; JPEG is the <img> fallback every browser understands
+FORMATS = tuple(
+    fmt for fmt, supported in (('avif', features.check('avif')), ('webp', features.check('webp')), ('jpeg', True))
+    if supported
+)
+SAVE_OPTIONS = {
+    'avif': {'quality': 60, 'speed': 8},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+# Images this process has already queued from a page view
+_requested = set()
+
+
+def manifest_field(field_name):
+    return f'{field_name}_renditions'
+
+
+def rendition_path(digest, width, fmt):
+    return f'{RENDITION_ROOT}/{digest[:2]}/{digest}-{width}w.{EXTENSIONS[fmt]}'
+
+
+def get_manifest(fieldfile):
+    """The stored manifest if it belongs to the file currently in the field, else None"""
+    if not fieldfile:
+        return None
+    manifest = getattr(fieldfile.instance, manifest_field(fieldfile.field.name), None) or {}
+    if manifest.get('source') != fieldfile.name:
+        return None
+    return manifest
+
+
+def srcset(manifest, rendition, fmt):
+    widths, _ = RENDITIONS[rendition]
+    available = [width for width in manifest['widths'] if width in widths] or manifest['widths'][-1:]
+    return ', '.join(
+        f"{default_storage.url(rendition_path(manifest['digest'], width, fmt))} {width}w" for width in available
+    )
+
+
+def resized(image, width):
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def encode(image, fmt):
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def generate_renditions(fieldfile):
+    """Write any missing renditions of the file and return its manifest"""
+    with fieldfile.open('rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+
+    with Image.open(BytesIO(data)) as original:
+        # JPEG can decode straight at a reduced scale, much cheaper for multi-megapixel posters
+        original.draft('RGB', (WIDTHS[-1], WIDTHS[-1]))
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    # Never upscale; a small source gets a single rendition at its own width
+    widths = [width for width in WIDTHS if width <= image.width] or [image.width]
+    for width in widths:
+        scaled = resized(image, width) if width < image.width else image
+        for fmt in FORMATS:
+            path = rendition_path(digest, width, fmt)
+            if not default_storage.exists(path):
+                default_storage.save(path, ContentFile(encode(scaled, fmt)))
+
+    return {'source': fieldfile.name, 'digest': digest, 'widths': widths, 'formats': list(FORMATS)}
+
+
+def process_image(model_label, pk, field_name):
+    """Generate renditions for one stored image and save the manifest on its row"""
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile or get_manifest(fieldfile) is not None:
+        return None
+
+    try:
+        manifest = generate_renditions(fieldfile)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as exc:
+        # Not an image Pillow can decode; retrying won't change that
+        logger.warning('Discarding undecodable image %s on %s pk=%s: %s', fieldfile.name, model_label, pk, exc)
+        if model.objects.filter(pk=pk, **{field_name: fieldfile.name}).update(**{field_name: ''}):
+            fieldfile.storage.delete(fieldfile.name)
+        return None
+
+    # Only record it if the image wasn't replaced while we were encoding
+    updated = model.objects.filter(pk=pk, **{field_name: manifest['source']}).update(
+        **{manifest_field(field_name): manifest}
+    )
+    if updated and hasattr(instance, 'renditions_updated'):
+        instance.renditions_updated()
+    return manifest
+
+
+def schedule_renditions(fieldfile, lazy=False):
+    """
+    Queue rendition generation for a file whose manifest is missing or stale.
+
+    Page views pass lazy=True, which queues each image at most once per
+    process instead of writing to the queue on every render.
+    """
+    from .tasks import enqueue
+
+    if not fieldfile or get_manifest(fieldfile) is not None:
+        return
+    instance = fieldfile.instance
+    label, field_name = instance._meta.label, fieldfile.field.name
+    if lazy:
+        marker = (label, instance.pk, field_name, fieldfile.name)
+        if marker in _requested:
+            return
+        _requested.add(marker)
+    enqueue(
+        'generate_renditions', {'model': label, 'pk': instance.pk, 'field': field_name},
+        key=f'renditions:{label}:{instance.pk}:{field_name}',
+    )
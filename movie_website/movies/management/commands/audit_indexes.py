@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.query_plans import AuditError, audit
+
+
+class Command(BaseCommand):
+    help = 'Render the hot pages, EXPLAIN QUERY PLAN every SELECT they run and flag full table scans and temporary sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true', help='Print every query and plan, not just the flagged ones')
+        parser.add_argument('--sql', action='store_true', help='Print the SQL of the printed queries')
+
+    def handle(self, *args, **options):
+        try:
+            results = audit()
+        except AuditError as exc:
+            raise CommandError(exc)
+        flagged = 0
+        for page, queries in results:
+            failing = [query for query in queries if query[2] and not query[3]]
+            self.stdout.write(f"{page:30} {len(queries):3} queries  {'FLAGGED' if failing else 'ok'}")
+            for sql, plan, problems, accepted in queries:
+                if not (problems or options['plans']):
+                    continue
+                self.stdout.write(f"  {'accepted: ' + accepted if problems and accepted else sql[:100]}")
+                if options['sql']:
+                    self.stdout.write(f'    {sql}')
+                for step in plan:
+                    if options['plans'] or step in problems:
+                        self.stdout.write(f"    {'!' if step in problems else ' '} {step}")
+            flagged += len(failing)
+        if flagged:
+            raise CommandError(f'{flagged} queries scan a table or sort in a temporary B-tree')
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.ann import PROBES, TABLES, LSHIndex
+from movies.embeddings import get_store
+from movies.factorization import FACTORS
+
+
+def synthetic_vectors(movies, factors, clusters, seed=0):
+    """Vectors grouped around random centres, the way trained item factors cluster by taste"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, factors))
+    return (centres[rng.integers(0, clusters, movies)] + 0.6 * rng.normal(size=(movies, factors))).astype(np.float32)
+
+
+def percentile_us(samples, q):
+    return np.percentile(samples, q) * 1e6
+
+
+class Command(BaseCommand):
+    help = 'Report recall@K and query latency of the LSH index against exact search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=100_000)
+        parser.add_argument('--factors', type=int, default=FACTORS)
+        parser.add_argument('--clusters', type=int, default=2000)
+        parser.add_argument('--store', action='store_true',
+                            help='Index the item factors of the embedding store instead of synthetic vectors')
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--tables', type=int, default=TABLES)
+        parser.add_argument('--bits', type=int, default=None)
+        parser.add_argument('--probes', type=int, default=PROBES)
+
+    def handle(self, *args, **options):
+        if options['store']:
+            store = get_store()
+            if store is None or not store.factors:
+                raise CommandError('The embedding store has no item factors; run train_recommender and '
+                                   'build_embedding_store first')
+            ids, vectors = store.movie_ids, store.item_factors
+        else:
+            ids = np.arange(1, options['movies'] + 1)
+            vectors = synthetic_vectors(options['movies'], options['factors'], options['clusters'])
+
+        started = time.perf_counter()
+        index = LSHIndex(ids, vectors, tables=options['tables'], bits=options['bits'], probes=options['probes'])
+        built = time.perf_counter() - started
+        if not len(index):
+            raise CommandError('No non-zero vectors to index')
+
+        k = options['k']
+        queries = np.random.default_rng(1).choice(index.ids, min(options['queries'], len(index)), replace=False)
+        approximate, exact, recalls, candidates = [], [], [], []
+        for item_id in queries:
+            started = time.perf_counter()
+            found = index.query_id(item_id, k)
+            approximate.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            truth = index.query_id(item_id, k, exact=True)
+            exact.append(time.perf_counter() - started)
+            truth = {other for other, _ in truth}
+            recalls.append(len(truth.intersection(other for other, _ in found)) / len(truth))
+            candidates.append(len(index.candidates(index.vectors[index.row(item_id)])))
+
+        self.stdout.write(
+            f'{len(index)} vectors x {index.vectors.shape[1]}, {options["tables"]} tables x {index.bits} bits, '
+            f'{index.probes} probes; built in {built:.2f}s'
+        )
+        self.stdout.write(f'recall@{k}: {np.mean(recalls):.3f}  (mean candidates scored: {np.mean(candidates):.0f})')
+        self.stdout.write(f"{'':>8} {'p50 us':>8} {'p95 us':>8}")
+        for label, samples in (('lsh', approximate), ('exact', exact)):
+            self.stdout.write(f'{label:>8} {percentile_us(samples, 50):>8.0f} {percentile_us(samples, 95):>8.0f}')
@@ -0,0 +1,39 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from movies.factorization import FACTORS, index_ratings, solve_factors, REGULARIZATION
+from movies.management.commands.benchmark_similar_movies import synthetic_ratings
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ALS training time per epoch against the number of ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100000,300000,1000000',
+                            help='Comma-separated rating counts to time')
+        parser.add_argument('--movies', type=int, default=10_000)
+        parser.add_argument('--users-per-rating', type=float, default=0.1,
+                            help='Users generated per rating (MovieLens has roughly 0.01-0.1)')
+        parser.add_argument('--factors', type=int, default=FACTORS)
+        parser.add_argument('--epochs', type=int, default=2)
+        parser.add_argument('--implicit', action='store_true')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'ratings':>10} {'users':>8} {'movies':>7} {'s/epoch':>8} {'ratings/s':>10}")
+        for size in (int(value) for value in options['sizes'].split(',')):
+            users = max(1, int(size * options['users_per_rating']))
+            user_ids, movie_ids, ratings = synthetic_ratings(users, options['movies'], size)
+            matrix, users, movies = index_ratings(user_ids, movie_ids, ratings)
+            by_movie = matrix.T.tocsr()
+            item_factors = np.random.default_rng(0).normal(0, 0.1, (len(movies), options['factors'])).astype(np.float32)
+
+            started = time.perf_counter()
+            for _ in range(options['epochs']):
+                user_factors = solve_factors(matrix, item_factors, REGULARIZATION, options['implicit'])
+                item_factors = solve_factors(by_movie, user_factors, REGULARIZATION, options['implicit'])
+            per_epoch = (time.perf_counter() - started) / options['epochs']
+            self.stdout.write(
+                f'{matrix.nnz:>10} {len(users):>8} {len(movies):>7} {per_epoch:>8.2f} {matrix.nnz / per_epoch:>10.0f}'
+            )
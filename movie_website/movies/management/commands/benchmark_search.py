@@ -0,0 +1,92 @@
+import random
+import sqlite3
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.search import SEARCH_LIMIT, SQLITE_CREATE_TABLE, SQLiteSearchBackend, sqlite_table
+
+WORDS = [
+    'love', 'war', 'space', 'detective', 'island', 'heist', 'family', 'ghost', 'river', 'empire',
+    'robot', 'summer', 'secret', 'night', 'city', 'dragon', 'escape', 'journey', 'king', 'shadow',
+]
+NAMES = ['Tom', 'Meg', 'Leonardo', 'Kate', 'Denzel', 'Viola', 'Brad', 'Emma', 'Keanu', 'Zoe']
+SURNAMES = ['Hanks', 'Ryan', 'DiCaprio', 'Winslet', 'Washington', 'Davis', 'Pitt', 'Stone', 'Reeves', 'Saldana']
+
+
+def synthetic_movie(rng, vocabulary):
+    title = ' '.join(rng.choices(vocabulary, k=3)).title()
+    description = ' '.join(rng.choices(vocabulary, k=40))
+    actors = ', '.join(f'{rng.choice(NAMES)} {rng.choice(SURNAMES)}' for _ in range(4))
+    return title, description, actors
+
+
+class Command(BaseCommand):
+    help = 'Compare FTS5 search latency against the icontains (LIKE) scan on synthetic movies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        syllables = [''.join(rng.choice('abcdefghijklmnoprstuvwy') for _ in range(rng.randint(4, 9)))
+                     for _ in range(5000)]
+        db = sqlite3.connect(':memory:')
+        db.execute('CREATE TABLE movie (id INTEGER PRIMARY KEY, title TEXT, description TEXT, actors TEXT)')
+        table = sqlite_table('movie')
+        db.execute(SQLITE_CREATE_TABLE.format(table=table))
+
+        vocabulary = WORDS + syllables
+        rows = [(pk,) + synthetic_movie(rng, vocabulary) for pk in range(1, options['movies'] + 1)]
+        db.executemany('INSERT INTO movie VALUES (?, ?, ?, ?)', rows)
+        started = time.perf_counter()
+        db.execute(f"INSERT INTO {table} (rowid, title, description, actors) "
+                   "SELECT id, title, description, actors FROM movie")
+        self.stdout.write(f"Indexed {options['movies']} movies in {time.perf_counter() - started:.2f}s")
+
+        backend = SQLiteSearchBackend()
+
+        # What saving a movie costs the index: replace its document by rowid
+        timings = []
+        for pk, title, description, actors in rng.sample(rows, min(len(rows), options['queries'])):
+            started = time.perf_counter()
+            db.execute(f'DELETE FROM {table} WHERE rowid = ?', (pk,))
+            db.execute(f'INSERT INTO {table} (rowid, title, description, actors) VALUES (?, ?, ?, ?)',
+                       (pk, title, description, actors))
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f'document replace       median {statistics.median(timings):8.2f} ms')
+        query_sets = {
+            'rare prefix': [rng.choice(syllables)[:rng.randint(4, 6)] for _ in range(options['queries'])],
+            'actor name': [rng.choice(SURNAMES) for _ in range(options['queries'])],
+        }
+
+        def like(query):
+            # Same work as home(): the paginator counts every match before slicing a page
+            pattern = f'%{query}%'
+            return db.execute(
+                'SELECT id FROM movie WHERE title LIKE ? OR description LIKE ? OR actors LIKE ?',
+                (pattern, pattern, pattern),
+            ).fetchall()
+
+        def fts(query):
+            return db.execute(
+                f"SELECT rowid FROM {table} WHERE {table} MATCH ? "
+                f"ORDER BY bm25({table}, 10.0, 1.0, 5.0) LIMIT ?",
+                (backend.match_expression(query), SEARCH_LIMIT),
+            ).fetchall()
+
+        for label, queries in query_sets.items():
+            for name, search in (('icontains', like), ('fts5', fts)):
+                timings = []
+                for query in queries:
+                    started = time.perf_counter()
+                    search(query)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f'{label:12} {name:10} median {statistics.median(timings):8.2f} ms   '
+                    f'p95 {timings[max(0, int(len(timings) * 0.95) - 1)]:8.2f} ms'
+                )
@@ -0,0 +1,60 @@
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from movies.recommendations import (
+    DEFAULT_NEIGHBOURS, SIMILARITY_METHODS, build_rating_matrix, top_k_neighbours,
+)
+
+
+def synthetic_ratings(n_users, n_movies, n_ratings, seed=0):
+    """Unique (user, movie, rating) triples with a long-tail movie popularity"""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, n_movies + 1) ** 0.8
+    popularity /= popularity.sum()
+
+    users = rng.integers(0, n_users, size=n_ratings)
+    movies = rng.choice(n_movies, size=n_ratings, p=popularity)
+    keys = np.unique(users * n_movies + movies)
+    ratings = rng.integers(1, 6, size=len(keys))
+    return keys // n_movies, keys % n_movies, ratings
+
+
+class Command(BaseCommand):
+    help = 'Benchmark building the item-item similarity model on synthetic ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=10_000)
+        parser.add_argument('--ratings', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--k', type=int, default=DEFAULT_NEIGHBOURS)
+        parser.add_argument('--method', choices=SIMILARITY_METHODS, default='cosine')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        user_ids, movie_ids, ratings = synthetic_ratings(
+            options['users'], options['movies'], options['ratings'], options['seed'],
+        )
+        self.stdout.write(
+            f"{options['movies']} movies, {options['users']} users, {len(ratings)} unique ratings"
+        )
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        matrix, _ = build_rating_matrix(user_ids, movie_ids, ratings)
+        matrix_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        top_k_neighbours(matrix, k=options['k'], method=options['method'])
+        neighbour_time = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(f'matrix build:     {matrix_time:8.2f}s')
+        self.stdout.write(f'top-{options["k"]} neighbours: {neighbour_time:8.2f}s')
+        self.stdout.write(f'peak allocated:   {peak / 2 ** 20:8.1f} MiB')
+        self.stdout.write(f'max RSS:          {max_rss:8.1f} MiB')
@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from movies.models import Movie, Rating
+
+CONFIGURATIONS = {
+    # Django's defaults: rollback journal, deferred transactions, 5s busy timeout
+    'default': ('delete', {}),
+    'configured': ('wal', None),  # the OPTIONS from settings.DATABASES
+}
+
+
+def use_database(path, options):
+    connections.close_all()
+    connection.settings_dict.update(NAME=path, OPTIONS=options)
+
+
+def read(movie_ids, rng):
+    """What the movie API does: one movie with its category, and a page of the newest movies"""
+    Movie.objects.select_related('category').filter(pk=rng.choice(movie_ids)).first()
+    list(Movie.objects.select_related('category').order_by('-created_at', '-id')[:50])
+
+
+def write(movie_ids, user_ids, rng):
+    """A rating through the model, with the totals, change log and task signals it fires"""
+    Rating.objects.update_or_create(user_id=rng.choice(user_ids), movie_id=rng.choice(movie_ids),
+                                    defaults={'rating': rng.randint(1, 5)})
+
+
+def worker(kind, path, options, movie_ids, user_ids, duration, seed, barrier, results):
+    use_database(path, options)
+    rng = random.Random(seed)
+    latencies, locked = [], 0
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if kind == 'read':
+                read(movie_ids, rng)
+            else:
+                write(movie_ids, user_ids, rng)
+        except OperationalError:  # database is locked
+            locked += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    connections.close_all()
+    results.put((kind, latencies, locked))
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent read/write throughput with the default and the configured SQLite connection options'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Reading processes')
+        parser.add_argument('--writers', type=int, default=4, help='Writing processes')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per configuration')
+        parser.add_argument('--users', type=int, default=200, help='Users the writers rate as')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+        configured = dict(connection.settings_dict['OPTIONS'])
+        directory = tempfile.mkdtemp(prefix='benchmark-sqlite-')
+        try:
+            # Work on a copy: the writers change ratings, and the journal mode is switched per run
+            path = os.path.join(directory, 'db.sqlite3')
+            source, copy = sqlite3.connect(connection.settings_dict['NAME']), sqlite3.connect(path)
+            source.backup(copy)
+            source.close()
+            copy.close()
+
+            use_database(path, configured)
+            movie_ids = list(Movie.objects.values_list('pk', flat=True))
+            if not movie_ids:
+                raise CommandError('No movies to read')
+            user_ids = [User.objects.get_or_create(username=f'benchmark{number}')[0].pk
+                        for number in range(options['users'])]
+
+            self.stdout.write(f"{options['readers']} readers, {options['writers']} writers, "
+                              f"{options['duration']:g}s, {len(movie_ids)} movies")
+            self.stdout.write(f"{'':<11} {'reads/s':>8} {'p50 ms':>7} {'p99 ms':>7} "
+                              f"{'writes/s':>9} {'p50 ms':>7} {'p99 ms':>7} {'locked':>7}")
+            for name, (journal_mode, run_options) in CONFIGURATIONS.items():
+                run_options = configured if run_options is None else run_options
+                connections.close_all()
+                raw = sqlite3.connect(path)
+                raw.execute(f'PRAGMA journal_mode={journal_mode}')
+                raw.close()
+                self.run(name, path, run_options, movie_ids, user_ids, options)
+        finally:
+            connections.close_all()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, name, path, run_options, movie_ids, user_ids, options):
+        context = multiprocessing.get_context('fork')
+        kinds = ['read'] * options['readers'] + ['write'] * options['writers']
+        barrier, results = context.Barrier(len(kinds)), context.Queue()
+        processes = [
+            context.Process(target=worker, args=(kind, path, run_options, movie_ids, user_ids,
+                                                 options['duration'], options['seed'] + number, barrier, results))
+            for number, kind in enumerate(kinds)
+        ]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        columns, locked = [], 0
+        for kind in ('read', 'write'):
+            latencies = np.array([value for row_kind, values, _ in rows if row_kind == kind for value in values])
+            locked += sum(count for row_kind, _, count in rows if row_kind == kind)
+            p50, p99 = np.percentile(latencies * 1000, [50, 99]) if len(latencies) else (float('nan'),) * 2
+            columns.append((len(latencies) / options['duration'], p50, p99))
+        (reads, read_p50, read_p99), (writes, write_p50, write_p99) = columns
+        self.stdout.write(f'{name:<11} {reads:8.1f} {read_p50:7.1f} {read_p99:7.1f} '
+                          f'{writes:9.1f} {write_p50:7.1f} {write_p99:7.1f} {locked:7d}')
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.content import CHUNK_SIZE, content_path, rebuild_content_similarity
+from movies.recommendations import DEFAULT_NEIGHBOURS
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the TF-IDF content vectors and the "similar movies by content" table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=DEFAULT_NEIGHBOURS,
+                            help='Number of neighbours to keep per movie')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Movies per sparse similarity block')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        model = rebuild_content_similarity(k=options['k'], chunk_size=options['chunk_size'])
+        pairs = sum(1 for _ in model.pairs())
+        self.stdout.write(self.style.SUCCESS(
+            f'Vectorized {len(model.movie_ids)} movies over {len(model.terms)} terms '
+            f'({model.matrix.nnz} non-zeros) and stored {pairs} content similarities '
+            f'in {time.perf_counter() - started:.2f}s; model saved to {content_path()}'
+        ))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.embeddings import build_store, get_store, store_path
+from movies.recommendations import DEFAULT_NEIGHBOURS
+
+
+class Command(BaseCommand):
+    help = 'Write the memory-mapped embedding store from the factor model, similar movies and rating totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbours', type=int, default=DEFAULT_NEIGHBOURS,
+                            help='Neighbours kept per movie')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        size = build_store(neighbours=options['neighbours'])
+        store = get_store()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(store)} movies ({store.factors} factors) to {store_path()}: '
+            f'{size / 2 ** 20:.1f} MiB in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from movies.feed import build_feed
+from movies.tasks import percentile
+
+
+class Command(BaseCommand):
+    help = 'Rescore every user\'s "For You" feed (run after rebuilding similarities or importing ratings)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', metavar='USERNAME',
+                            help='Only rebuild these users (repeatable)')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+
+        timings = []
+        started = time.perf_counter()
+        for user_id in users.values_list('pk', flat=True).iterator():
+            user_started = time.perf_counter()
+            build_feed(user_id)
+            timings.append((time.perf_counter() - user_started) * 1000)
+        elapsed = time.perf_counter() - started
+
+        if timings:
+            self.stdout.write(
+                f'per user: p50 {percentile(timings, 0.5):.1f}ms, p95 {percentile(timings, 0.95):.1f}ms'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(timings)} feeds in {elapsed:.1f}s'))
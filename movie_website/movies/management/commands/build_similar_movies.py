@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.recommendations import DEFAULT_NEIGHBOURS, SIMILARITY_METHODS, rebuild_similar_movies
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed "similar movies" table from user ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=DEFAULT_NEIGHBOURS,
+                            help='Number of neighbours to keep per movie')
+        parser.add_argument('--method', choices=SIMILARITY_METHODS, default='cosine',
+                            help='Similarity measure between movie rating vectors')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_similar_movies(k=options['k'], method=options['method'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {count} movie similarities in {elapsed:.2f}s'
+        ))
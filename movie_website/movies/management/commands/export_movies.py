@@ -0,0 +1,34 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.catalog import FORMATS, detect_format, export_rows, write_rows
+from movies.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Export movies to a CSV or JSON Lines file that import_movies can read back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write, or - for stdout")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--category', help='Only export movies in this category')
+
+    def handle(self, *args, **options):
+        movies = Movie.objects.all()
+        if options['category']:
+            movies = movies.filter(category__name__iexact=options['category'])
+
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else detect_format(path))
+        started = time.perf_counter()
+        if path == '-':
+            count = write_rows(sys.stdout, fmt, export_rows(movies))
+            report = self.stderr
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                count = write_rows(stream, fmt, export_rows(movies))
+            report = self.stdout
+        elapsed = time.perf_counter() - started
+        report.write(self.style.SUCCESS(f'Exported {count} movies to {path} in {elapsed:.1f}s'))
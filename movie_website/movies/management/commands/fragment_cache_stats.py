@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from movies.caching import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show template fragment cache hit and miss counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        for name, (hits, misses) in get_stats().items():
+            total = hits + misses
+            ratio = f'{hits / total:.1%}' if total else '-'
+            self.stdout.write(f'{name:15} hits {hits:8}  misses {misses:8}  hit rate {ratio:>6}')
+        if options['reset']:
+            reset_stats()
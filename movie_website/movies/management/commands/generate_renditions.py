@@ -0,0 +1,54 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from movies.images import get_manifest, manifest_field, process_image
+from movies.models import Movie, UpcomingMovie, UserProfile
+
+IMAGE_FIELDS = (
+    (Movie, 'poster'),
+    (UpcomingMovie, 'poster'),
+    (UserProfile, 'profile_picture'),
+)
+
+
+def process_in_worker(model_label, pk, field_name):
+    try:
+        return process_image(model_label, pk, field_name)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate missing poster and profile picture renditions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Parallel encoder threads')
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, field_name in IMAGE_FIELDS:
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for instance in rows.only('pk', field_name, manifest_field(field_name)):
+                if get_manifest(getattr(instance, field_name)) is None:
+                    jobs.append((model._meta.label, instance.pk, field_name))
+
+        started = time.perf_counter()
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {executor.submit(process_in_worker, *job): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {exc}')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated renditions for {done} image(s) in {elapsed:.1f}s ({failed} failed)'
+        ))
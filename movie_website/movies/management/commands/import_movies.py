@@ -0,0 +1,59 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.catalog import FORMATS, CatalogImporter, detect_format, peak_memory_mib, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import movies from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for stdin")
+        parser.add_argument('--user', required=True, help='Username recorded as added_by')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows inserted per bulk_create and transaction')
+        parser.add_argument('--poster-workers', type=int, default=8,
+                            help='Parallel poster downloads')
+        parser.add_argument('--poster-root', default='.',
+                            help='Directory that relative poster paths are read from')
+        parser.add_argument('--poster-timeout', type=float, default=10,
+                            help='Seconds to wait for a poster download')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else detect_format(path))
+        importer = CatalogImporter(
+            user,
+            batch_size=options['batch_size'],
+            poster_workers=options['poster_workers'],
+            poster_root=options['poster_root'],
+            poster_timeout=options['poster_timeout'],
+        )
+        try:
+            if path == '-':
+                importer.run(read_rows(sys.stdin, fmt))
+            else:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    importer.run(read_rows(stream, fmt))
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        memory = peak_memory_mib()
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.imported} of {importer.rows} rows ({importer.skipped} skipped) '
+            f'in {importer.elapsed:.1f}s, {importer.rows_per_second:.0f} rows/s; '
+            f'{importer.posters} poster(s) fetched, {importer.poster_failures} failed'
+            + (f'; peak memory {memory:.0f} MiB' if memory is not None else '')
+        ))
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.movielens import RatingsImporter, match_movies, refresh_rating_aggregates
+from movies.recommendations import DEFAULT_NEIGHBOURS, rebuild_similar_movies
+
+
+class Command(BaseCommand):
+    help = 'Bulk load MovieLens-format ratings (userId,movieId,rating,timestamp)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='ratings.csv to read, or - for stdin')
+        parser.add_argument('--movies',
+                            help='MovieLens movies.csv used to match movieId to catalog titles; '
+                                 'without it movieId is taken to be the Movie id')
+        parser.add_argument('--user-prefix', default='movielens_',
+                            help='Prefix of the usernames created for MovieLens users')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Rows written per upsert statement batch and transaction')
+        parser.add_argument('--skip-similarities', action='store_true',
+                            help="Don't rebuild the similar movies table afterwards")
+        parser.add_argument('--k', type=int, default=DEFAULT_NEIGHBOURS,
+                            help='Number of neighbours to keep per movie')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        try:
+            movie_ids = None
+            if options['movies']:
+                with open(options['movies'], newline='', encoding='utf-8') as stream:
+                    movie_ids = match_movies(stream)
+                self.stdout.write(f'Matched {len(movie_ids)} MovieLens movies to the catalog')
+
+            importer = RatingsImporter(movie_ids, options['user_prefix'], options['batch_size'])
+            if options['path'] == '-':
+                importer.run(sys.stdin)
+            else:
+                with open(options['path'], newline='', encoding='utf-8') as stream:
+                    importer.run(stream)
+        except OSError as exc:
+            raise CommandError(exc)
+
+        self.stdout.write(
+            f'Wrote {importer.written} of {importer.rows} ratings ({importer.skipped} skipped) '
+            f'in {importer.elapsed:.1f}s, {importer.rows_per_second:.0f} rows/s; '
+            f'created {importer.users_created} users'
+        )
+        fixed = refresh_rating_aggregates()
+        self.stdout.write(f'Refreshed rating totals of {fixed} movies')
+        if not options['skip_similarities']:
+            count = rebuild_similar_movies(k=options['k'])
+            self.stdout.write(f'Stored {count} movie similarities')
+        self.stdout.write(self.style.SUCCESS(
+            'Done. Restart process_rating_changes so it reloads its state from the new ratings.'
+        ))
@@ -0,0 +1,242 @@
+"""
+Load-test the AJAX and JSON endpoints under ASGI (uvicorn) and WSGI (gunicorn).
+
+Each server is started as a subprocess on a free local port with the
+current settings. Many concurrent keep-alive clients then drive it for a
+fixed time: asyncio coroutines speaking just enough HTTP/1.1 for our own
+responses. Results are reported as requests per second and latency
+percentiles.
+
+The write scenarios rate movies and toggle watchlist entries as
+loadtest<N> users, so point the command at a copy of the database
+(--settings).
+"""
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from importlib.util import find_spec
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from movies.models import Movie
+
+SERVERS = ('asgi', 'wsgi')
+SCENARIOS = ('rate', 'watchlist', 'detail', 'list')
+REQUESTS_PER_USER = 200
+CSRF_TOKEN = 'l' * 32  # cookie and header only have to agree
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers, threads):
+    if server == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'movie_website.asgi:application', '--host', '127.0.0.1',
+                '--port', str(port), '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+    return [sys.executable, '-m', 'gunicorn', 'movie_website.wsgi:application', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--worker-class', 'gthread', '--threads', str(threads),
+            '--backlog', '2048', '--log-level', 'warning']
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'Server exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError(f'Server did not listen on port {port} within {timeout}s')
+
+
+def encode_request(method, path, headers=(), body=b''):
+    lines = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', *headers]
+    if body:
+        lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def read_response(reader):
+    """Read one response; return (status, whether the server will close the connection)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by the server')
+    status = int(status_line.split()[1])
+    length, chunked, close = None, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            close = value == 'close'
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    elif status not in (204, 304):
+        await reader.read()
+        close = True
+    return status, close
+
+
+async def client(port, requests, measure_from, deadline, latencies, statuses, rng):
+    """Send requests back to back over one keep-alive connection until the deadline"""
+    writer = None
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(rng.choice(requests))
+            status, close = await read_response(reader)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as exc:
+            if started >= measure_from:
+                statuses[type(exc).__name__] += 1
+            if writer is not None:
+                writer.close()
+                writer = None
+            await asyncio.sleep(0.05)
+            continue
+        if started >= measure_from:
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(port, request_sets, clients, warmup, duration, seed):
+    latencies, statuses = [], Counter()
+    start = time.perf_counter()
+    measure_from, deadline = start + warmup, start + warmup + duration
+    await asyncio.gather(*(
+        client(port, request_sets[number % len(request_sets)], measure_from, deadline, latencies, statuses,
+               random.Random(seed + number))
+        for number in range(clients)
+    ))
+    return latencies, statuses
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and latency of the async endpoints under uvicorn (ASGI) and gunicorn (WSGI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--duration', type=float, default=20, help='Seconds measured per run')
+        parser.add_argument('--warmup', type=float, default=3, help='Seconds of load before measuring')
+        parser.add_argument('--server', action='append', choices=SERVERS, help='Default: both')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Default: all')
+        parser.add_argument('--users', type=int, default=50, help='Signed-in users shared by the clients')
+        parser.add_argument('--workers', type=int, default=1, help='Server processes')
+        parser.add_argument('--threads', type=int, default=32, help='Threads per gunicorn worker')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        servers = options['server'] or SERVERS
+        for server in servers:
+            module = 'uvicorn' if server == 'asgi' else 'gunicorn'
+            if find_spec(module) is None:
+                raise CommandError(f'{module} is not installed (pip install -r requirements.txt)')
+        movie_ids = list(Movie.objects.values_list('pk', flat=True))
+        if not movie_ids:
+            raise CommandError('No movies to request')
+        rng = random.Random(options['seed'])
+        sample = rng.sample(movie_ids, min(len(movie_ids), 1000))
+        sessions = self.sessions(options['users'])
+
+        rows = []
+        for server in servers:
+            port = free_port()
+            # The server inherits DJANGO_SETTINGS_MODULE, which --settings also sets
+            process = subprocess.Popen(server_command(server, port, options['workers'], options['threads']),
+                                       cwd=settings.BASE_DIR)
+            try:
+                wait_for_port(port, process)
+                for scenario in options['scenario'] or SCENARIOS:
+                    request_sets = [self.requests(scenario, session, sample, rng) for session in sessions]
+                    latencies, statuses = asyncio.run(drive(
+                        port, request_sets, options['clients'], options['warmup'], options['duration'],
+                        options['seed'],
+                    ))
+                    rows.append((server, scenario, latencies, statuses))
+                    self.report(*rows[-1], options['duration'])
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    def sessions(self, count):
+        """Session ids of signed-in load-test users"""
+        sessions = []
+        for number in range(count):
+            user, created = User.objects.get_or_create(username=f'loadtest{number}')
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=['password'])
+            session = SessionStore()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.create()
+            sessions.append(session.session_key)
+        return sessions
+
+    def requests(self, scenario, session, movie_ids, rng):
+        """Encoded requests for one user, picked at random by the clients"""
+        if scenario == 'list':
+            return [encode_request('GET', reverse('api_movie_list'))]
+        if scenario == 'detail':
+            return [encode_request('GET', reverse('api_movie_detail', args=[pk])) for pk in movie_ids]
+        headers = (f'Cookie: {settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={CSRF_TOKEN}',
+                   f'X-CSRFToken: {CSRF_TOKEN}', 'Content-Type: application/json')
+        requests = []
+        for _ in range(REQUESTS_PER_USER):
+            pk = rng.choice(movie_ids)
+            if scenario == 'rate':
+                body = json.dumps({'rating': rng.randint(1, 5)}).encode()
+                requests.append(encode_request('POST', reverse('rate_movie', args=[pk]), headers, body))
+            else:
+                requests.append(encode_request('POST', reverse('toggle_watchlist', args=[pk]), headers))
+        return requests
+
+    def report(self, server, scenario, latencies, statuses, duration):
+        if latencies:
+            p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        else:
+            p50 = p95 = p99 = float('nan')
+        failed = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+        self.stdout.write(
+            f'{server:<5} {scenario:<10} {len(latencies) / duration:8.1f} req/s  p50 {p50:7.1f} ms  '
+            f'p95 {p95:7.1f} ms  p99 {p99:7.1f} ms  {failed} failed'
+            + (f'  {dict(statuses)}' if failed else '')
+        )
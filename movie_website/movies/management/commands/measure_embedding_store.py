@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from movies.embeddings import SECTIONS, EmbeddingStore, store_path
+
+
+def memory_kib(path):
+    """(Rss, Pss) of this process's mappings of path, and of the whole process, in KiB; None off Linux"""
+    try:
+        with open('/proc/self/smaps') as stream:
+            lines = stream.readlines()
+    except OSError:
+        return None
+    mapped, total, inside = {'Rss': 0, 'Pss': 0}, {'Rss': 0, 'Pss': 0}, False
+    for line in lines:
+        field, _, value = line.partition(':')
+        if field in total and value.strip().endswith('kB'):
+            kib = int(value.split()[0])
+            total[field] += kib
+            if inside:
+                mapped[field] += kib
+        elif '-' in line.split(' ', 1)[0]:
+            inside = line.rstrip('\n').endswith(path)
+    return mapped, total
+
+
+def worker(path, copy, barrier, results):
+    before = memory_kib(path)
+    started = time.perf_counter()
+    store = EmbeddingStore(path)
+    opened = time.perf_counter() - started
+    if copy:
+        # What every worker pays when it loads its own arrays instead of mapping them
+        arrays = {name: np.array(getattr(store, name)) for name, _, _ in SECTIONS}
+        del store
+        checksum = sum(int(array.view(np.uint8).sum()) for array in arrays.values())
+    else:
+        checksum = store.touch()
+    loaded = time.perf_counter() - started
+    barrier.wait()  # measure while every worker holds the data, so shared pages are split between them
+    after = memory_kib(path)
+    barrier.wait()
+    results.put((os.getpid(), opened, loaded, before, after, checksum))
+
+
+class Command(BaseCommand):
+    help = 'Measure startup time and resident memory of worker processes opening the embedding store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--copy', action='store_true',
+                            help='Load the arrays into private memory instead, for comparison')
+
+    def handle(self, *args, **options):
+        path = store_path()
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist; run build_embedding_store first')
+        workers = options['workers']
+        context = multiprocessing.get_context('fork')
+        barrier, results = context.Barrier(workers), context.Queue()
+        connections.close_all()
+        processes = [context.Process(target=worker, args=(path, options['copy'], barrier, results))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        size = os.path.getsize(path) / 2 ** 10
+        self.stdout.write(f"{'copy' if options['copy'] else 'mmap'} of {size:.0f} KiB store, {workers} workers")
+        self.stdout.write(f"{'pid':>8} {'open ms':>8} {'load ms':>8} {'map RSS':>9} {'map PSS':>9} "
+                          f"{'RSS +KiB':>9} {'PSS +KiB':>9}")
+        total_pss = 0
+        for pid, opened, loaded, before, after, _ in sorted(rows):
+            if after is None:
+                self.stdout.write(f'{pid:>8} {opened * 1000:>8.2f} {loaded * 1000:>8.2f} (no /proc/self/smaps)')
+                continue
+            (mapped, total), (_, total_before) = after, before
+            grown = {field: total[field] - total_before[field] for field in total}
+            total_pss += grown['Pss']
+            self.stdout.write(
+                f"{pid:>8} {opened * 1000:>8.2f} {loaded * 1000:>8.2f} {mapped['Rss']:>9} {mapped['Pss']:>9} "
+                f"{grown['Rss']:>9} {grown['Pss']:>9}"
+            )
+        self.stdout.write(f'proportional memory added across workers: {total_pss} KiB')
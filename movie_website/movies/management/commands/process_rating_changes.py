@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.recommendations import (
+    DEFAULT_NEIGHBOURS, bootstrap_incremental_state, process_rating_changes,
+)
+
+
+class Command(BaseCommand):
+    help = 'Keep the "similar movies" table up to date by consuming the rating change log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=DEFAULT_NEIGHBOURS,
+                            help='Number of neighbours to keep per movie')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the log is empty')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the pending log and exit')
+
+    def handle(self, *args, **options):
+        state = bootstrap_incremental_state(k=options['k'])
+        stored = state.save_all_neighbours()
+        self.stdout.write(f'Loaded {len(state.squares)} rated movies, stored {stored} similarities')
+
+        try:
+            while True:
+                processed = process_rating_changes(state, batch_size=options['batch_size'])
+                if processed:
+                    self.stdout.write(f'Applied {processed} rating changes')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from movies.models import Movie, UpcomingMovie
+from movies.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text search index for movies and upcoming movies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = get_backend(using)
+        with transaction.atomic(using=using):
+            with backend.connection.cursor() as cursor:
+                backend.create_table(cursor)
+            for model in (Movie, UpcomingMovie):
+                backend.rebuild(model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Movie.objects.using(using).count()} movies and '
+            f'{UpcomingMovie.objects.using(using).count()} upcoming movies'
+        ))
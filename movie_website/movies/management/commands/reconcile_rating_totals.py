@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movies.models import recalculate_rating_totals
+
+
+class Command(BaseCommand):
+    help = 'Repair drift between Movie.rating_sum/rating_count and the Rating table'
+
+    def handle(self, *args, **options):
+        fixed = recalculate_rating_totals()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled rating totals for {fixed} movie(s)'))
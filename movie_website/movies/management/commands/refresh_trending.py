@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.models import TrendingRank
+from movies.trending import refresh_trending, trending_boards
+
+
+class Command(BaseCommand):
+    help = 'Decay the trending counters, add new rating/review/watchlist events and re-rank the boards (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--show', type=int, default=0, metavar='N',
+                            help='Print the top N of every board afterwards')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = refresh_trending()
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {result['movies']} movies with new events; {result['counters']} counters, "
+            f"{result['ranked']} board entries in {time.perf_counter() - started:.2f}s"
+        ))
+        if options['show']:
+            boards = trending_boards()
+            for board, title in TrendingRank.BOARD_CHOICES:
+                self.stdout.write(title)
+                for position, (movie, score) in enumerate(boards[board][:options['show']], start=1):
+                    self.stdout.write(f'  {position:>2}. {movie.title} ({score:.2f})')
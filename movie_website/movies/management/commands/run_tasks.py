@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from movies.tasks import prune_finished, requeue_stale, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (image renditions, search index updates)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the due tasks and exit')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Delete finished tasks older than this on startup')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        pruned = prune_finished(timedelta(days=options['keep_days']))
+        self.stdout.write(f'Requeued {requeued} stale task(s), pruned {pruned} finished task(s)')
+
+        try:
+            while True:
+                ran = run_pending(limit=100)
+                if ran:
+                    self.stdout.write(f'Ran {ran} task(s)')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
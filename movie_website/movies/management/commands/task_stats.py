@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from movies.tasks import latency_stats
+
+
+def milliseconds(value):
+    return '-' if value is None else f'{value:.0f}ms'
+
+
+class Command(BaseCommand):
+    help = 'Show background task throughput and queue latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=60, help='Window of finished tasks to report on')
+
+    def handle(self, *args, **options):
+        stats = latency_stats(timedelta(minutes=options['minutes']))
+        if not stats:
+            self.stdout.write('No tasks in the window')
+        for name, entry in sorted(stats.items()):
+            self.stdout.write(
+                f"{name:22} done {entry['done']:6}  failed {entry['failed']:4}  pending {entry['pending']:5}  "
+                f"wait p50 {milliseconds(entry['wait_p50']):>8} p95 {milliseconds(entry['wait_p95']):>8}  "
+                f"run p50 {milliseconds(entry['run_p50']):>8} p95 {milliseconds(entry['run_p95']):>8}"
+            )
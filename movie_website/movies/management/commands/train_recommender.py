@@ -0,0 +1,61 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.factorization import (
+    ALPHA, FACTORS, ITERATIONS, REGULARIZATION, evaluate, model_dir, split_ratings, train,
+)
+from movies.recommendations import load_ratings
+
+
+class Command(BaseCommand):
+    help = 'Train the latent-factor (ALS) recommender on all ratings and save it for scoring'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=FACTORS)
+        parser.add_argument('--iterations', type=int, default=ITERATIONS)
+        parser.add_argument('--regularization', type=float, default=REGULARIZATION)
+        parser.add_argument('--implicit', action='store_true',
+                            help='Fit implicit feedback (confidence-weighted) instead of explicit ratings')
+        parser.add_argument('--alpha', type=float, default=ALPHA,
+                            help='Confidence scale for --implicit')
+        parser.add_argument('--evaluate', type=float, default=0.0, metavar='FRACTION',
+                            help='First hold out this fraction of ratings and report RMSE and precision@K')
+        parser.add_argument('--k', type=int, default=10, help='K for precision@K')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        ratings = load_ratings()
+        if not len(ratings[0]):
+            raise CommandError('There are no ratings to train on')
+        params = {
+            'factors': options['factors'],
+            'iterations': options['iterations'],
+            'regularization': options['regularization'],
+            'implicit': options['implicit'],
+            'alpha': options['alpha'],
+            'seed': options['seed'],
+        }
+
+        if options['evaluate'] > 0:
+            train_set, test_set = split_ratings(*ratings, test_fraction=options['evaluate'], seed=options['seed'])
+            held_out = train(*train_set, **params)
+            results = evaluate(held_out, train_set, test_set, k=options['k'])
+            rmse = 'n/a' if results['rmse'] is None else f"{results['rmse']:.4f}"
+            precision = 'n/a' if results['precision_at_k'] is None else f"{results['precision_at_k']:.4f}"
+            self.stdout.write(
+                f"held out {results['test_ratings']} ratings: RMSE {rmse}, "
+                f"precision@{options['k']} {precision} over {results['evaluated_users']} users"
+            )
+
+        def report(epoch, seconds):
+            self.stdout.write(f'epoch {epoch}: {seconds:.2f}s')
+
+        started = time.perf_counter()
+        model = train(*ratings, on_epoch=report, **params)
+        version = model.save()
+        self.stdout.write(self.style.SUCCESS(
+            f'Trained {model.factors} factors for {len(model.user_ids)} users and {len(model.movie_ids)} movies '
+            f'on {len(ratings[0])} ratings in {time.perf_counter() - started:.1f}s; saved to {os.path.join(model_dir(), version)}'
+        ))
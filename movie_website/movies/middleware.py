@@ -0,0 +1,128 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('movies.queries')
+
+# Collapse IN (...) / VALUES (...) lists so queries differing only in list length share a shape
+PLACEHOLDER_LIST = re.compile(r'(%s|\?)(\s*,\s*(%s|\?))+')
+
+
+def query_shape(sql):
+    """Normalize SQL so repeated queries with different parameters compare equal"""
+    return PLACEHOLDER_LIST.sub('%s', sql)
+
+
+class QueryStats:
+    """Queries recorded while serving one request"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration_ms(self):
+        return sum(duration for _, duration in self.queries) * 1000
+
+    def duplicates(self):
+        """Query shapes issued more than once, the usual sign of an N+1 pattern"""
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries)
+        return {shape: count for shape, count in shapes.items() if count > 1}
+
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.duplicates().values())
+
+    def report(self):
+        lines = [f'{self.count} queries, {self.duplicate_count()} duplicates, {self.duration_ms:.1f} ms']
+        for shape, count in sorted(self.duplicates().items(), key=lambda item: -item[1]):
+            lines.append(f'  {count}x {shape}')
+        return '\n'.join(lines)
+
+
+def record_queries(stats):
+    """Context manager installing the recorder on every configured database"""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(stats))
+    return stack
+
+
+def get_query_budget(url_name):
+    from .urls import query_budgets
+    return query_budgets.get(url_name)
+
+
+class QueryBudgetMiddleware:
+    """
+    Record query count, duplicate SQL shapes and DB time for every request.
+
+    The numbers are logged to the ``movies.queries`` logger (as a warning when
+    the view exceeds its budget from ``movies.urls.query_budgets``), attached
+    to the response as ``response.query_stats`` and, when QUERY_STATS_HEADERS
+    is on, sent as X-Query-* headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        with record_queries(stats):
+            response = self.get_response(request)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        # Connections are per thread, and under ASGI every query of the request
+        # runs in its thread-sensitive sync_to_async thread, so install there
+        recorder = await sync_to_async(record_queries)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recorder.close)()
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        budget = get_query_budget(url_name)
+        response.query_stats = stats
+
+        if getattr(settings, 'QUERY_STATS_HEADERS', settings.DEBUG):
+            response['X-Query-Count'] = str(stats.count)
+            response['X-Query-Duplicates'] = str(stats.duplicate_count())
+            response['X-Query-Time-Ms'] = f'{stats.duration_ms:.1f}'
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+
+        over_budget = budget is not None and stats.count > budget
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            '%s %s view=%s queries=%d budget=%s duplicates=%d db_time=%.1fms',
+            request.method, request.path, url_name, stats.count, budget,
+            stats.duplicate_count(), stats.duration_ms,
+        )
+        return response
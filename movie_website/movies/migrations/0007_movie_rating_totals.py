@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:53
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rating_totals(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    movies = Movie.objects.annotate(
+        actual_sum=Sum('user_ratings__rating', default=0),
+        actual_count=Count('user_ratings'),
+    )
+    for movie in movies:
+        movie.rating_sum = movie.actual_sum
+        movie.rating_count = movie.actual_count
+        movie.save(update_fields=['rating_sum', 'rating_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_ratingchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of user ratings'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Sum of user ratings'),
+        ),
+        migrations.RunPython(populate_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from movies.search import get_backend
+
+
+def create_search_index(apps, schema_editor):
+    backend = get_backend(schema_editor.connection.alias)
+    with schema_editor.connection.cursor() as cursor:
+        backend.create_table(cursor)
+    backend.rebuild(apps.get_model('movies', 'Movie'))
+    backend.rebuild(apps.get_model('movies', 'UpcomingMovie'))
+
+
+def drop_search_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        get_backend(schema_editor.connection.alias).drop_table(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_movie_rating_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
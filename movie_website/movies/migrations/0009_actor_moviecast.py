@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Actor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovieCast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_order', models.PositiveSmallIntegerField(default=0)),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credits', to='movies.actor')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cast_credits', to='movies.movie')),
+            ],
+            options={
+                'ordering': ['movie', 'billing_order'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='cast',
+            field=models.ManyToManyField(blank=True, related_name='movies', through='movies.MovieCast', to='movies.actor'),
+        ),
+        migrations.AddIndex(
+            model_name='moviecast',
+            index=models.Index(fields=['actor', 'movie'], name='movies_cast_actor_movie_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='moviecast',
+            unique_together={('movie', 'actor')},
+        ),
+    ]
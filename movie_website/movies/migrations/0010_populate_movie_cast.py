@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def populate_movie_cast(apps, schema_editor):
+    Actor = apps.get_model('movies', 'Actor')
+    Movie = apps.get_model('movies', 'Movie')
+    MovieCast = apps.get_model('movies', 'MovieCast')
+
+    credits = []
+    for movie_id, actors in Movie.objects.values_list('id', 'actors'):
+        names = []
+        for name in actors.split(','):
+            name = ' '.join(name.split())
+            if name and name not in names:
+                names.append(name)
+        credits.extend((movie_id, order, name) for order, name in enumerate(names))
+
+    Actor.objects.bulk_create(
+        [Actor(name=name) for name in {name for _, _, name in credits}],
+        ignore_conflicts=True,
+    )
+    actor_ids = dict(Actor.objects.values_list('name', 'id'))
+    MovieCast.objects.bulk_create(
+        [MovieCast(movie_id=movie_id, actor_id=actor_ids[name], billing_order=order)
+         for movie_id, order, name in credits],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def clear_movie_cast(apps, schema_editor):
+    apps.get_model('movies', 'MovieCast').objects.all().delete()
+    apps.get_model('movies', 'Actor').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_actor_moviecast'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_movie_cast, clear_movie_cast),
+    ]
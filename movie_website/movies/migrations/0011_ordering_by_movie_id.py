@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_populate_movie_cast'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='moviecast',
+            options={'ordering': ['movie_id', 'billing_order']},
+        ),
+        migrations.AlterModelOptions(
+            name='moviesimilarity',
+            options={'ordering': ['movie_id', '-score'], 'verbose_name_plural': 'Movie similarities'},
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_ordering_by_movie_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['created_at', 'id'], name='movies_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='movies_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='upcomingmovie',
+            index=models.Index(fields=['expected_release_date', 'id'], name='movies_upcoming_release_idx'),
+        ),
+        # auth.User is not ours to add Meta indexes to; manage_users pages on date_joined
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS movies_user_joined_idx ON auth_user (date_joined, id)',
+            'DROP INDEX IF EXISTS movies_user_joined_idx',
+        ),
+    ]
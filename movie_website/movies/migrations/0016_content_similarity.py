@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0015_feed_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='content_similarities', to='movies.movie')),
+                ('similar_movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie')),
+            ],
+            options={
+                'verbose_name_plural': 'Content similarities',
+                'ordering': ['movie_id', '-score'],
+                'indexes': [models.Index(fields=['movie', '-score'], name='movies_content_score_idx')],
+                'unique_together': {('movie', 'similar_movie')},
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0016_content_similarity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingCounter',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='movies.movie')),
+                ('activity', models.FloatField(default=0, help_text='Weighted ratings, reviews and watchlist adds')),
+                ('rating_sum', models.FloatField(default=0)),
+                ('rating_count', models.FloatField(default=0)),
+                ('watchlist_adds', models.FloatField(default=0)),
+                ('decayed_to', models.DateTimeField(help_text='Time the counts are decayed to')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('trending', 'Trending now'), ('top_rated_week', 'Top rated this week'), ('most_watchlisted', 'Most watchlisted')], max_length=20)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'ordering': ['board', 'position'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['updated_at'], name='movies_rating_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at'], name='movies_review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['added_at'], name='movies_watchlist_added_idx'),
+        ),
+        migrations.AddField(
+            model_name='trendingrank',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='trendingrank',
+            unique_together={('board', 'position')},
+        ),
+    ]
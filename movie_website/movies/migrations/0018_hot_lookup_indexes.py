@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0017_trending'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['added_by', 'created_at'], name='movies_added_by_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', 'created_at'], name='movies_review_movie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='upcomingmovie',
+            index=models.Index(fields=['category', 'expected_release_date', 'id'], name='movies_upcoming_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['user', 'added_at'], name='movies_watchlist_user_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from movies.search import SEARCH_TABLE, get_backend
+
+
+def key_documents_by_rowid(apps, schema_editor):
+    """Move SQLite documents from the shared (kind, object_id) table to a rowid-keyed table per kind"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    backend = get_backend(connection.alias)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+        backend.create_table(cursor)
+    backend.rebuild(apps.get_model('movies', 'Movie'))
+    backend.rebuild(apps.get_model('movies', 'UpcomingMovie'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0018_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(key_documents_by_rowid, migrations.RunPython.noop),
+    ]
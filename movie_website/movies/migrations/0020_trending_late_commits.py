@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0019_search_documents_by_rowid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('rating', 'Rating'), ('review', 'Review'), ('watchlist', 'Watchlist add')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0020_trending_late_commits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='feed_built_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the For You feed was last built, empty before the first build', null=True),
+        ),
+    ]
@@ -1,11 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Avg
-from django.db.models.signals import post_save
+from django.db.models import Count, F, Q, Sum
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 import os
 
+from .caching import all_movies_scope, bump_versions, category_scope, reviews_scope, upcoming_scope
+from .images import schedule_renditions
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -20,9 +24,31 @@ class Category(models.Model):
         return self.name
 
 
+class Actor(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+def parse_actor_names(actors):
+    """Split a comma-separated cast string into unique, whitespace-normalized names in billing order"""
+    names = []
+    for name in actors.split(','):
+        name = ' '.join(name.split())
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
 class Movie(models.Model):
     title = models.CharField(max_length=200)
     poster = models.ImageField(upload_to='movie_posters/', blank=True, null=True)
+    poster_renditions = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField()
     release_date = models.DateField()
     actors = models.CharField(max_length=500)
@@ -32,27 +58,56 @@ class Movie(models.Model):
     )
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='movies')
     youtube_trailer = models.URLField(max_length=200, blank=True)
+    cast = models.ManyToManyField(Actor, through='MovieCast', related_name='movies', blank=True)
     added_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, help_text="Sum of user ratings")
+    rating_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of user ratings")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the home and category lists
+            models.Index(fields=['created_at', 'id'], name='movies_created_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='movies_category_created_idx'),
+            # The profile page's own movies, newest first
+            models.Index(fields=['added_by', 'created_at'], name='movies_added_by_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category so a move can invalidate both category lists
+        instance._stored_category_id = instance.__dict__.get('category_id')
+        instance._stored_content = instance.content_fields()
+        return instance
+
+    @property
+    def cache_version(self):
+        """Changes whenever anything shown on the movie's card changes"""
+        digest = self.poster_renditions.get('digest', '')
+        return f'{self.updated_at.timestamp()}-{self.rating_sum}-{self.rating_count}-{digest}'
+
+    def renditions_updated(self):
+        """Poster renditions became available; re-render the lists showing the card"""
+        bump_versions(all_movies_scope(), category_scope(self.category_id))
+
     def can_edit(self, user):
         return self.added_by == user or user.is_staff
 
     def average_rating(self):
-        """Calculate average user rating from 1-5 scale"""
-        avg = self.user_ratings.aggregate(Avg('rating'))['rating__avg']
-        return round(avg, 1) if avg else 0
+        """Average user rating on the 1-5 scale, from the denormalized totals"""
+        if not self.rating_count:
+            return 0
+        return round(self.rating_sum / self.rating_count, 1)
 
     def total_ratings(self):
         """Get total number of user ratings"""
-        return self.user_ratings.count()
+        return self.rating_count
 
     def user_rating(self, user):
         """Get specific user's rating for this movie"""
@@ -63,6 +118,58 @@ class Movie(models.Model):
                 return 0
         return 0
 
+    def sync_cast(self):
+        """Rebuild the normalized cast from the free-text actors field"""
+        names = parse_actor_names(self.actors)
+        current = list(
+            self.cast_credits.order_by('billing_order').values_list('actor__name', flat=True)
+        )
+        if current == names:
+            return
+
+        Actor.objects.bulk_create([Actor(name=name) for name in names], ignore_conflicts=True)
+        actors = Actor.objects.in_bulk(names, field_name='name')
+        self.cast_credits.all().delete()
+        MovieCast.objects.bulk_create([
+            MovieCast(movie=self, actor=actors[name], billing_order=order)
+            for order, name in enumerate(names)
+        ])
+
+    def similar_movies(self, limit=6):
+        """Precomputed item-item neighbours, best match first"""
+        return [
+            similarity.similar_movie
+            for similarity in self.similarities.select_related('similar_movie')[:limit]
+        ]
+
+    def similar_by_content(self, limit=6):
+        """Precomputed neighbours by description, cast and category, best match first"""
+        return [
+            similarity.similar_movie
+            for similarity in self.content_similarities.select_related('similar_movie')[:limit]
+        ]
+
+    def content_fields(self):
+        """The fields content similarity is computed from"""
+        return tuple(self.__dict__.get(name) for name in ('description', 'actors', 'category_id'))
+
+
+class MovieCast(models.Model):
+    """An actor's credit on a movie"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='cast_credits')
+    actor = models.ForeignKey(Actor, on_delete=models.CASCADE, related_name='credits')
+    billing_order = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('movie', 'actor')
+        ordering = ['movie_id', 'billing_order']
+        indexes = [
+            models.Index(fields=['actor', 'movie'], name='movies_cast_actor_movie_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor.name} in {self.movie.title}"
+
 
 class Rating(models.Model):
     """User ratings for movies (1-5 stars)"""
@@ -78,10 +185,87 @@ class Rating(models.Model):
     class Meta:
         unique_together = ('user', 'movie')
         ordering = ['-created_at']
+        indexes = [
+            # New events for refresh_trending
+            models.Index(fields=['updated_at'], name='movies_rating_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} rated {self.movie.title}: {self.rating}/5"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so signal handlers can apply the delta
+        instance._stored_rating = instance.__dict__.get('rating')
+        return instance
+
+
+class RatingChange(models.Model):
+    """Append-only log of rating writes consumed by the incremental recommender"""
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    movie = models.ForeignKey(Movie, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    rating = models.IntegerField(null=True, blank=True, help_text="New rating, empty when removed")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"user {self.user_id} -> movie {self.movie_id}: {self.rating}"
+
+
+class Task(models.Model):
+    """Deferred work run by the run_tasks worker (see tasks.py)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=200, null=True, blank=True,
+                           help_text="Idempotency key; at most one pending task per key")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='movies_task_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=Q(status='pending'), name='movies_task_pending_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    @property
+    def wait_time(self):
+        """Time from being queued to starting, the latency the queue adds"""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.created_at
+
+    @property
+    def run_time(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
 
 class Review(models.Model):
     """User reviews for movies"""
@@ -94,6 +278,11 @@ class Review(models.Model):
     class Meta:
         unique_together = ('user', 'movie')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='movies_review_created_idx'),
+            # A movie's reviews, newest first, without sorting
+            models.Index(fields=['movie', 'created_at'], name='movies_review_movie_idx'),
+        ]
 
     def __str__(self):
         return f"Review by {self.user.username} for {self.movie.title}"
@@ -108,15 +297,125 @@ class Watchlist(models.Model):
     class Meta:
         unique_together = ('user', 'movie')
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['added_at'], name='movies_watchlist_added_idx'),
+            models.Index(fields=['user', 'added_at'], name='movies_watchlist_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.movie.title}"
 
 
+class MovieSimilarity(models.Model):
+    """Precomputed top-K item-item neighbours built from user ratings"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='similarities')
+    similar_movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        verbose_name_plural = "Movie similarities"
+        unique_together = ('movie', 'similar_movie')
+        ordering = ['movie_id', '-score']
+        indexes = [
+            models.Index(fields=['movie', '-score'], name='movies_sim_movie_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie.title} ~ {self.similar_movie.title} ({self.score:.3f})"
+
+
+class ContentSimilarity(models.Model):
+    """Precomputed top-K neighbours by description, cast and category (see content.py)"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='content_similarities')
+    similar_movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        verbose_name_plural = "Content similarities"
+        unique_together = ('movie', 'similar_movie')
+        ordering = ['movie_id', '-score']
+        indexes = [
+            models.Index(fields=['movie', '-score'], name='movies_content_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie.title} ~ {self.similar_movie.title} ({self.score:.3f})"
+
+
+class TrendingCounter(models.Model):
+    """Exponentially decayed event counts for a movie with recent activity (see trending.py)"""
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    activity = models.FloatField(default=0, help_text="Weighted ratings, reviews and watchlist adds")
+    rating_sum = models.FloatField(default=0)
+    rating_count = models.FloatField(default=0)
+    watchlist_adds = models.FloatField(default=0)
+    decayed_to = models.DateTimeField(help_text="Time the counts are decayed to")
+
+    def __str__(self):
+        return f"{self.movie.title} ({self.activity:.2f})"
+
+
+class TrendingEvent(models.Model):
+    """An event the last trending refresh counted, kept for LATE_COMMITS so the next one skips it"""
+    RATING = 'rating'
+    REVIEW = 'review'
+    WATCHLIST = 'watchlist'
+    KIND_CHOICES = [(RATING, 'Rating'), (REVIEW, 'Review'), (WATCHLIST, 'Watchlist add')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} at {self.at}"
+
+
+class TrendingRank(models.Model):
+    """A movie's place on one of the precomputed trending boards"""
+    TRENDING = 'trending'
+    TOP_RATED_WEEK = 'top_rated_week'
+    MOST_WATCHLISTED = 'most_watchlisted'
+    BOARD_CHOICES = [
+        (TRENDING, 'Trending now'),
+        (TOP_RATED_WEEK, 'Top rated this week'),
+        (MOST_WATCHLISTED, 'Most watchlisted'),
+    ]
+
+    board = models.CharField(max_length=20, choices=BOARD_CHOICES)
+    position = models.PositiveSmallIntegerField()
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('board', 'position')
+        ordering = ['board', 'position']
+
+    def __str__(self):
+        return f"{self.get_board_display()} #{self.position}: {self.movie.title}"
+
+
+class FeedItem(models.Model):
+    """A movie in a user's precomputed "For You" feed (see feed.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_items')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='feed_items')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('user', 'movie')
+        ordering = ['user_id', '-score']
+        indexes = [
+            models.Index(fields=['user', '-score'], name='movies_feed_user_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.movie_id} ({self.score:.3f})"
+
+
 class UpcomingMovie(models.Model):
     """Upcoming movies"""
     title = models.CharField(max_length=200)
     poster = models.ImageField(upload_to='upcoming_posters/', blank=True, null=True)
+    poster_renditions = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField()
     expected_release_date = models.DateField()
     actors = models.CharField(max_length=500, blank=True)
@@ -127,10 +426,17 @@ class UpcomingMovie(models.Model):
 
     class Meta:
         ordering = ['expected_release_date']
+        indexes = [
+            models.Index(fields=['expected_release_date', 'id'], name='movies_upcoming_release_idx'),
+            models.Index(fields=['category', 'expected_release_date', 'id'], name='movies_upcoming_category_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} (Coming {self.expected_release_date})"
 
+    def renditions_updated(self):
+        bump_versions(upcoming_scope())
+
 
 def user_profile_picture_path(instance, filename):
     """Generate file path for user profile pictures"""
@@ -151,6 +457,7 @@ class UserProfile(models.Model):
         null=True,
         help_text="Upload a profile picture"
     )
+    profile_picture_renditions = models.JSONField(default=dict, blank=True, editable=False)
     age = models.PositiveIntegerField(blank=True, null=True)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, blank=True)
     location = models.CharField(max_length=100, blank=True)
@@ -160,6 +467,8 @@ class UserProfile(models.Model):
         blank=True,
         help_text="Comma-separated list of favorite genres"
     )
+    feed_built_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                         help_text="When the For You feed was last built, empty before the first build")
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
@@ -170,6 +479,13 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored genres so only a real change rebuilds the feed
+        instance._stored_favorite_genres = instance.__dict__.get('favorite_genres')
+        return instance
+
     def get_favorite_genres_list(self):
         """Return favorite genres as a list"""
         if self.favorite_genres:
@@ -189,4 +505,183 @@ def create_or_save_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
     elif hasattr(instance, 'profile'):
-        instance.profile.save()
\ No newline at end of file
+        instance.profile.save()
+
+
+@receiver(post_save, sender=Rating)
+def log_rating_saved(sender, instance, **kwargs):
+    """Record the new rating so the recommender can update incrementally"""
+    RatingChange.objects.create(user_id=instance.user_id, movie_id=instance.movie_id, rating=instance.rating)
+
+
+@receiver(post_delete, sender=Rating)
+def log_rating_deleted(sender, instance, **kwargs):
+    """Record a removed rating so the recommender can update incrementally"""
+    RatingChange.objects.create(user_id=instance.user_id, movie_id=instance.movie_id, rating=None)
+
+
+
+def bulk_create_cast(movies):
+    """Create the cast credits of freshly bulk-inserted movies, which skip the save signal"""
+    names = {movie.pk: parse_actor_names(movie.actors) for movie in movies}
+    all_names = {name for movie_names in names.values() for name in movie_names}
+    Actor.objects.bulk_create([Actor(name=name) for name in all_names], ignore_conflicts=True)
+    actors = Actor.objects.in_bulk(list(all_names), field_name='name')
+    MovieCast.objects.bulk_create([
+        MovieCast(movie_id=movie_id, actor=actors[name], billing_order=order)
+        for movie_id, movie_names in names.items()
+        for order, name in enumerate(movie_names)
+    ])
+
+
+def recalculate_rating_totals(movies=None):
+    """Recompute rating_sum/rating_count from the Rating table; return the number of movies fixed"""
+    movies = Movie.objects.all() if movies is None else movies
+    movies = movies.order_by().annotate(
+        actual_sum=Sum('user_ratings__rating', default=0),
+        actual_count=Count('user_ratings'),
+    )
+    drifted = []
+    for movie in movies.only('pk', 'rating_sum', 'rating_count'):
+        if (movie.rating_sum, movie.rating_count) != (movie.actual_sum, movie.actual_count):
+            movie.rating_sum, movie.rating_count = movie.actual_sum, movie.actual_count
+            drifted.append(movie)
+    Movie.objects.bulk_update(drifted, ['rating_sum', 'rating_count'], batch_size=500)
+    return len(drifted)
+
+
+@receiver(post_save, sender=Rating)
+def update_rating_totals_on_save(sender, instance, created, **kwargs):
+    """Keep Movie.rating_sum/rating_count in step with a created or changed rating"""
+    movies = Movie.objects.filter(pk=instance.movie_id)
+    stored = getattr(instance, '_stored_rating', None)
+    if created:
+        movies.update(rating_sum=F('rating_sum') + instance.rating, rating_count=F('rating_count') + 1)
+    elif stored is None:
+        recalculate_rating_totals(movies)
+    elif stored != instance.rating:
+        movies.update(rating_sum=F('rating_sum') + (instance.rating - stored))
+    instance._stored_rating = instance.rating
+
+
+@receiver(post_delete, sender=Rating)
+def update_rating_totals_on_delete(sender, instance, **kwargs):
+    """Remove a deleted rating from Movie.rating_sum/rating_count"""
+    stored = getattr(instance, '_stored_rating', instance.rating)
+    Movie.objects.filter(pk=instance.movie_id).update(
+        rating_sum=F('rating_sum') - stored,
+        rating_count=F('rating_count') - 1,
+    )
+
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=UpcomingMovie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=UpcomingMovie)
+def queue_search_update(sender, instance, **kwargs):
+    """Bring the row's full-text search document up to date in the background"""
+    from .tasks import enqueue
+    label = sender._meta.label
+    enqueue('sync_search_document', {'model': label, 'pk': instance.pk}, key=f'search:{label}:{instance.pk}')
+
+
+
+@receiver(post_save, sender=Movie)
+def queue_content_similarity(sender, instance, created, **kwargs):
+    """Refresh the content neighbours of a movie whose description, cast or category changed"""
+    from .content import schedule_content_update
+    if created or instance.content_fields() != getattr(instance, '_stored_content', None):
+        schedule_content_update(instance.pk)
+    instance._stored_content = instance.content_fields()
+
+
+@receiver(post_delete, sender=Movie)
+def queue_content_removal(sender, instance, **kwargs):
+    """Drop a deleted movie's vector and refill the neighbour lists it was on"""
+    from .content import schedule_content_update
+    schedule_content_update(instance.pk)
+
+
+
+@receiver(post_save, sender=Movie)
+def sync_movie_cast(sender, instance, **kwargs):
+    """Keep the normalized cast in step with the free-text actors field"""
+    instance.sync_cast()
+
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_movie_fragments(sender, instance, **kwargs):
+    """Expire the list pages that show this movie"""
+    scopes = [all_movies_scope(), category_scope(instance.category_id)]
+    stored_category_id = getattr(instance, '_stored_category_id', None)
+    if stored_category_id is not None:
+        scopes.append(category_scope(stored_category_id))
+    bump_versions(*scopes)
+    instance._stored_category_id = instance.category_id
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_fragments(sender, instance, **kwargs):
+    """Expire the list pages that show the category"""
+    bump_versions(all_movies_scope(), category_scope(instance.pk), upcoming_scope())
+
+
+@receiver(post_save, sender=UpcomingMovie)
+@receiver(post_delete, sender=UpcomingMovie)
+def invalidate_upcoming_movies(sender, instance, **kwargs):
+    """Expire the cached upcoming movie listings"""
+    bump_versions(upcoming_scope())
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_rating_fragments(sender, instance, **kwargs):
+    """Expire the list pages whose cards show this movie's rating"""
+    if Rating.movie.is_cached(instance):
+        category_id = instance.movie.category_id
+    else:
+        category_id = Movie.objects.filter(pk=instance.movie_id).values_list('category_id', flat=True).first()
+    bump_versions(all_movies_scope(), category_scope(category_id))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_fragments(sender, instance, **kwargs):
+    """Expire the movie's cached review list"""
+    bump_versions(reviews_scope(instance.movie_id))
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=UpcomingMovie)
+def queue_poster_renditions(sender, instance, **kwargs):
+    """Resize a new or replaced poster in the background"""
+    schedule_renditions(instance.poster)
+
+
+@receiver(post_save, sender=UserProfile)
+def queue_profile_picture_renditions(sender, instance, **kwargs):
+    """Resize a new or replaced profile picture in the background"""
+    schedule_renditions(instance.profile_picture)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=Watchlist)
+@receiver(post_delete, sender=Watchlist)
+def queue_feed_rebuild(sender, instance, **kwargs):
+    """Rescore the user's "For You" feed after their ratings or watchlist change"""
+    from .feed import schedule_feed
+    schedule_feed(instance.user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def queue_feed_rebuild_for_genres(sender, instance, **kwargs):
+    """Rescore the user's "For You" feed when their favorite genres change"""
+    from .feed import schedule_feed
+    if instance.favorite_genres != getattr(instance, '_stored_favorite_genres', ''):
+        schedule_feed(instance.user_id)
+    instance._stored_favorite_genres = instance.favorite_genres
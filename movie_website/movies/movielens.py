@@ -0,0 +1,169 @@
+"""
+Bulk ingestion of MovieLens-style rating files.
+
+ratings.csv rows are ``userId,movieId,rating,timestamp``. Every MovieLens
+user becomes a site User named <prefix><userId> with an unusable password.
+MovieLens movie ids are matched to catalog movies by title and year, read
+from the dataset's movies.csv, or are taken to be Movie primary keys when
+no movies file is given. Ratings on the 0.5-5 half-star scale are rescaled
+linearly onto the site's 1-5 integer stars.
+
+The file is streamed in batches, one transaction each, written with
+INSERT ... ON CONFLICT (user, movie) DO UPDATE. The upsert keeps whichever of the
+stored and incoming ratings is newer, so re-running an import is harmless
+and never overwrites a rating made on the site since. The bulk writes skip
+the Rating signals; rating totals, list caches and the similar-movies table
+are refreshed once at the end instead.
+"""
+import csv
+import re
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .caching import all_movies_scope, bump_versions, category_scope
+from .models import Category, Movie, Rating, UserProfile, recalculate_rating_totals
+
+TITLE_YEAR = re.compile(r'^(.*?)\s*\((\d{4})\)\s*$')
+TRAILING_ARTICLE = re.compile(r'^(.*), (the|a|an|les|la|le|il|el|der|die|das)$', re.IGNORECASE)
+
+
+def rescale(value):
+    """Map a 0.5-5 MovieLens rating onto 1-5 integer stars (whole stars map to themselves)"""
+    value = float(value)
+    if not 0.5 <= value <= 5:
+        raise ValueError(f'rating {value} is outside 0.5-5')
+    return int(1 + (value - 0.5) * 4 / 4.5 + 0.5)
+
+
+def normalize_title(title):
+    """Split "Matrix, The (1999)" into ("the matrix", 1999)"""
+    year = None
+    match = TITLE_YEAR.match(title.strip())
+    if match:
+        title, year = match.group(1), int(match.group(2))
+    match = TRAILING_ARTICLE.match(title)
+    if match:
+        title = f'{match.group(2)} {match.group(1)}'
+    return ' '.join(title.casefold().split()), year
+
+
+def match_movies(stream):
+    """Read a MovieLens movies.csv and return {movieId: Movie pk} for titles found in the catalog"""
+    by_title_year, by_title = {}, {}
+    for pk, title, release_date in Movie.objects.values_list('pk', 'title', 'release_date').iterator():
+        name, year = normalize_title(title)
+        by_title_year[name, year or release_date.year] = pk
+        by_title.setdefault(name, set()).add(pk)
+
+    mapping = {}
+    for row in csv.DictReader(stream):
+        name, year = normalize_title(row['title'])
+        pk = by_title_year.get((name, year))
+        if pk is None and len(by_title.get(name, ())) == 1:
+            # A title the catalog holds only once, with a differing release year
+            pk = next(iter(by_title[name]))
+        if pk is not None:
+            mapping[int(row['movieId'])] = pk
+    return mapping
+
+
+class RatingsImporter:
+    """Stream rating rows into the Rating table; counters are available on the instance afterwards"""
+
+    def __init__(self, movie_ids=None, user_prefix='movielens_', batch_size=10000):
+        self.movie_ids = movie_ids
+        self.user_prefix = user_prefix
+        self.batch_size = batch_size
+        self.users = {}
+        self.rows = self.written = self.skipped = self.users_created = 0
+        self.elapsed = 0.0
+        if movie_ids is None:
+            self.known_movies = set(Movie.objects.values_list('pk', flat=True))
+
+    def movie_pk(self, movielens_id):
+        if self.movie_ids is None:
+            return movielens_id if movielens_id in self.known_movies else None
+        return self.movie_ids.get(movielens_id)
+
+    def resolve_users(self, movielens_ids):
+        """Fill self.users for the given MovieLens ids, creating the users that don't exist yet"""
+        missing = {f'{self.user_prefix}{ml_id}': ml_id for ml_id in movielens_ids if ml_id not in self.users}
+        if not missing:
+            return
+        for pk, username in User.objects.filter(username__in=list(missing)).values_list('pk', 'username'):
+            self.users[missing.pop(username)] = pk
+        if not missing:
+            return
+
+        # bulk_create skips the post_save signal that normally creates the profile
+        created = User.objects.bulk_create([
+            User(username=username, password=make_password(None)) for username in missing
+        ])
+        UserProfile.objects.bulk_create([UserProfile(user_id=user.pk) for user in created])
+        for user in created:
+            self.users[missing[user.username]] = user.pk
+        self.users_created += len(created)
+
+    def run(self, stream):
+        started = time.perf_counter()
+        reader = csv.reader(stream)
+        batch = []
+        for row in reader:
+            if reader.line_num == 1 and row and row[0] == 'userId':
+                continue
+            self.rows += 1
+            try:
+                user_id, movie_id, value = int(row[0]), int(row[1]), rescale(row[2])
+                timestamp = int(row[3]) if len(row) > 3 and row[3] else None
+            except (IndexError, ValueError):
+                self.skipped += 1
+                continue
+            movie_pk = self.movie_pk(movie_id)
+            if movie_pk is None:
+                self.skipped += 1
+                continue
+            batch.append((user_id, movie_pk, value, timestamp))
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        self.elapsed = time.perf_counter() - started
+        return self
+
+    def write_batch(self, batch):
+        now = timezone.now()
+        adapt = connection.ops.adapt_datetimefield_value
+        table = connection.ops.quote_name(Rating._meta.db_table)
+        with transaction.atomic():
+            self.resolve_users({user_id for user_id, _, _, _ in batch})
+            params = []
+            for user_id, movie_pk, value, timestamp in batch:
+                when = datetime.fromtimestamp(timestamp, dt_timezone.utc) if timestamp is not None else now
+                params.append((self.users[user_id], movie_pk, value, adapt(when), adapt(when)))
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {table} (user_id, movie_id, rating, created_at, updated_at) "
+                    "VALUES (%s, %s, %s, %s, %s) "
+                    "ON CONFLICT (user_id, movie_id) DO UPDATE "
+                    "SET rating = excluded.rating, updated_at = excluded.updated_at "
+                    f"WHERE excluded.updated_at >= {table}.updated_at",
+                    params,
+                )
+        self.written += len(batch)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def refresh_rating_aggregates():
+    """Bring rating totals and cached lists in line after a bulk load; return the number of movies fixed"""
+    fixed = recalculate_rating_totals()
+    bump_versions(all_movies_scope(), *(category_scope(pk) for pk in Category.objects.values_list('pk', flat=True)))
+    return fixed
@@ -0,0 +1,220 @@
+"""
+Keyset (cursor) pagination.
+
+Paginator runs COUNT(*) and then OFFSET n, so page n costs a scan of every
+row before it. CursorPaginator instead remembers the ordering values of the
+first and last row on a page and asks for the rows strictly before or after
+them, which an index on the ordering columns answers directly at any depth.
+
+Cursors are opaque URL-safe tokens carrying those values, the direction and
+the page number. Pages expose the same has_next / has_previous / number /
+paginator interface templates use with Django's Page, plus next_cursor and
+previous_cursor for building links. The total count is optional and only
+queried when a template actually asks for it.
+"""
+import base64
+import binascii
+import json
+from functools import cached_property
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, direction, number):
+    # isoformat() keeps the microseconds DjangoJSONEncoder would round away
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    payload = json.dumps({'v': values, 'd': direction, 'n': number}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (values, direction, number) from a token, raising InvalidCursor if it is malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        values, direction, number = payload['v'], payload['d'], int(payload['n'])
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise InvalidCursor(token)
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list) or number < 1:
+        raise InvalidCursor(token)
+    return values, direction, number
+
+
+def keyset_filter(ordering, values, forward):
+    """
+    Q matching the rows that sort after (or, going back, before) the given values.
+
+    For ordering (a, b, c) this is a > x OR (a = x AND b > y) OR
+    (a = x AND b = y AND c > z), with the comparison flipped for descending
+    fields.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') == forward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class CursorPage:
+    """One page of a CursorPaginator, template-compatible with django.core.paginator.Page"""
+
+    def __init__(self, object_list, number, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return f'<Page {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return ''
+        return encode_cursor(self.paginator.position(self.object_list[-1]), NEXT, self.number + 1)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return ''
+        return encode_cursor(self.paginator.position(self.object_list[0]), PREVIOUS, self.number - 1)
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset by keyset on the given ordering.
+
+    The last ordering field must be unique (normally the primary key) so
+    every row has a distinct position. Pass with_count=False to drop the
+    COUNT(*) entirely; otherwise it runs lazily when count or num_pages is
+    read. The default comes from the PAGINATION_COUNTS setting.
+    """
+
+    def __init__(self, queryset, per_page, ordering, with_count=None):
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.with_count = getattr(settings, 'PAGINATION_COUNTS', True) if with_count is None else with_count
+
+    @cached_property
+    def count(self):
+        if not self.with_count:
+            return None
+        return self.queryset.count()
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, -(-self.count // self.per_page))
+
+    def position(self, obj):
+        """Ordering values of a row, as stored in cursors"""
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def _to_python(self, values):
+        model = self.queryset.model
+        converted = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            try:
+                model_field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations come back from the database as plain JSON values
+                converted.append(value)
+                continue
+            converted.append(None if value is None else model_field.to_python(value))
+        return converted
+
+    def _window(self, cursor):
+        """The rows to fetch for a cursor (one more than a page), its page number and direction"""
+        if not cursor:
+            return self.queryset[:self.per_page + 1], 1, True
+
+        values, direction, number = decode_cursor(cursor)
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        try:
+            values = self._to_python(values)
+        except ValidationError as exc:
+            raise InvalidCursor(cursor) from exc
+
+        forward = direction == NEXT
+        queryset = self.queryset.filter(keyset_filter(self.ordering, values, forward))
+        if not forward:
+            queryset = queryset.reverse()
+        return queryset[:self.per_page + 1], number, forward
+
+    def _page(self, rows, number, forward, from_cursor):
+        """Build the page from the fetched rows; None when walking back reached the first page"""
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if forward:
+            return CursorPage(rows, number, self, from_cursor, more)
+        if not more:
+            return None
+        rows.reverse()
+        return CursorPage(rows, number, self, True, True)
+
+    def page(self, cursor=None):
+        """Page following (or preceding) the cursor, or the first page without one"""
+        window, number, forward = self._window(cursor)
+        page = self._page(list(window), number, forward, bool(cursor))
+        # None: walked back to the start, so serve a full first page instead
+        return self.page() if page is None else page
+
+    async def apage(self, cursor=None):
+        """page() for async views"""
+        window, number, forward = self._window(cursor)
+        page = self._page([row async for row in window], number, forward, bool(cursor))
+        return await self.apage() if page is None else page
+
+    def get_page(self, cursor=None):
+        """Like page() but falls back to the first page for malformed or stale cursors"""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+    async def aget_page(self, cursor=None):
+        """get_page() for async views"""
+        try:
+            return await self.apage(cursor)
+        except InvalidCursor:
+            return await self.apage()
@@ -0,0 +1,221 @@
+"""
+Query plan audit of the hot pages.
+
+audit() requests the busiest pages through the test client, records every
+SELECT they run with CaptureQueriesContext and has SQLite EXPLAIN QUERY
+PLAN each one. It flags the two shapes that grow with the table rather
+than with the page:
+
+- a full table scan (SCAN <table> without an index)
+- a temporary B-tree built to sort or group the rows (USE TEMP B-TREE)
+
+A walk along an index in order (SCAN ... USING INDEX) is what the
+newest-first lists want, so each page names the tables it may walk that
+way. Tables whose size doesn't grow with the catalogue (SMALL_TABLES) may
+be scanned anywhere. A sort over rows found by a whole unique key is a sort
+of a row or two and isn't flagged; the few queries that read past the page
+on purpose are listed in ACCEPTED with the reason, and reported apart.
+
+The pages are rendered without the cache, so fragments can't hide their
+queries, and against a throwaway copy of the default database made with
+SQLite's backup API. The sessions and queued tasks the pages write land in
+the copy, and the audit never holds a write lock on the live database
+(atomic() takes it at BEGIN in IMMEDIATE mode), so it is safe to run
+against the primary in production.
+"""
+import os
+import re
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import Category, Movie, Watchlist
+
+SMALL_TABLES = {'movies_category', 'movies_trendingrank'}
+# Queries that read past the page on purpose, found by a fragment of their SQL
+ACCEPTED = {
+    'ORDER BY (("movies_movie"."rating_sum" + ': 'popular movies rank the whole catalogue, cached for everyone',
+    'COUNT("movies_moviecast"."id") AS "shared_cast"': "cast fallback groups over the films of one movie's cast",
+}
+NEXT_CURSOR = re.compile(r'(?:cursor=|"next": ?")([\w-]+)')
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class AuditError(ValueError):
+    pass
+
+
+def hot_pages(movie, category):
+    """
+    [(name, path, signed in, tables it may scan along an index, follow next)] around a sample movie.
+
+    Lists marked to follow are audited again on the page their own next
+    link points to, so keyset pages are checked with a real cursor.
+    """
+    home, upcoming, api = reverse('home'), reverse('upcoming_movies'), reverse('api_movie_list')
+    detail = reverse('movie_detail', args=[movie.pk])
+    return [
+        ('home', home, False, {'movies_movie'}, True),
+        ('home for a user', home, True, {'movies_movie'}, False),
+        ('category', reverse('movies_by_category', args=[category]), False, set(), True),
+        ('upcoming', upcoming, False, {'movies_upcomingmovie'}, True),
+        ('upcoming category', f'{upcoming}?category={category}', False, set(), True),
+        ('movie detail', detail, False, set(), False),
+        ('movie detail reviews page', f'{detail}?reviews_page=2', True, set(), False),
+        ('watchlist', reverse('watchlist'), True, set(), False),
+        ('profile', reverse('profile'), True, set(), False),
+        ('api movie list', api, False, {'movies_movie'}, True),
+        ('api movie list category', f'{api}?category={category}', False, set(), True),
+    ]
+
+
+def query_plan(sql, params=()):
+    """The detail column of EXPLAIN QUERY PLAN for a statement"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def unique_indexes():
+    """{index name: number of columns} for the unique indexes of the database"""
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        indexes = {}
+        for table in tables:
+            for _, name, unique, *_ in cursor.execute(f'PRAGMA index_list("{table}")').fetchall():
+                if unique:
+                    indexes[name] = len(cursor.execute(f'PRAGMA index_info("{name}")').fetchall())
+    return indexes
+
+
+def keyed(step, unique):
+    """Whether a plan step looks rows up by a whole primary or unique key, so finds at most a few"""
+    if not step.startswith('SEARCH '):
+        return False
+    if ' USING INTEGER PRIMARY KEY ' in step:
+        return True
+    match = re.search(r' INDEX (\w+) \((.*)\)$', step)
+    return bool(match) and match[2].count('=?') == unique.get(match[1])
+
+
+def plan_problems(plan, index_scans=(), unique=None):
+    """
+    The steps of a plan that scan a whole table or sort in a temporary B-tree.
+
+    A temporary B-tree is left alone when it only sorts ties of an index
+    order (RIGHT PART OF ORDER BY), or when the rows come from a lookup by
+    key (unique: the unique indexes, see unique_indexes()).
+    """
+    problems = []
+    by_key = bool(plan) and keyed(plan[0], unique or {})
+    for step in plan:
+        if step.startswith('USE TEMP B-TREE'):
+            if not by_key and 'RIGHT PART' not in step:
+                problems.append(step)
+        elif step.startswith('SCAN '):
+            table = step.split()[1]
+            if table in SMALL_TABLES:
+                continue
+            if ' INDEX ' not in step or table not in index_scans:
+                problems.append(step)
+    return problems
+
+
+def page_selects(client, path):
+    """The SELECT statements a page runs, and the response"""
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(path)
+    if response.status_code != 200:
+        raise AuditError(f'{path} answered {response.status_code}')
+    return response, [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+
+
+def next_page(path, response):
+    """The path of the page a list's next link points to, or None on its last page"""
+    # The first page has no previous link, so the first cursor is the next one
+    match = NEXT_CURSOR.search(response.content.decode())
+    if match is None:
+        return None
+    return f"{path}{'&' if '?' in path else '?'}cursor={match[1]}"
+
+
+@contextmanager
+def database_copy():
+    """Serve the default alias from a temporary copy of the database for the duration"""
+    original = connections[DEFAULT_DB_ALIAS]
+    if original.in_atomic_block:
+        # The backup would wait for this connection's own transaction to end
+        raise AuditError('The audit copies the database, which it cannot do inside a transaction')
+    handle, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(handle)
+    original.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        original.connection.backup(target)
+    finally:
+        target.close()
+    copy = type(original)({**original.settings_dict, 'NAME': path}, DEFAULT_DB_ALIAS)
+    connections[DEFAULT_DB_ALIAS] = copy
+    try:
+        yield
+    finally:
+        copy.close()
+        connections[DEFAULT_DB_ALIAS] = original
+        os.remove(path)
+
+
+def accepted(sql):
+    return next((reason for fragment, reason in ACCEPTED.items() if fragment in sql), '')
+
+
+def audit():
+    """
+    [(page, [(sql, plan, problems, accepted)])] for every hot page, from the default database.
+
+    accepted is why the problems of a query in ACCEPTED are expected, '' for
+    every other query.
+
+    The pages are built around the most reviewed movie, the biggest
+    category and a user with a watchlist, so their lists run past one page.
+    Raises AuditError when the database isn't SQLite or has no movie, when
+    called inside a transaction, or when a page doesn't render.
+    """
+    if connection.vendor != 'sqlite':
+        raise AuditError('The audit reads SQLite query plans')
+    movie = Movie.objects.annotate(n=Count('reviews')).order_by('-n', 'pk').first()
+    if movie is None:
+        raise AuditError('No movie to audit the pages with')
+    category = Category.objects.annotate(n=Count('movies')).order_by('-n', 'pk').first()
+    watcher = Watchlist.objects.order_by('pk').values_list('user', flat=True).first()
+    user = User.objects.get(pk=watcher or movie.added_by_id)
+    # The test client's host, as the test runner would allow it
+    hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+    results = []
+    # Reads stay on the copy rather than going to a replica
+    with override_settings(CACHES=NO_CACHE, ALLOWED_HOSTS=hosts, DATABASE_REPLICAS=[]), database_copy():
+        unique = unique_indexes()
+        anonymous, signed_in = Client(), Client()
+        signed_in.force_login(user)
+        for name, path, login, index_scans, follow in hot_pages(movie, category.pk):
+            client = signed_in if login else anonymous
+            pages = [(name, path)]
+            while pages:
+                name, path = pages.pop()
+                response, selects = page_selects(client, path)
+                results.append((name, [
+                    (sql, plan, plan_problems(plan, index_scans, unique), accepted(sql))
+                    for sql, plan in ((sql, query_plan(sql)) for sql in selects)
+                ]))
+                following = next_page(path, response) if follow else None
+                if following:
+                    pages.append((f'{name} next page', following))
+                    follow = False
+    return results
@@ -0,0 +1,291 @@
+"""
+Item-item collaborative filtering built from the Rating table.
+
+Ratings are loaded into a sparse users x movies matrix and the top-K most
+similar movies for every movie are computed offline with vectorized sparse
+products, then stored in MovieSimilarity so the detail page only needs a
+single indexed lookup.
+
+Between full rebuilds, IncrementalSimilarity keeps the raw co-occurrence
+state (per-pair dot products and per-movie squared norms) in memory and
+absorbs the RatingChange log written by the Rating signals, refreshing only
+the neighbour lists a change actually touches.
+"""
+import heapq
+import math
+from collections import defaultdict
+from operator import itemgetter
+
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Movie, MovieSimilarity, Rating, RatingChange
+
+DEFAULT_NEIGHBOURS = 20
+CHUNK_SIZE = 1000
+SIMILARITY_METHODS = ('cosine', 'adjusted')
+
+
+def build_rating_matrix(user_ids, movie_ids, ratings):
+    """Build a sparse users x movies matrix and the movie id of every column"""
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    ratings = np.asarray(ratings, dtype=np.float32)
+
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    movies, movie_index = np.unique(movie_ids, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (ratings, (user_index, movie_index)),
+        shape=(len(users), len(movies)),
+    )
+    return matrix, movies
+
+
+def _normalized_columns(matrix, method):
+    """Centre rows (for adjusted cosine) and scale every column to unit length"""
+    matrix = matrix.tocsr().astype(np.float32, copy=True)
+
+    if method == 'adjusted':
+        counts = np.diff(matrix.indptr)
+        sums = np.asarray(matrix.sum(axis=1)).ravel()
+        means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+        matrix.data -= np.repeat(means, counts).astype(np.float32)
+        matrix.eliminate_zeros()
+    elif method != 'cosine':
+        raise ValueError(f"Unknown similarity method: {method}")
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (matrix @ sparse.diags(inverse.astype(np.float32))).tocsc()
+
+
+def top_k_neighbours(matrix, k=DEFAULT_NEIGHBOURS, method='cosine', chunk_size=CHUNK_SIZE):
+    """
+    Return (neighbours, scores) arrays of shape (n_movies, k).
+
+    Row i holds the column indexes of the k movies most similar to column i,
+    best first. Slots without a positively similar movie are -1 / 0.0.
+    Similarities are computed a block of columns at a time so memory stays
+    bounded by chunk_size x n_movies.
+    """
+    n_movies = matrix.shape[1]
+    k = max(0, min(k, n_movies - 1))
+    neighbours = np.full((n_movies, k), -1, dtype=np.int64)
+    scores = np.zeros((n_movies, k), dtype=np.float32)
+    if k == 0:
+        return neighbours, scores
+
+    normalized = _normalized_columns(matrix, method)
+    transposed = normalized.T.tocsr()
+
+    for start in range(0, n_movies, chunk_size):
+        stop = min(start + chunk_size, n_movies)
+        block = (transposed[start:stop] @ normalized).toarray()
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = -np.inf
+
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        positive = top_scores > 0
+        neighbours[start:stop] = np.where(positive, top, -1)
+        scores[start:stop] = np.where(positive, top_scores, 0.0)
+
+    return neighbours, scores
+
+
+def movies_sharing_cast(movie, limit=6):
+    """Movies with the most actors in common with this one, for titles without rating neighbours"""
+    return list(
+        Movie.objects.filter(cast_credits__actor__credits__movie=movie)
+        .exclude(pk=movie.pk)
+        .annotate(shared_cast=Count('cast_credits'))
+        .order_by('-shared_cast', '-created_at')[:limit]
+    )
+
+
+def load_ratings():
+    """Return (user_ids, movie_ids, ratings) arrays for every Rating row"""
+    rows = np.array(
+        list(Rating.objects.order_by().values_list('user_id', 'movie_id', 'rating')),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    return rows[:, 0], rows[:, 1], rows[:, 2]
+
+
+def similarity_rows(movie_ids, neighbours, scores):
+    """Turn neighbour arrays into unsaved MovieSimilarity instances"""
+    for row, movie_id in enumerate(movie_ids):
+        for column, score in zip(neighbours[row], scores[row]):
+            if column < 0:
+                break
+            yield MovieSimilarity(
+                movie_id=int(movie_id),
+                similar_movie_id=int(movie_ids[column]),
+                score=float(score),
+            )
+
+
+def rebuild_similar_movies(k=DEFAULT_NEIGHBOURS, method='cosine', batch_size=5000):
+    """Recompute every movie's neighbours from scratch and replace the stored table"""
+    user_ids, movie_ids, ratings = load_ratings()
+    matrix, columns = build_rating_matrix(user_ids, movie_ids, ratings)
+    neighbours, scores = top_k_neighbours(matrix, k=k, method=method)
+
+    with transaction.atomic():
+        MovieSimilarity.objects.all().delete()
+        created = MovieSimilarity.objects.bulk_create(
+            similarity_rows(columns, neighbours, scores),
+            batch_size=batch_size,
+        )
+    return len(created)
+
+
+class IncrementalSimilarity:
+    """
+    Cosine item-item state that can absorb one rating change at a time.
+
+    dots[a][b] is the sum over users of rating(a) * rating(b) and squares[a]
+    the sum of rating(a) ** 2, so a single change only touches the pairs
+    formed with the other movies the same user has rated.
+    """
+
+    def __init__(self, k=DEFAULT_NEIGHBOURS):
+        self.k = k
+        self.user_ratings = defaultdict(dict)
+        self.dots = defaultdict(dict)
+        self.squares = defaultdict(int)
+
+    @classmethod
+    def from_ratings(cls, user_ids, movie_ids, ratings, k=DEFAULT_NEIGHBOURS):
+        """Bootstrap the state from full rating arrays"""
+        state = cls(k=k)
+        if len(ratings) == 0:
+            return state
+
+        matrix, columns = build_rating_matrix(user_ids, movie_ids, ratings)
+        matrix = matrix.astype(np.int64)
+        cooccurrence = (matrix.T @ matrix).tocoo()
+        for row, column, value in zip(cooccurrence.row, cooccurrence.col, cooccurrence.data):
+            movie, other = int(columns[row]), int(columns[column])
+            if movie == other:
+                state.squares[movie] = int(value)
+            elif value:
+                state.dots[movie][other] = int(value)
+
+        for user_id, movie_id, rating in zip(user_ids, movie_ids, ratings):
+            state.user_ratings[int(user_id)][int(movie_id)] = int(rating)
+        return state
+
+    def apply(self, user_id, movie_id, rating):
+        """Set user's rating of movie (None removes it); return the movies whose neighbours changed"""
+        rated = self.user_ratings[user_id]
+        old = rated.get(movie_id, 0)
+        new = rating or 0
+        if old == new:
+            return set()
+
+        affected = {movie_id} | set(self.dots[movie_id])
+        delta = new - old
+        for other, other_rating in rated.items():
+            if other == movie_id:
+                continue
+            value = self.dots[movie_id].get(other, 0) + delta * other_rating
+            if value:
+                self.dots[movie_id][other] = value
+                self.dots[other][movie_id] = value
+            else:
+                self.dots[movie_id].pop(other, None)
+                self.dots[other].pop(movie_id, None)
+            affected.add(other)
+
+        self.squares[movie_id] += new * new - old * old
+        if not self.squares[movie_id]:
+            del self.squares[movie_id]
+        if new:
+            rated[movie_id] = new
+        else:
+            rated.pop(movie_id, None)
+        return affected
+
+    def neighbours(self, movie_id):
+        """Top-K (movie id, cosine score) pairs for a movie, best first"""
+        norm = math.sqrt(self.squares.get(movie_id, 0))
+        if not norm:
+            return []
+        scored = (
+            (other, dot / (norm * math.sqrt(self.squares[other])))
+            for other, dot in self.dots.get(movie_id, {}).items()
+            if dot > 0
+        )
+        return heapq.nlargest(self.k, scored, key=itemgetter(1))
+
+    def _similarity_objects(self, movie_ids, existing=None):
+        rows = {movie_id: self.neighbours(movie_id) for movie_id in movie_ids}
+        if existing is None:
+            referenced = set(rows) | {other for pairs in rows.values() for other, _ in pairs}
+            existing = set(Movie.objects.filter(pk__in=referenced).values_list('pk', flat=True))
+        return [
+            MovieSimilarity(movie_id=movie_id, similar_movie_id=other, score=score)
+            for movie_id, pairs in rows.items() if movie_id in existing
+            for other, score in pairs if other in existing
+        ]
+
+    def save_neighbours(self, movie_ids):
+        """Replace the stored neighbour lists of the given movies"""
+        movie_ids = set(movie_ids)
+        if not movie_ids:
+            return 0
+
+        objects = self._similarity_objects(movie_ids)
+        with transaction.atomic():
+            MovieSimilarity.objects.filter(movie_id__in=movie_ids).delete()
+            MovieSimilarity.objects.bulk_create(objects, batch_size=5000)
+        return len(objects)
+
+    def save_all_neighbours(self):
+        """Rewrite the whole stored table from the current state"""
+        existing = set(Movie.objects.values_list('pk', flat=True))
+        objects = self._similarity_objects(list(self.squares), existing)
+        with transaction.atomic():
+            MovieSimilarity.objects.all().delete()
+            MovieSimilarity.objects.bulk_create(objects, batch_size=5000)
+        return len(objects)
+
+
+def bootstrap_incremental_state(k=DEFAULT_NEIGHBOURS):
+    """
+    Load the current ratings into an IncrementalSimilarity.
+
+    Log entries already reflected in the snapshot are discarded; anything
+    logged afterwards is replayed by process_rating_changes. Replaying a
+    change the snapshot already contains is a no-op, so the race between
+    reading the log and reading the ratings is harmless.
+    """
+    with transaction.atomic():
+        last_change = RatingChange.objects.order_by('-pk').values_list('pk', flat=True).first()
+        state = IncrementalSimilarity.from_ratings(*load_ratings(), k=k)
+    if last_change is not None:
+        RatingChange.objects.filter(pk__lte=last_change).delete()
+    return state
+
+
+def process_rating_changes(state, batch_size=1000):
+    """Apply pending RatingChange rows to the state and persist the affected neighbour lists"""
+    changes = list(RatingChange.objects.order_by('pk')[:batch_size])
+    if not changes:
+        return 0
+
+    affected = set()
+    for change in changes:
+        affected |= state.apply(change.user_id, change.movie_id, change.rating)
+
+    with transaction.atomic():
+        state.save_neighbours(affected)
+        RatingChange.objects.filter(pk__lte=changes[-1].pk).delete()
+    return len(changes)
@@ -0,0 +1,134 @@
+"""
+Read replica routing.
+
+settings.DATABASE_REPLICAS lists the aliases holding read-only copies of
+'default', the primary. While ReplicaMiddleware serves a GET or HEAD request
+for one of the views in movies.urls.replica_views, that request's reads go
+to one replica, chosen at random. Everything else reads from the primary:
+
+- other views
+- management commands and the task worker
+- sessions and users, so a lagging replica can never sign anybody out
+- the task queue, which reads back the rows it has just inserted
+
+Writes always go to the primary. The first write in a request, other than
+to a session, user or task, moves the rest of that request's reads there
+too. Pages queue feed and rendition tasks while rendering; that is
+bookkeeping, not a change the user would look for, so it pins nobody.
+
+Read-your-writes: the response to a request that wrote, or that used an
+unsafe method, sets a cookie that keeps the browser on the primary for
+REPLICA_PIN_SECONDS. The unsafe-method rule covers the rating and watchlist
+endpoints, whose write buffer writes after the response. As long as the
+replicas lag by less than that, users always see their own rating, review
+or watchlist change, while everyone else sees it once it is replicated.
+
+Cached fragments and list ETags derive from scope versions bumped on the
+primary, which a lagging replica may not reflect yet; caching.py keeps
+what a replica rendered apart, and briefly (see source_key).
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PIN_COOKIE = 'read_primary'
+PRIMARY_APPS = {'auth', 'sessions'}
+PRIMARY_MODELS = {'movies.task'}
+SAFE_METHODS = ('GET', 'HEAD')
+
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+class RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica = None
+        self.wrote = False
+
+
+def on_primary(model):
+    """Whether a model is always read from the primary, and writing it leaves the request where it is"""
+    return model._meta.app_label in PRIMARY_APPS or model._meta.label_lower in PRIMARY_MODELS
+
+
+def current_replica():
+    """The replica the current request reads from, or None when it reads the primary"""
+    state = _request_state.get()
+    return None if state is None else state.replica
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state.replica is None or on_primary(model):
+            return 'default'
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and not on_primary(model):
+            state.wrote = True
+            state.replica = None
+        # Explicit, or saving an instance read from a replica would write there
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {'default', *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def get_replica_views():
+    from .urls import replica_views
+    return replica_views
+
+
+class ReplicaMiddleware:
+    """Choose the database a request reads from, and pin browsers that wrote to the primary"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = RequestState(PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(request, response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request_state.get()
+        if (state is not None and replicas() and not state.pinned and not state.wrote
+                and request.method in SAFE_METHODS and request.resolver_match.url_name in get_replica_views()):
+            state.replica = random.choice(replicas())
+
+    def finish(self, request, response, state):
+        if replicas() and (state.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
@@ -0,0 +1,274 @@
+"""
+Full-text search over movies and upcoming movies.
+
+On SQLite each kind of document has its own FTS5 virtual table
+(``movies_search_movie``, ``movies_search_upcomingmovie``) whose rowid is the
+object's primary key, so replacing or removing a document is a rowid lookup.
+PostgreSQL keeps them in a single ``movies_search`` tsvector table keyed by
+(kind, object_id) with a GIN index. Both backends expose the same
+index/remove/search interface and are kept in sync by the Movie and
+UpcomingMovie signal handlers. Other databases fall back to the old
+icontains scan.
+"""
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Case, Q, Value, When
+
+SEARCH_TABLE = 'movies_search'
+SEARCH_LIMIT = 1000
+SEARCH_FIELDS = ('title', 'description', 'actors')
+SEARCH_KINDS = ('movie', 'upcomingmovie')
+
+SQLITE_CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+    "title, description, actors, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+POSTGRES_CREATE_TABLE = (
+    f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+    "kind varchar(16) NOT NULL, object_id bigint NOT NULL, document tsvector NOT NULL, "
+    "PRIMARY KEY (kind, object_id))"
+)
+POSTGRES_CREATE_INDEX = (
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)"
+)
+# Title matches weigh most, then cast, then description
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(%s, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(%s, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(%s, '')), 'B')"
+)
+
+
+def search_terms(query):
+    """Split a free-text query into lowercase word tokens"""
+    return re.findall(r'\w+', query.lower())
+
+
+def document_kind(model):
+    """Identifier of a model's documents: the kind column, or the SQLite table suffix"""
+    return model._meta.model_name
+
+
+def sqlite_table(kind):
+    return f'{SEARCH_TABLE}_{kind}'
+
+
+class SearchBackend:
+    """Maintains and queries the search documents stored in one database"""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def restriction(self, column, within):
+        """SQL and params keeping column among the primary keys of the queryset within, if given"""
+        if within is None:
+            return '', []
+        sql, params = within.order_by().values('pk').query.get_compiler(self.using).as_sql()
+        return f' AND {column} IN ({sql})', list(params)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 virtual table per kind ranked with bm25"""
+
+    def create_table(self, cursor):
+        for kind in SEARCH_KINDS:
+            cursor.execute(SQLITE_CREATE_TABLE.format(table=sqlite_table(kind)))
+
+    def drop_table(self, cursor):
+        for kind in SEARCH_KINDS:
+            cursor.execute(f"DROP TABLE IF EXISTS {sqlite_table(kind)}")
+
+    def match_expression(self, query):
+        """Every term must match, each as a quoted prefix so user input can't inject FTS syntax"""
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def index(self, obj):
+        table = sqlite_table(document_kind(type(obj)))
+        with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [obj.pk])
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, title, description, actors) VALUES (%s, %s, %s, %s)",
+                [obj.pk] + [getattr(obj, field) for field in SEARCH_FIELDS],
+            )
+
+    def index_new(self, objects):
+        """Add documents for freshly inserted rows, one statement per kind"""
+        documents = {}
+        for obj in objects:
+            documents.setdefault(document_kind(type(obj)), []).append(
+                [obj.pk] + [getattr(obj, field) for field in SEARCH_FIELDS]
+            )
+        with self.connection.cursor() as cursor:
+            for kind, rows in documents.items():
+                cursor.executemany(
+                    f"INSERT INTO {sqlite_table(kind)} (rowid, title, description, actors) VALUES (%s, %s, %s, %s)",
+                    rows,
+                )
+
+    def remove(self, model, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {sqlite_table(document_kind(model))} WHERE rowid = %s", [pk])
+
+    def search(self, model, query, limit=SEARCH_LIMIT, within=None):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        table = sqlite_table(document_kind(model))
+        restriction, params = self.restriction('rowid', within)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {table} WHERE {table} MATCH %s{restriction} "
+                f"ORDER BY bm25({table}, 10.0, 1.0, 5.0) LIMIT %s",
+                [expression, *params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rebuild(self, model):
+        table = sqlite_table(document_kind(model))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, title, description, actors) "
+                f"SELECT id, title, description, actors FROM {model._meta.db_table}"
+            )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Weighted tsvector documents ranked with ts_rank"""
+
+    def create_table(self, cursor):
+        cursor.execute(POSTGRES_CREATE_TABLE)
+        cursor.execute(POSTGRES_CREATE_INDEX)
+
+    def drop_table(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def match_expression(self, query):
+        return ' & '.join(f'{term}:*' for term in search_terms(query))
+
+    def index(self, obj):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (kind, object_id, document) "
+                f"VALUES (%s, %s, {POSTGRES_DOCUMENT}) "
+                "ON CONFLICT (kind, object_id) DO UPDATE SET document = EXCLUDED.document",
+                [document_kind(type(obj)), obj.pk] + [getattr(obj, field) for field in SEARCH_FIELDS],
+            )
+
+    def index_new(self, objects):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (kind, object_id, document) "
+                f"VALUES (%s, %s, {POSTGRES_DOCUMENT}) ON CONFLICT (kind, object_id) DO NOTHING",
+                [[document_kind(type(obj)), obj.pk] + [getattr(obj, field) for field in SEARCH_FIELDS]
+                 for obj in objects],
+            )
+
+    def remove(self, model, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s AND object_id = %s",
+                [document_kind(model), pk],
+            )
+
+    def search(self, model, query, limit=SEARCH_LIMIT, within=None):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        restriction, params = self.restriction('object_id', within)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT object_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+                f"WHERE kind = %s AND document @@ query{restriction} "
+                "ORDER BY ts_rank(document, query) DESC LIMIT %s",
+                [expression, document_kind(model), *params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rebuild(self, model):
+        kind = document_kind(model)
+        document = POSTGRES_DOCUMENT % SEARCH_FIELDS
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s", [kind])
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (kind, object_id, document) "
+                f"SELECT %s, id, {document} FROM {model._meta.db_table}",
+                [kind],
+            )
+
+
+class IContainsSearchBackend(SearchBackend):
+    """Substring scan for databases without a full-text backend"""
+
+    def create_table(self, cursor):
+        pass
+
+    def drop_table(self, cursor):
+        pass
+
+    def index(self, obj):
+        pass
+
+    def index_new(self, objects):
+        pass
+
+    def remove(self, model, pk):
+        pass
+
+    def search(self, model, query, limit=SEARCH_LIMIT, within=None):
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': query})
+        matches = (model._default_manager if within is None else within).using(self.using).filter(condition)
+        return list(matches.values_list('pk', flat=True)[:limit])
+
+    def rebuild(self, model):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    """Search backend for the documents in the database with the given alias"""
+    return BACKENDS.get(connections[using].vendor, IContainsSearchBackend)(using)
+
+
+def search_queryset(queryset, query, limit=SEARCH_LIMIT):
+    """
+    Restrict a queryset to full-text matches, best match first.
+
+    The match position is annotated as search_rank (0 for the best match) so
+    callers can paginate on it. The index query itself is restricted to a
+    filtered queryset's rows, so filter first: the limit then counts only
+    the matches the caller can show.
+    """
+    return ranked(queryset, get_backend(queryset.db).search(queryset.model, query, limit, within(queryset)))
+
+
+async def asearch_queryset(queryset, query, limit=SEARCH_LIMIT):
+    """search_queryset() for async views, which must not query the index from the event loop"""
+    backend = get_backend(queryset.db)
+    return ranked(queryset, await sync_to_async(backend.search)(queryset.model, query, limit, within(queryset)))
+
+
+def within(queryset):
+    """The queryset as a restriction on the index query, or None when it holds every row"""
+    return queryset if queryset.query.has_filters() else None
+
+
+def ranked(queryset, ids):
+    """The queryset's rows among ids, annotated with their position as search_rank"""
+    if not ids:
+        return queryset.annotate(search_rank=Value(0)).none()
+    relevance = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)])
+    return queryset.filter(pk__in=ids).annotate(search_rank=relevance).order_by('search_rank')
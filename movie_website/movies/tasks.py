@@ -0,0 +1,223 @@
+"""
+A small database-backed task queue.
+
+Work that doesn't have to finish before the response is sent, such as
+encoding image renditions or refreshing search documents, is stored as a
+Task row in the same transaction as the change that needs it, and executed
+by ``manage.py run_tasks``. Workers claim tasks with a conditional UPDATE,
+so any number of them can share the table on SQLite or PostgreSQL.
+
+A task that raises is retried with exponential backoff until it runs out of
+attempts. Tasks may carry an idempotency key: while a task with that key is
+still pending, enqueueing it again is a no-op. Task functions therefore
+read the current state of the database rather than trusting the payload to
+describe it, so one run covers every change queued before it started.
+A task body isn't run in a transaction: it opens short ones around the
+writes that belong together, so its slow work doesn't hold the write lock.
+
+With TASK_QUEUE_EAGER = True tasks run immediately inside enqueue(), which
+the tests use.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger('movies.tasks')
+
+RETRY_DELAY = 10  # seconds before the first retry, doubling after every failure
+STALE_AFTER = timedelta(minutes=10)
+
+registry = {}
+
+
+def task(name):
+    """Register a function as the task called name"""
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload, key=None, delay=0):
+    """Queue a task, returning the Task row (or the pending one with the same key)"""
+    if name not in registry:
+        raise KeyError(f"Unknown task: {name}")
+    if getattr(settings, 'TASK_QUEUE_EAGER', False):
+        registry[name](**payload)
+        return None
+    task = Task(name=name, payload=payload, key=key, run_after=timezone.now() + timedelta(seconds=delay))
+    if key is None:
+        task.save()
+        return task
+    # Skipped by the database when a task with the same key is already pending
+    Task.objects.bulk_create([task], ignore_conflicts=True)
+    return Task.objects.filter(key=key, status=Task.PENDING).first()
+
+
+def claim_next():
+    """Mark the oldest due task as running and return it, or None when nothing is due"""
+    now = timezone.now()
+    candidates = Task.objects.filter(status=Task.PENDING, run_after__lte=now).order_by('run_after', 'pk')
+    for pk in candidates.values_list('pk', flat=True)[:10]:
+        claimed = Task.objects.filter(pk=pk, status=Task.PENDING).update(
+            status=Task.RUNNING, started_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def _set_pending(task, **fields):
+    """Put a task back in the queue unless a newer pending copy already covers it"""
+    try:
+        with transaction.atomic():
+            Task.objects.filter(pk=task.pk).update(status=Task.PENDING, **fields)
+    except IntegrityError:
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.DONE, finished_at=timezone.now(), last_error='Superseded by a newer pending task',
+        )
+
+
+def run_task(task):
+    """Execute a claimed task and record the outcome; return True on success"""
+    func = registry.get(task.name)
+    try:
+        if func is None:
+            raise KeyError(f"Unknown task: {task.name}")
+        # Not in one transaction: with BEGIN IMMEDIATE that would hold the
+        # write lock through a task's slow work, so tasks wrap their writes
+        func(**task.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            Task.objects.filter(pk=task.pk).update(status=Task.FAILED, finished_at=timezone.now(), last_error=error)
+            logger.error('Task %s #%d failed after %d attempts\n%s', task.name, task.pk, task.attempts, error)
+        else:
+            delay = RETRY_DELAY * 2 ** (task.attempts - 1)
+            _set_pending(task, run_after=timezone.now() + timedelta(seconds=delay), last_error=error)
+            logger.warning('Task %s #%d failed, retrying in %ds\n%s', task.name, task.pk, delay, error)
+        return False
+
+    task.finished_at = timezone.now()
+    Task.objects.filter(pk=task.pk).update(status=Task.DONE, finished_at=task.finished_at)
+    logger.info(
+        'Task %s #%d done wait=%.0fms run=%.0fms attempts=%d', task.name, task.pk,
+        task.wait_time.total_seconds() * 1000, task.run_time.total_seconds() * 1000, task.attempts,
+    )
+    return True
+
+
+def run_pending(limit=None):
+    """Run due tasks until none are left (or limit have run); return how many ran"""
+    ran = 0
+    while limit is None or ran < limit:
+        task = claim_next()
+        if task is None:
+            break
+        run_task(task)
+        ran += 1
+    return ran
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Return tasks left running by a worker that died to the queue"""
+    stale = Task.objects.filter(status=Task.RUNNING, started_at__lt=timezone.now() - older_than)
+    for task in stale:
+        _set_pending(task)
+    return len(stale)
+
+
+def prune_finished(older_than=timedelta(days=7)):
+    """Delete completed tasks past the retention window"""
+    deleted, _ = Task.objects.filter(status=Task.DONE, finished_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def latency_stats(since=timedelta(hours=1)):
+    """
+    Return {task name: stats} for tasks finished in the window.
+
+    Stats hold the done/failed counts, the number still pending, and p50/p95
+    wait (queued to started) and run times in milliseconds.
+    """
+    stats = {}
+    finished = Task.objects.filter(finished_at__gte=timezone.now() - since).exclude(started_at=None)
+    for task in finished.only('name', 'status', 'created_at', 'started_at', 'finished_at'):
+        entry = stats.setdefault(task.name, {'done': 0, 'failed': 0, 'pending': 0, 'wait': [], 'run': []})
+        entry['done' if task.status == Task.DONE else 'failed'] += 1
+        entry['wait'].append(task.wait_time.total_seconds() * 1000)
+        entry['run'].append(task.run_time.total_seconds() * 1000)
+    pending = Task.objects.filter(status=Task.PENDING).values('name').annotate(count=Count('pk'))
+    for row in pending.order_by():
+        stats.setdefault(row['name'], {'done': 0, 'failed': 0, 'pending': 0, 'wait': [], 'run': []})
+        stats[row['name']]['pending'] = row['count']
+
+    return {
+        name: {
+            'done': entry['done'],
+            'failed': entry['failed'],
+            'pending': entry['pending'],
+            'wait_p50': percentile(entry['wait'], 0.5),
+            'wait_p95': percentile(entry['wait'], 0.95),
+            'run_p50': percentile(entry['run'], 0.5),
+            'run_p95': percentile(entry['run'], 0.95),
+        }
+        for name, entry in stats.items()
+    }
+
+
+@task('generate_renditions')
+def generate_renditions(model, pk, field):
+    """Decode, validate and resize an uploaded image"""
+    from .images import process_image
+    process_image(model, pk, field)
+
+
+@task('sync_search_document')
+def sync_search_document(model, pk):
+    """Index the row's current contents, or drop its document if the row is gone"""
+    from .caching import all_movies_scope, bump_versions, category_scope, upcoming_scope
+    from .models import Movie
+    from .search import get_backend
+    model = apps.get_model(model)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        get_backend().remove(model, pk)
+    else:
+        get_backend().index(instance)
+    # Lists and ETags rendered from the old search results are stale now
+    if model is not Movie:
+        bump_versions(upcoming_scope())
+    elif instance is None:
+        bump_versions(all_movies_scope())
+    else:
+        bump_versions(all_movies_scope(), category_scope(instance.category_id))
+
+
+@task('build_feed')
+def build_feed(user_id):
+    """Rescore and store the user's "For You" feed"""
+    from .feed import build_feed
+    build_feed(user_id)
+
+
+@task('update_content_similarity')
+def update_content_similarity(movie_id):
+    """Refresh the TF-IDF vector and content neighbours around a new, edited or deleted movie"""
+    from .content import update_content_similarity
+    update_content_similarity(movie_id)
@@ -0,0 +1,44 @@
+from django import template
+from django.core.cache import cache
+
+from movies.caching import FRAGMENT_TIMEOUT, fragment_key, record, source_key, source_timeout
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        key = source_key(fragment_key(name, [value.resolve(context) for value in self.vary_on]))
+        content = cache.get(key)
+        record(name, hit=content is not None)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, source_timeout(FRAGMENT_TIMEOUT))
+        return content
+
+
+@register.tag('fragment_cache')
+def do_fragment_cache(parser, token):
+    """
+    Cache a template fragment and count hits and misses under its name.
+
+        {% fragment_cache "movie_card" movie.pk movie.cache_version %}
+            ...
+        {% endfragment_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name")
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    return FragmentCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
@@ -0,0 +1,37 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from movies.images import MIME_TYPES, RENDITIONS, get_manifest, rendition_path, schedule_renditions, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(fieldfile, rendition, alt='', css_class='', style=''):
+    """
+    Render an uploaded image as a <picture> with resized srcset renditions.
+
+    Usage: {% picture movie.poster "card" alt=movie.title css_class="card-img-top" %}
+
+    Until the renditions exist this renders the original and queues them.
+    """
+    manifest = get_manifest(fieldfile)
+    if manifest is None:
+        schedule_renditions(fieldfile, lazy=True)
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy" decoding="async">',
+            fieldfile.url, alt, css_class, style,
+        )
+
+    widths, sizes = RENDITIONS[rendition]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[fmt], srcset(manifest, rendition, fmt), sizes) for fmt in manifest['formats'] if fmt != 'jpeg'),
+    )
+    width = widths[0] if widths[0] in manifest['widths'] else manifest['widths'][-1]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy" decoding="async"></picture>',
+        sources, default_storage.url(rendition_path(manifest['digest'], width, 'jpeg')),
+        srcset(manifest, rendition, 'jpeg'), sizes, alt, css_class, style,
+    )
@@ -0,0 +1,1704 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models.signals import post_save
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+
+from .models import (
+    Actor, Category, ContentSimilarity, FeedItem, TrendingCounter, TrendingRank, Movie, MovieSimilarity, Rating, RatingChange, Review, Task, UpcomingMovie, Watchlist,
+    recalculate_rating_totals,
+)
+from .recommendations import (
+    bootstrap_incremental_state, movies_sharing_cast, process_rating_changes, rebuild_similar_movies,
+)
+from .caching import get_stats
+from .checks import check_shared_cache
+from .coalescing import write_buffer
+from .routers import PIN_COOKIE, ReplicaMiddleware, ReplicaRouter
+from .ann import LSHIndex
+from .forms import MovieForm
+from .trending import refresh_trending, trending_boards
+from .content import ContentModel, content_path, rebuild_content_similarity
+from .embeddings import EmbeddingStore, build_store, get_store, write_store
+from .factorization import FactorModel, current_version, evaluate, get_model, recommend_for_user, split_ratings, train
+from .feed import build_feed, feed_for
+from .catalog import CatalogImporter, read_rows
+from .movielens import RatingsImporter, match_movies, refresh_rating_aggregates, rescale
+from .tasks import enqueue, latency_stats, requeue_stale, run_pending, task
+from .images import get_manifest, rendition_path
+from .pagination import CursorPaginator
+from .query_plans import AuditError, audit, plan_problems, query_plan, unique_indexes
+from .search import get_backend, search_queryset
+from .urls import query_budgets
+
+
+def make_movie(category, added_by, **kwargs):
+    fields = {
+        'title': 'Movie',
+        'description': 'A movie',
+        'release_date': date(2020, 1, 1),
+        'actors': 'Someone',
+        'rating': 7.0,
+    }
+    fields.update(kwargs)
+    return Movie.objects.create(category=category, added_by=added_by, **fields)
+
+
+def stored_similarities():
+    return {
+        (similarity.movie_id, similarity.similar_movie_id): similarity.score
+        for similarity in MovieSimilarity.objects.all()
+    }
+
+
+class IncrementalSimilarityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f'user{i}') for i in range(8)]
+        category = Category.objects.create(name='Drama')
+        cls.movies = [make_movie(category, cls.users[0], title=f'Movie {i}') for i in range(10)]
+
+        rng = random.Random(42)
+        for user in cls.users:
+            for movie in rng.sample(cls.movies, 5):
+                Rating.objects.create(user=user, movie=movie, rating=rng.randint(1, 5))
+
+    def assertSimilaritiesEqual(self, first, second):
+        self.assertEqual(set(first), set(second))
+        for key, score in first.items():
+            self.assertAlmostEqual(score, second[key], places=5)
+
+    def test_rating_writes_are_logged(self):
+        RatingChange.objects.all().delete()
+        rating = Rating.objects.filter(user=self.users[0]).first()
+        rating.rating = 5 if rating.rating != 5 else 4
+        rating.save()
+        rating.delete()
+
+        changes = list(RatingChange.objects.values_list('user_id', 'movie_id', 'rating'))
+        self.assertEqual(changes, [
+            (rating.user_id, rating.movie_id, rating.rating),
+            (rating.user_id, rating.movie_id, None),
+        ])
+
+    def test_incremental_updates_match_full_rebuild(self):
+        state = bootstrap_incremental_state(k=50)
+        self.assertFalse(RatingChange.objects.exists())
+
+        rng = random.Random(7)
+        for _ in range(40):
+            user, movie = rng.choice(self.users), rng.choice(self.movies)
+            if rng.random() < 0.25:
+                Rating.objects.filter(user=user, movie=movie).delete()
+            else:
+                Rating.objects.update_or_create(user=user, movie=movie, defaults={'rating': rng.randint(1, 5)})
+        self.movies[3].delete()
+
+        while process_rating_changes(state, batch_size=7):
+            pass
+        incremental = stored_similarities()
+
+        rebuild_similar_movies(k=50)
+        self.assertSimilaritiesEqual(incremental, stored_similarities())
+
+    def test_replaying_a_change_is_a_no_op(self):
+        state = bootstrap_incremental_state(k=50)
+        rating = Rating.objects.first()
+        self.assertEqual(state.apply(rating.user_id, rating.movie_id, rating.rating), set())
+
+
+class RatingTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f'user{i}') for i in range(3)]
+        cls.movie = make_movie(Category.objects.create(name='Comedy'), cls.users[0])
+
+    def totals(self):
+        self.movie.refresh_from_db()
+        return self.movie.rating_sum, self.movie.rating_count
+
+    def test_totals_follow_rating_writes(self):
+        first = Rating.objects.create(user=self.users[0], movie=self.movie, rating=4)
+        Rating.objects.create(user=self.users[1], movie=self.movie, rating=2)
+        self.assertEqual(self.totals(), (6, 2))
+        self.assertEqual(self.movie.average_rating(), 3.0)
+
+        Rating.objects.update_or_create(user=self.users[1], movie=self.movie, defaults={'rating': 5})
+        self.assertEqual(self.totals(), (9, 2))
+
+        first.delete()
+        self.assertEqual(self.totals(), (5, 1))
+
+    def test_reconcile_repairs_drift(self):
+        Rating.objects.create(user=self.users[0], movie=self.movie, rating=3)
+        Movie.objects.filter(pk=self.movie.pk).update(rating_sum=40, rating_count=7)
+
+        self.assertEqual(recalculate_rating_totals(), 1)
+        self.assertEqual(self.totals(), (3, 1))
+        self.assertEqual(recalculate_rating_totals(), 0)
+
+
+@override_settings(TASK_QUEUE_EAGER=True)
+class SearchIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='curator')
+        cls.category = Category.objects.create(name='Thriller')
+        cls.island = make_movie(cls.category, cls.user, title='Shutter Island', actors='Leonardo DiCaprio')
+        cls.departed = make_movie(cls.category, cls.user, title='The Departed',
+                                  description='An undercover cop on an island of crime', actors='Matt Damon')
+
+    def titles(self, model, query):
+        return [obj.title for obj in search_queryset(model.objects.all(), query)]
+
+    def test_prefix_matches_ranked_by_title_first(self):
+        self.assertEqual(self.titles(Movie, 'isl'), ['Shutter Island', 'The Departed'])
+        self.assertEqual(self.titles(Movie, 'dicap'), ['Shutter Island'])
+        self.assertEqual(self.titles(Movie, '"*'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.departed.title = 'The Departed (2006)'
+        self.departed.save()
+        self.assertEqual(self.titles(Movie, '2006'), ['The Departed (2006)'])
+
+        self.island.delete()
+        self.assertEqual(self.titles(Movie, 'island'), ['The Departed (2006)'])
+
+    def test_documents_are_replaced_by_rowid(self):
+        backend = get_backend()
+        with CaptureQueriesContext(connection) as queries:
+            backend.index(self.island)
+            backend.remove(Movie, self.departed.pk)
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        with connection.cursor() as cursor:
+            for sql in deletes:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                # FTS5 plans a full scan as an empty index string
+                self.assertNotRegex(cursor.fetchone()[-1], r'INDEX \d+:$', sql)
+        self.assertEqual(self.titles(Movie, 'isl'), ['Shutter Island'])
+
+    def test_limit_counts_matches_within_the_filters(self):
+        drama = Category.objects.create(name='Drama')
+        castaway = make_movie(drama, self.user, title='Cast Away', description='Stranded on an island')
+        self.assertEqual(self.titles(Movie, 'island')[0], 'Shutter Island')
+        self.assertEqual(list(search_queryset(Movie.objects.filter(category=drama), 'island', limit=1)), [castaway])
+
+    def test_upcoming_movies_are_searchable(self):
+        UpcomingMovie.objects.create(title='Avatar: Fire and Ash', description='Pandora', category=self.category,
+                                     expected_release_date=date(2030, 12, 19), added_by=self.user)
+        self.assertEqual(self.titles(UpcomingMovie, 'avat'), ['Avatar: Fire and Ash'])
+        self.assertEqual(self.titles(Movie, 'avat'), [])
+
+
+@override_settings(TASK_QUEUE_EAGER=True)
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(username='viewer')
+        raters = [User.objects.create(username=f'rater{i}') for i in range(6)]
+        drama, comedy, horror = (Category.objects.create(name=name) for name in ('Drama', 'Comedy', 'Horror'))
+        cls.d1, cls.d2, cls.d3 = (make_movie(drama, raters[0], title=f'Drama {i}') for i in range(3))
+        cls.c1, cls.c2 = (make_movie(comedy, raters[0], title=f'Comedy {i}') for i in range(2))
+        cls.h1, cls.h2 = (make_movie(horror, raters[0], title=f'Horror {i}') for i in range(2))
+        for rater in raters:
+            Rating.objects.create(user=rater, movie=cls.c1, rating=5)
+        for rater in raters[:3]:
+            Rating.objects.create(user=rater, movie=cls.d1, rating=5)
+            Rating.objects.create(user=rater, movie=cls.d2, rating=5)
+        for rater in raters[3:]:
+            Rating.objects.create(user=rater, movie=cls.h1, rating=4)
+        rebuild_similar_movies()
+
+    def test_users_without_history_get_popular_movies(self):
+        self.assertEqual(feed_for(self.viewer)[:4], [self.c1, self.d1, self.d2, self.h1])
+
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['for_you'][:4], [self.c1, self.d1, self.d2, self.h1])
+        self.assertContains(response, reverse('for_you'))
+
+    def test_feed_blends_ratings_genres_and_watchlist(self):
+        Rating.objects.create(user=self.viewer, movie=self.d1, rating=5)
+        feed = feed_for(self.viewer)
+        self.assertEqual(feed[:3], [self.d2, self.c1, self.d3])
+        self.assertNotIn(self.d1, feed)
+
+        self.viewer.profile.favorite_genres = 'horror'
+        self.viewer.profile.save()
+        feed = feed_for(self.viewer)
+        self.assertLess(feed.index(self.h1), feed.index(self.d3))
+
+        Watchlist.objects.create(user=self.viewer, movie=self.d2)
+        self.assertNotIn(self.d2, feed_for(self.viewer))
+
+    def test_stored_feed_is_read_with_one_query(self):
+        build_feed(self.viewer.pk)
+        with self.assertNumQueries(1):
+            feed = feed_for(self.viewer)
+        self.assertEqual(len(feed), FeedItem.objects.filter(user=self.viewer).count())
+
+        # Rated movies drop out before the queued rebuild runs
+        with self.settings(TASK_QUEUE_EAGER=False):
+            Rating.objects.create(user=self.viewer, movie=feed[0], rating=2)
+        self.assertNotIn(feed[0], feed_for(self.viewer))
+        self.assertTrue(Task.objects.filter(name='build_feed', key=f'feed:{self.viewer.pk}').exists())
+
+    @override_settings(TASK_QUEUE_EAGER=False)
+    def test_only_unbuilt_feeds_are_queued_from_a_read(self):
+        builds = Task.objects.filter(name='build_feed', key=f'feed:{self.viewer.pk}')
+        self.assertEqual(feed_for(self.viewer)[:1], [self.c1])
+        self.assertTrue(builds.exists())
+
+        # A feed that came out empty is served the popular movies without queueing another build
+        builds.delete()
+        build_feed(self.viewer.pk)
+        FeedItem.objects.filter(user=self.viewer).delete()
+        self.assertEqual(feed_for(self.viewer)[:1], [self.c1])
+        self.assertFalse(builds.exists())
+
+
+class MovieCastTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='curator')
+        cls.category = Category.objects.create(name='Drama')
+
+    def test_cast_is_parsed_in_billing_order(self):
+        movie = make_movie(self.category, self.user, actors='Tim Robbins,  Morgan   Freeman, Tim Robbins,')
+        names = [credit.actor.name for credit in movie.cast_credits.select_related('actor')]
+        self.assertEqual(names, ['Tim Robbins', 'Morgan Freeman'])
+
+        movie.actors = 'Morgan Freeman'
+        movie.save()
+        self.assertEqual([actor.name for actor in movie.cast.all()], ['Morgan Freeman'])
+        self.assertEqual(Actor.objects.count(), 2)
+
+    def test_filmography_and_cast_overlap(self):
+        shawshank = make_movie(self.category, self.user, title='Shawshank', actors='Tim Robbins, Morgan Freeman')
+        se7en = make_movie(self.category, self.user, title='Se7en', actors='Brad Pitt, Morgan Freeman')
+        mystic = make_movie(self.category, self.user, title='Mystic River', actors='Tim Robbins, Morgan Freeman')
+        make_movie(self.category, self.user, title='Fight Club', actors='Brad Pitt')
+
+        freeman = Actor.objects.get(name='Morgan Freeman')
+        self.assertEqual(set(freeman.movies.all()), {shawshank, se7en, mystic})
+        self.assertEqual(movies_sharing_cast(shawshank), [mystic, se7en])
+
+
+class QueryBudgetMixin:
+    """Assert that a response stayed within the query budget declared in movies/urls.py"""
+
+    def assertWithinQueryBudget(self, response):
+        url_name = response.resolver_match.url_name
+        stats = response.query_stats
+        self.assertLessEqual(
+            stats.count, query_budgets[url_name],
+            msg=f'{url_name} went over its query budget: {stats.report()}',
+        )
+
+
+@override_settings(WRITE_COALESCE_WINDOW=0)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', password='secret-password', is_staff=True)
+        users = [User.objects.create(username=f'user{i}') for i in range(5)]
+        categories = [Category.objects.create(name=name) for name in ('Drama', 'Crime', 'Comedy')]
+        cls.movies = [
+            make_movie(categories[i % 3], users[i % 5], title=f'Movie {i}', actors='Tom Hanks, Meg Ryan')
+            for i in range(15)
+        ]
+        for i, user in enumerate(users):
+            Review.objects.create(user=user, movie=cls.movies[0], review_text='Great')
+            for movie in cls.movies[:6]:
+                Rating.objects.create(user=user, movie=movie, rating=1 + (i + movie.pk) % 5)
+        for movie in cls.movies[:4]:
+            Watchlist.objects.create(user=cls.staff, movie=movie)
+            UpcomingMovie.objects.create(title=f'Sequel to {movie.title}', description='Soon', category=movie.category,
+                                         expected_release_date=date(2030, 1, 1), added_by=cls.staff)
+        rebuild_similar_movies()
+        build_feed(cls.staff.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def test_pages_stay_within_budget(self):
+        movie = self.movies[0]
+        urls = [
+            reverse('home'),
+            reverse('home') + '?search=movie',
+            reverse('movie_detail', args=[movie.pk]),
+            reverse('movies_by_category', args=[movie.category_id]),
+            reverse('actor_detail', args=[Actor.objects.get(name='Tom Hanks').pk]),
+            reverse('upcoming_movies'),
+            reverse('watchlist'),
+            reverse('for_you'),
+            reverse('profile'),
+            reverse('admin_dashboard'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertWithinQueryBudget(response)
+
+    def test_ajax_endpoints_stay_within_budget(self):
+        movie = self.movies[0]
+        for rating in (4, 2):
+            response = self.client.post(reverse('rate_movie', args=[movie.pk]), {'rating': rating},
+                                        content_type='application/json')
+            self.assertWithinQueryBudget(response)
+        for _ in range(2):
+            self.assertWithinQueryBudget(self.client.post(reverse('toggle_watchlist', args=[movie.pk])))
+
+    async def test_async_endpoints_under_asgi(self):
+        movie = self.movies[0]
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.post(reverse('rate_movie', args=[movie.pk]), {'rating': 5},
+                                                content_type='application/json')
+        self.assertEqual(response.json()['total_ratings'], 6)
+        self.assertTrue(await Rating.objects.filter(user=self.staff, movie=movie, rating=5).aexists())
+        self.assertWithinQueryBudget(response)
+        self.assertGreater(response.query_stats.count, 0)
+
+        response = await self.async_client.post(reverse('toggle_watchlist', args=[movie.pk]))
+        self.assertEqual(response.json()['in_watchlist'], False)
+        self.assertWithinQueryBudget(response)
+
+        for url in (reverse('api_movie_list') + '?fields=id,title,cast', reverse('api_movie_detail', args=[movie.pk])):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertWithinQueryBudget(response)
+                revalidated = await self.async_client.get(url, headers={'if-none-match': response['ETag']})
+                self.assertEqual(revalidated.status_code, 304)
+
+    def test_anonymous_pages_stay_within_budget(self):
+        self.client.logout()
+        urls = [
+            reverse('home'),
+            reverse('movie_detail', args=[self.movies[0].pk]),
+            reverse('api_movie_list') + '?fields=id,title,cast',
+            reverse('api_movie_detail', args=[self.movies[0].pk]),
+            reverse('api_category_list'),
+            reverse('api_upcoming_list') + '?search=sequel',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(self.client.get(url))
+
+
+class MovieDetailQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='viewer', password='secret-password')
+        category = Category.objects.create(name='Drama')
+        cls.movie = make_movie(category, cls.user, title='Heat', actors='Al Pacino, Robert De Niro')
+        other = make_movie(category, cls.user, title='Ronin', actors='Robert De Niro')
+        cls.reviewers = [User.objects.create(username=f'reviewer{i}') for i in range(45)]
+        for reviewer in cls.reviewers:
+            Rating.objects.create(user=reviewer, movie=cls.movie, rating=4)
+            Rating.objects.create(user=reviewer, movie=other, rating=5)
+        rebuild_similar_movies()
+
+    def add_reviews(self, reviewers):
+        Review.objects.bulk_create(
+            Review(user=reviewer, movie=self.movie, review_text='Classic') for reviewer in reviewers
+        )
+
+    def test_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        Rating.objects.create(user=self.user, movie=self.movie, rating=3)
+        Review.objects.create(user=self.user, movie=self.movie, review_text='Mine')
+        Watchlist.objects.create(user=self.user, movie=self.movie)
+
+        for reviewers in (self.reviewers[:1], self.reviewers[1:]):
+            self.add_reviews(reviewers)
+            cache.clear()
+            with self.assertNumQueries(7):
+                response = self.client.get(reverse('movie_detail', args=[self.movie.pk]))
+
+        self.assertEqual(response.context['user_rating'], 3)
+        self.assertEqual(response.context['user_review'].review_text, 'Mine')
+        self.assertTrue(response.context['in_watchlist'])
+        self.assertEqual(len(response.context['reviews']), 20)
+        self.assertEqual(response.context['reviews'].paginator.count, 45)
+
+    def test_anonymous_query_count(self):
+        self.add_reviews(self.reviewers)
+        cache.clear()
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('movie_detail', args=[self.movie.pk]), {'reviews_page': 3})
+        self.assertEqual(len(response.context['reviews']), 5)
+
+        # Cached cast and review fragments skip their queries
+        with self.assertNumQueries(3):
+            self.client.get(reverse('movie_detail', args=[self.movie.pk]), {'reviews_page': 3})
+        self.assertFalse(response.context['in_watchlist'])
+        self.assertIsNone(response.context['user_review'])
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='critic')
+        cls.drama = Category.objects.create(name='Drama')
+        cls.comedy = Category.objects.create(name='Comedy')
+        cls.movie = make_movie(cls.drama, cls.user, title='Heat')
+        cls.other = make_movie(cls.comedy, cls.user, title='Airplane')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, *args):
+        return self.client.get(reverse(name, args=args)).content.decode()
+
+    def test_card_and_lists_follow_movie_edits(self):
+        self.get('home')
+        self.get('movies_by_category', self.drama.pk)
+        self.assertIn('Heat', self.get('movies_by_category', self.drama.pk))
+        self.assertEqual(get_stats()['category_list'], (1, 1))
+
+        self.movie.title = 'Heat (1995)'
+        self.movie.category = self.comedy
+        self.movie.save()
+        self.assertIn('Heat (1995)', self.get('home'))
+        self.assertNotIn('Heat', self.get('movies_by_category', self.drama.pk))
+        self.assertIn('Heat (1995)', self.get('movies_by_category', self.comedy.pk))
+
+    def test_ratings_refresh_cards_only_in_affected_lists(self):
+        self.get('movies_by_category', self.comedy.pk)
+        self.get('home')
+        Rating.objects.create(user=self.user, movie=self.movie, rating=5)
+
+        self.assertIn('(1)', self.get('home'))
+        self.get('movies_by_category', self.comedy.pk)
+        self.assertEqual(get_stats()['category_list'], (1, 1))
+        # Only the rated movie's card is re-rendered
+        self.assertEqual(get_stats()['movie_card'], (1, 3))
+
+    def test_reviews_invalidate_the_movie_review_list(self):
+        self.assertNotIn('Tense', self.get('movie_detail', self.movie.pk))
+        Review.objects.create(user=self.user, movie=self.movie, review_text='Tense')
+        self.assertIn('Tense', self.get('movie_detail', self.movie.pk))
+
+    def test_cards_follow_category_renames(self):
+        self.assertIn('data-category="Drama"', self.get('home'))
+        self.drama.name = 'Crime'
+        self.drama.save()
+        home = self.get('home')
+        self.assertIn('data-category="Crime"', home)
+        self.assertNotIn('data-category="Drama"', home)
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        files = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        for debug, caches, errors in ((False, local, ['movies.E001']), (True, local, []), (False, files, [])):
+            with self.subTest(debug=debug, caches=caches['default']['BACKEND']), \
+                    override_settings(DEBUG=debug, CACHES=caches):
+                self.assertEqual([error.id for error in check_shared_cache(None)], errors)
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='pager')
+        cls.category = Category.objects.create(name='Drama')
+        for number in range(23):
+            make_movie(cls.category, cls.user, title=f'Movie {number}')
+        # Ties on created_at must still page by id
+        Movie.objects.filter(title__in=['Movie 3', 'Movie 4', 'Movie 5']).update(
+            created_at=datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+        )
+        cls.expected = list(Movie.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def paginator(self, **kwargs):
+        return CursorPaginator(Movie.objects.all(), 5, ('-created_at', '-id'), **kwargs)
+
+    def test_walks_forward_and_back(self):
+        pages = [self.paginator().get_page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator().get_page(pages[-1].next_cursor))
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+        self.assertEqual([movie.pk for page in pages for movie in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        page = pages[-1]
+        while page.has_previous():
+            previous = self.paginator().get_page(page.previous_cursor)
+            self.assertEqual([movie.pk for movie in previous], [movie.pk for movie in pages[previous.number - 1]])
+            page = previous
+        self.assertEqual(page.number, 1)
+
+    async def test_async_pages_match(self):
+        page = await sync_to_async(self.paginator().get_page)()
+        while page.has_next():
+            following = await self.paginator().aget_page(page.next_cursor)
+            self.assertEqual(following.number, page.number + 1)
+            page = following
+        while page.has_previous():
+            previous = await self.paginator().aget_page(page.previous_cursor)
+            expected = await sync_to_async(self.paginator().get_page)(page.previous_cursor)
+            self.assertEqual([movie.pk for movie in previous], [movie.pk for movie in expected])
+            self.assertEqual(previous.has_previous(), expected.has_previous())
+            page = previous
+        self.assertEqual(page.number, 1)
+        self.assertEqual([movie.pk for movie in await self.paginator().aget_page('garbage')], self.expected[:5])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        first = [movie.pk for movie in self.paginator().get_page()]
+        for cursor in ('garbage', 'eyJ2IjpbMV0sImQiOiJuIiwibiI6Mn0', 'e30'):
+            self.assertEqual([movie.pk for movie in self.paginator().get_page(cursor)], first)
+
+    def test_count_is_optional(self):
+        self.assertEqual(self.paginator().num_pages, 5)
+        paginator = self.paginator(with_count=False)
+        with self.assertNumQueries(1):
+            page = paginator.get_page()
+            self.assertIsNone(paginator.num_pages)
+        self.assertEqual(len(page), 5)
+
+    def test_views_follow_cursors(self):
+        titles = []
+        url, params = reverse('movies_by_category', args=[self.category.pk]), {}
+        while True:
+            response = self.client.get(url, params)
+            movies = response.context['movies']
+            titles.extend(movie.pk for movie in movies)
+            if not movies.has_next():
+                break
+            self.assertContains(response, f'?cursor={movies.next_cursor}')
+            params = {'cursor': movies.next_cursor}
+        self.assertEqual(titles, self.expected)
+
+    def test_top_rated_sort_pages_on_the_average(self):
+        rater = User.objects.create(username='rater')
+        for movie in Movie.objects.all():
+            Rating.objects.create(user=rater, movie=movie, rating=movie.pk % 5 + 1)
+        expected = sorted(
+            Movie.objects.all(), key=lambda movie: (-movie.rating_sum / movie.rating_count, -movie.pk)
+        )
+
+        seen, params = [], {'sort': 'top_rated'}
+        while True:
+            movies = self.client.get(reverse('home'), params).context['movies']
+            seen.extend(movie.pk for movie in movies)
+            if not movies.has_next():
+                break
+            params['cursor'] = movies.next_cursor
+        self.assertEqual(seen, [movie.pk for movie in expected])
+
+
+class QueryPlanTests(TransactionTestCase):
+    """The audit copies the database, so its data has to be committed"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='planner')
+        drama = Category.objects.create(name='Drama')
+        movies = [make_movie(drama, self.user, title=f'Movie {number}') for number in range(55)]
+        for number in range(25):
+            Review.objects.create(user=User.objects.create(username=f'critic{number}'), movie=movies[0],
+                                  review_text='Fine')
+        Watchlist.objects.create(user=self.user, movie=movies[1])
+        for number in range(15):
+            UpcomingMovie.objects.create(title=f'Sequel {number}', description='Soon', category=drama,
+                                         expected_release_date=date(2030, 1, 1) + timedelta(days=number),
+                                         added_by=self.user)
+
+    def failing(self, results):
+        return {
+            page: problems for page, queries in results
+            for sql, plan, problems, accepted in queries if problems and not accepted
+        }
+
+    def test_hot_pages_use_indexes(self):
+        results = audit()
+        self.assertEqual(self.failing(results), {})
+        pages = dict(results)
+        for page in ('home next page', 'category next page', 'upcoming category next page',
+                     'api movie list category next page'):
+            self.assertIn(page, pages)
+        reviews = [plan for sql, plan, *_ in pages['movie detail reviews page'] if 'OFFSET' in sql]
+        self.assertIn('SEARCH movies_review USING INDEX movies_review_movie_idx (movie_id=?)', reviews[0])
+        # The pages wrote their sessions to the copy
+        self.assertFalse(Session.objects.exists())
+
+    def test_audit_leaves_the_database_unlocked(self):
+        writes = []
+
+        def rate(*args, **kwargs):
+            # Another connection writing while the audit renders a page
+            writer = threading.Thread(target=lambda: (
+                writes.append(Category.objects.create(name=f'Written {len(writes)}').pk), connection.close()))
+            writer.start()
+            writer.join()
+            return real_get(*args, **kwargs)
+
+        real_get = Client.get
+        with mock.patch.object(Client, 'get', side_effect=rate, autospec=True):
+            audit()
+        self.assertEqual(Category.objects.filter(pk__in=writes).count(), len(writes))
+        self.assertGreater(len(writes), 10)
+
+    def test_audit_refuses_to_run_in_a_transaction(self):
+        with transaction.atomic(), self.assertRaises(AuditError):
+            audit()
+
+    def test_missing_index_is_flagged(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'movies_review_movie_idx'")
+            self.addCleanup(connection.cursor().execute, cursor.fetchone()[0])
+            cursor.execute('DROP INDEX movies_review_movie_idx')
+        failing = self.failing(audit())
+        self.assertIn('movie detail reviews page', failing)
+        self.assertIn('USE TEMP B-TREE FOR ORDER BY', failing['movie detail reviews page'])
+
+    def test_scans_and_sorts_are_flagged(self):
+        unindexed = query_plan(*Movie.objects.filter(description__contains='heist').order_by().query.sql_with_params())
+        self.assertEqual(plan_problems(unindexed), ['SCAN movies_movie'])
+        sorted_reviews = query_plan(*Review.objects.filter(movie_id=1).order_by('-updated_at').query.sql_with_params())
+        self.assertIn('USE TEMP B-TREE FOR ORDER BY', plan_problems(sorted_reviews))
+
+        newest = query_plan(*Movie.objects.order_by('-created_at', '-id')[:13].query.sql_with_params())
+        self.assertEqual(plan_problems(newest, {'movies_movie'}), [])
+        self.assertEqual(len(plan_problems(newest)), 1)
+
+        # Sorting what a unique key found is sorting one row
+        pending = query_plan(*Task.objects.filter(key='k', status=Task.PENDING).order_by('pk').query.sql_with_params())
+        self.assertEqual(plan_problems(pending), ['USE TEMP B-TREE FOR ORDER BY'])
+        self.assertEqual(plan_problems(pending, unique=unique_indexes()), [])
+
+    def test_audit_command(self):
+        out = StringIO()
+        call_command('audit_indexes', '--plans', stdout=out)
+        self.assertIn('movies_review_movie_idx', out.getvalue())
+        self.assertNotIn('FLAGGED', out.getvalue())
+
+    def test_audit_needs_a_movie(self):
+        Movie.objects.all().delete()
+        with self.assertRaises(AuditError):
+            audit()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='api')
+        cls.drama = Category.objects.create(name='Drama')
+        cls.movies = [
+            make_movie(cls.drama, cls.user, title=f'Movie {number}', actors='Tom Hanks, Meg Ryan')
+            for number in range(55)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, *args, **headers):
+        params = headers.pop('params', {})
+        return self.client.get(reverse(name, args=args), params, headers=headers)
+
+    def test_movie_list_pages_with_cursors(self):
+        response = self.get('api_movie_list')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual(len(data['results']), 50)
+        self.assertEqual(set(data['results'][0]), {
+            'id', 'title', 'category', 'release_date', 'average_rating', 'total_ratings', 'poster',
+        })
+        self.assertEqual(data['results'][0]['category'], {'id': self.drama.pk, 'name': 'Drama'})
+        self.assertIsNone(data['previous'])
+
+        rest = self.get('api_movie_list', params={'cursor': data['next']}).json()
+        self.assertEqual(len(rest['results']), 5)
+        self.assertIsNone(rest['next'])
+
+    @override_settings(TASK_QUEUE_EAGER=True)
+    def test_movie_search(self):
+        alien = make_movie(self.drama, self.user, title='Alien Harvest')
+        for params in ({'search': 'alien'}, {'search': 'alien', 'category': self.drama.pk}):
+            with self.subTest(params=params):
+                response = self.get('api_movie_list', params=params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([movie['id'] for movie in response.json()['results']], [alien.pk])
+
+    def test_search_etag_changes_once_the_document_is_indexed(self):
+        alien = make_movie(self.drama, self.user, title='Alien Harvest')
+        searches = ({'search': 'alien'}, {'search': 'alien', 'category': self.drama.pk})
+        # Rendered before the queued task indexed the new movie
+        etags = []
+        for params in searches:
+            response = self.get('api_movie_list', params=params)
+            self.assertEqual(response.json()['results'], [])
+            etags.append(response['ETag'])
+        run_pending()
+        for params, etag in zip(searches, etags):
+            with self.subTest(params=params):
+                response = self.get('api_movie_list', params=params, if_none_match=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([movie['id'] for movie in response.json()['results']], [alien.pk])
+
+    def test_field_selection(self):
+        data = self.get('api_movie_detail', self.movies[0].pk, params={'fields': 'title,cast'}).json()
+        self.assertEqual(data, {'title': 'Movie 0', 'cast': ['Tom Hanks', 'Meg Ryan']})
+
+        response = self.get('api_movie_list', params={'fields': 'title,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unknown fields: secret'})
+
+    def test_missing_movie(self):
+        self.assertEqual(self.get('api_movie_detail', 0).status_code, 404)
+
+    def test_conditional_get(self):
+        movie = self.movies[0]
+        for name, args in (('api_movie_detail', [movie.pk]), ('api_movie_list', []),
+                           ('api_category_list', []), ('api_upcoming_list', [])):
+            with self.subTest(name=name):
+                response = self.get(name, *args)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertFalse(response['ETag'].startswith('W/'))
+
+                with self.assertNumQueries(1 if name == 'api_movie_detail' else 0):
+                    revalidated = self.get(name, *args, if_none_match=response['ETag'])
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_etags_change_with_the_data(self):
+        movie = self.movies[0]
+        detail = self.get('api_movie_detail', movie.pk)['ETag']
+        listing = self.get('api_movie_list')['ETag']
+        categories = self.get('api_category_list')['ETag']
+
+        Rating.objects.create(user=self.user, movie=movie, rating=4)
+        self.assertEqual(self.get('api_movie_detail', movie.pk, if_none_match=detail).status_code, 200)
+        self.assertEqual(self.get('api_movie_list', if_none_match=listing).status_code, 200)
+
+        make_movie(self.drama, self.user, title='Newcomer')
+        self.assertEqual(self.get('api_category_list', if_none_match=categories).json()['results'][0]['movie_count'], 56)
+
+        # Different parameters never share an ETag
+        self.assertNotEqual(
+            self.get('api_movie_list', params={'fields': 'id'})['ETag'],
+            self.get('api_movie_list', params={'fields': 'title'})['ETag'],
+        )
+
+
+@override_settings(WRITE_COALESCE_WINDOW=60)
+class WriteCoalescingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='clicker', password='secret-password')
+        cls.movie = make_movie(Category.objects.create(name='Drama'), cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Flushed by hand; the flusher thread would write outside the test transaction
+        self.enterContext(mock.patch.object(write_buffer, 'schedule'))
+        self.addCleanup(write_buffer.reset)
+
+    def rate(self, rating):
+        return self.client.post(reverse('rate_movie', args=[self.movie.pk]), {'rating': rating},
+                                content_type='application/json').json()
+
+    def toggle(self):
+        return self.client.post(reverse('toggle_watchlist', args=[self.movie.pk])).json()['in_watchlist']
+
+    def test_double_click_writes_nothing(self):
+        self.assertEqual([self.toggle(), self.toggle()], [True, False])
+        self.assertEqual(write_buffer.flush(), 0)
+        self.assertFalse(Watchlist.objects.exists())
+
+    def test_scrubbed_stars_write_the_last_rating(self):
+        responses = [self.rate(rating) for rating in (2, 3, 5)]
+        self.assertEqual([response['message'] for response in responses],
+                         ['Rating added!', 'Rating updated!', 'Rating updated!'])
+        self.assertEqual(responses[-1]['average_rating'], 5)
+        self.assertEqual(responses[-1]['total_ratings'], 1)
+        self.assertFalse(Rating.objects.exists())
+
+        self.assertEqual(write_buffer.flush(), 1)
+        self.assertEqual(Rating.objects.get().rating, 5)
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.rating_sum, self.movie.rating_count), (5, 1))
+
+        # Once flushed the stored rating is the baseline again
+        self.assertEqual(self.rate(4)['message'], 'Rating updated!')
+        self.assertEqual(self.rate(5)['total_ratings'], 1)
+        self.assertEqual(write_buffer.flush(), 0)
+
+    def test_flushed_state_is_read_back(self):
+        self.assertTrue(self.toggle())
+        write_buffer.flush()
+        self.assertTrue(Watchlist.objects.filter(user=self.user, movie=self.movie).exists())
+        self.assertFalse(self.toggle())
+        self.assertEqual(write_buffer.flush(), 1)
+        self.assertFalse(Watchlist.objects.exists())
+
+    def test_toggles_from_other_workers_combine(self):
+        # Two workers each saw no entry and answered "added"; two toggles leave none
+        for _ in range(2):
+            self.assertTrue(write_buffer.toggle_watchlist(self.user.pk, self.movie.pk, False))
+            self.assertEqual(write_buffer.flush(), 1)
+        self.assertFalse(Watchlist.objects.exists())
+
+    def test_failed_flush_keeps_the_writes(self):
+        self.rate(3)
+        with mock.patch.object(write_buffer, '_write', side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                write_buffer.flush()
+        self.assertEqual(self.rate(4)['message'], 'Rating updated!')
+        self.assertEqual(write_buffer.flush(), 1)
+        self.assertEqual(Rating.objects.get().rating, 4)
+
+        self.toggle()
+        with mock.patch.object(write_buffer, '_write', side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                write_buffer.flush()
+        self.assertFalse(self.toggle())
+        self.assertEqual(write_buffer.flush(), 0)
+        self.assertFalse(Watchlist.objects.exists())
+
+
+
+@override_settings(WRITE_COALESCE_WINDOW=60)
+class WriteCoalescingCommitTests(TransactionTestCase):
+    """Foreign keys are only checked on commit, which TestCase never reaches"""
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(write_buffer, 'schedule'))
+        self.addCleanup(write_buffer.reset)
+
+    def test_deleted_movie_is_dropped(self):
+        user = User.objects.create(username='clicker')
+        drama = Category.objects.create(name='Drama')
+        movies = [make_movie(drama, user, title=title) for title in ('Kept', 'Gone')]
+        for movie in movies:
+            write_buffer.rate(user.pk, movie.pk, 4, None)
+            write_buffer.toggle_watchlist(user.pk, movie.pk, False)
+        movies[1].delete()
+
+        self.assertEqual(write_buffer.flush(), 2)
+        self.assertEqual(list(Rating.objects.values_list('movie__title', 'rating')), [('Kept', 4)])
+        self.assertEqual(list(Watchlist.objects.values_list('movie__title', flat=True)), ['Kept'])
+        self.assertEqual(write_buffer.flush(), 0)
+
+
+    def test_totals_never_count_a_committed_batch_twice(self):
+        user = User.objects.create(username='rater')
+        movie = make_movie(Category.objects.create(name='Drama'), user)
+        write_buffer.rate(user.pk, movie.pk, 4, None)
+        totals, readers = [], []
+
+        def read_totals():
+            totals.append(write_buffer.rating_totals(movie.pk))
+            connection.close()
+
+        def race(sender, **kwargs):
+            # A reader arriving right after the batch commits, before flush() retires it
+            reader = threading.Thread(target=read_totals)
+            readers.append(reader)
+            transaction.on_commit(lambda: (reader.start(), reader.join(timeout=0.5)))
+
+        post_save.connect(race, sender=Rating)
+        self.addCleanup(post_save.disconnect, race, sender=Rating)
+        self.assertEqual(write_buffer.flush(), 1)
+        for reader in readers:
+            reader.join()
+        self.assertEqual(totals, [(4, 1)])
+
+class TaskTransactionTests(TransactionTestCase):
+    """Tasks must not hold the write lock through their slow, database-free work"""
+
+    def test_ratings_are_written_while_a_rendition_is_encoded(self):
+        user = User.objects.create(username='rater')
+        movie = make_movie(Category.objects.create(name='Drama'), user, poster='posters/heat.jpg')
+        Task.objects.all().delete()
+        outcome = []
+
+        def rate():
+            try:
+                Rating.objects.create(user=user, movie=movie, rating=5)
+                outcome.append('rated')
+            except DatabaseError as exc:
+                outcome.append(str(exc))
+            finally:
+                connection.close()
+
+        def encode(fieldfile):
+            writer = threading.Thread(target=rate)
+            writer.start()
+            writer.join()
+            return {'source': fieldfile.name}
+
+        enqueue('generate_renditions', {'model': 'movies.movie', 'pk': movie.pk, 'field': 'poster'})
+        with mock.patch('movies.images.generate_renditions', side_effect=encode):
+            self.assertEqual(run_pending(), 1)
+        self.assertEqual(outcome, ['rated'])
+        self.assertTrue(Rating.objects.filter(movie=movie).exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Routing decisions only; ReplicaDatabaseTests runs against a real second database"""
+
+    router = ReplicaRouter()
+
+    def serve(self, method, path, cookies=None, write=None):
+        """Serve a request through ReplicaMiddleware; return the aliases the view read from and the response"""
+        request = getattr(RequestFactory(), method)(path)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(path)
+        seen = {}
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            seen['movies'] = self.router.db_for_read(Movie)
+            seen['session'] = self.router.db_for_read(Session)
+            seen['tasks'] = self.router.db_for_read(Task)
+            if write:
+                self.assertEqual(self.router.db_for_write(write), 'default')
+            seen['after'] = self.router.db_for_read(Movie)
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(view)
+        return seen, middleware(request)
+
+    def test_read_views_read_from_the_replica(self):
+        for path in (reverse('home'), reverse('movie_detail', args=[1]), reverse('api_movie_list')):
+            with self.subTest(path=path):
+                seen, response = self.serve('get', path)
+                self.assertEqual(seen, {'movies': 'replica', 'session': 'default', 'tasks': 'default',
+                                        'after': 'replica'})
+                self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_other_requests_read_from_the_primary(self):
+        self.assertEqual(self.serve('get', reverse('watchlist'))[0]['movies'], 'default')
+        seen, response = self.serve('post', reverse('rate_movie', args=[1]))
+        self.assertEqual(seen['movies'], 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(self.router.db_for_read(Movie), 'default')
+
+    def test_writers_are_pinned_to_the_primary(self):
+        seen, response = self.serve('get', reverse('home'), write=Rating)
+        self.assertEqual((seen['movies'], seen['after']), ('replica', 'default'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        seen, response = self.serve('get', reverse('home'), cookies={PIN_COOKIE: '1'})
+        self.assertEqual(seen['movies'], 'default')
+
+    def test_queued_tasks_pin_nobody(self):
+        seen, response = self.serve('get', reverse('home'), write=Task)
+        self.assertEqual((seen['movies'], seen['tasks'], seen['after']), ('replica', 'default', 'replica'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_no_replicas(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            seen, response = self.serve('post', reverse('rate_movie', args=[1]), write=Rating)
+            self.assertEqual(self.serve('get', reverse('home'))[0]['movies'], 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@skipUnless(getattr(settings, 'DATABASE_REPLICAS', None) == ['replica'],
+            'needs a separate replica database: --settings=movie_website.settings_replica')
+@override_settings(WRITE_COALESCE_WINDOW=0)
+class ReplicaDatabaseTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='rater', password='secret-password')
+        self.movie = make_movie(Category.objects.create(name='Drama'), self.user, title='Replicated')
+        self.replicate()
+
+    def replicate(self):
+        """Copy the primary over the replica, as replication eventually would"""
+        for alias in ('default', 'replica'):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(connections['replica'].connection)
+
+    def test_reads_lag_until_replicated(self):
+        newcomer = make_movie(self.movie.category, self.user, title='Newcomer')
+        url = reverse('api_movie_detail', args=[newcomer.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.replicate()
+        self.assertEqual(self.client.get(url).json()['title'], 'Newcomer')
+
+    def test_writers_read_their_own_writes(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('rate_movie', args=[self.movie.pk]), {'rating': 4},
+                                    content_type='application/json')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(reverse('movie_detail', args=[self.movie.pk])).context['user_rating'], 4)
+
+        # Everyone else reads the replica, which hasn't caught up yet
+        url = reverse('api_movie_detail', args=[self.movie.pk])
+        self.assertEqual(Client().get(url).json()['total_ratings'], 0)
+        self.replicate()
+        self.assertEqual(Client().get(url).json()['total_ratings'], 1)
+
+
+    @override_settings(TASK_QUEUE_EAGER=True)
+    def test_search_index_migrates_per_database(self):
+        Movie.objects.using('replica').filter(pk=self.movie.pk).update(title='Only On The Replica')
+        call_command('migrate', 'movies', '0007', database='replica', verbosity=0)
+        call_command('migrate', 'movies', database='replica', verbosity=0)
+        self.assertEqual(list(search_queryset(Movie.objects.using('replica'), 'only')), [self.movie])
+        self.assertEqual(list(search_queryset(Movie.objects.all(), 'only')), [])
+
+    def test_replica_renders_are_cached_apart(self):
+        other = Client()
+        other.force_login(User.objects.create_user(username='browser'))
+        self.client.force_login(self.user)
+        self.client.post(reverse('rate_movie', args=[self.movie.pk]), {'rating': 4}, content_type='application/json')
+        listing = other.get(reverse('api_movie_list'))
+
+        # Another user renders the home page from the replica, before it has the rating...
+        stars = 'fas fa-star'
+        self.assertEqual(other.get(reverse('home')).content.decode().count(stars), 0)
+        # ...which the pinned writer never gets from the cache
+        self.assertEqual(self.client.get(reverse('home')).content.decode().count(stars), 4)
+
+        self.replicate()
+        self.assertEqual(other.get(reverse('api_movie_list'), headers={'if-none-match': listing['ETag']}).status_code,
+                         304)
+        later = time.time() + settings.REPLICA_PIN_SECONDS
+        with mock.patch('movies.caching.time.time', return_value=later):
+            self.assertEqual(other.get(reverse('home')).content.decode().count(stars), 4)
+            revalidated = other.get(reverse('api_movie_list'), headers={'if-none-match': listing['ETag']})
+        self.assertEqual(revalidated.json()['results'][0]['total_ratings'], 1)
+
+def image_upload(name, size=(1200, 1800), color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageRenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='uploader')
+        cls.category = Category.objects.create(name='Drama')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def upload(self, movie, name, **kwargs):
+        movie.poster = image_upload(name, **kwargs)
+        movie.save()
+        run_pending()
+        movie.refresh_from_db()
+
+    def render(self, movie, rendition='card'):
+        return Template('{% load pictures %}{% picture movie.poster rendition alt=movie.title %}').render(
+            Context({'movie': movie, 'rendition': rendition})
+        )
+
+    def test_upload_generates_content_addressed_renditions(self):
+        movie = make_movie(self.category, self.user)
+        self.upload(movie, 'poster.jpg')
+        manifest = get_manifest(movie.poster)
+        self.assertEqual(manifest['widths'], [80, 160, 300, 500, 600, 1000])
+        self.assertIn('webp', manifest['formats'])
+        for width in manifest['widths']:
+            with default_storage.open(rendition_path(manifest['digest'], width, 'webp')) as rendition:
+                self.assertEqual(Image.open(rendition).size, (width, width * 3 // 2))
+
+        html = self.render(movie)
+        self.assertIn('<picture><source type="image/', html)
+        self.assertIn(f"{manifest['digest']}-300w.webp 300w, ", html)
+        self.assertIn(f"src=\"/media/{rendition_path(manifest['digest'], 300, 'jpeg')}\"", html)
+
+        # The same image uploaded again shares the renditions
+        other = make_movie(self.category, self.user, title='Twin')
+        self.upload(other, 'copy.jpg')
+        self.assertEqual(other.poster_renditions['digest'], manifest['digest'])
+
+    def test_small_images_are_not_upscaled(self):
+        movie = make_movie(self.category, self.user)
+        self.upload(movie, 'small.jpg', size=(240, 360))
+        self.assertEqual(movie.poster_renditions['widths'], [80, 160])
+        self.assertIn('160w.jpg 160w"', self.render(movie))
+
+    def test_replaced_poster_falls_back_until_regenerated(self):
+        movie = make_movie(self.category, self.user)
+        self.upload(movie, 'first.jpg')
+        first = movie.poster_renditions['digest']
+
+        movie.poster = image_upload('second.jpg', color='blue')
+        movie.save()
+        self.assertIsNone(get_manifest(movie.poster))
+        self.assertIn(f'<img src="{movie.poster.url}"', self.render(movie))
+
+        run_pending()
+        movie.refresh_from_db()
+        self.assertNotEqual(movie.poster_renditions['digest'], first)
+
+    def test_undecodable_upload_is_discarded(self):
+        movie = make_movie(self.category, self.user)
+        movie.poster = SimpleUploadedFile('broken.jpg', b'not really a jpeg', content_type='image/jpeg')
+        movie.save()
+        name = movie.poster.name
+        with self.assertLogs('movies.images', 'WARNING'):
+            run_pending()
+        movie.refresh_from_db()
+        self.assertFalse(movie.poster)
+        self.assertFalse(default_storage.exists(name))
+
+
+flaky_calls = []
+
+
+@task('test_flaky')
+def flaky_task(fail_times):
+    flaky_calls.append(fail_times)
+    if len(flaky_calls) <= fail_times:
+        raise RuntimeError('transient failure')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        flaky_calls.clear()
+
+    def make_due(self):
+        Task.objects.filter(status=Task.PENDING).update(run_after=timezone.now())
+
+    def test_search_updates_are_queued(self):
+        user = User.objects.create(username='author')
+        movie = make_movie(Category.objects.create(name='Drama'), user, title='Zabriskie Point')
+        self.assertEqual(search_queryset(Movie.objects.all(), 'zabriskie').count(), 0)
+
+        # Saving again before the worker runs doesn't queue a second update
+        movie.save()
+        self.assertEqual(Task.objects.filter(name='sync_search_document', status=Task.PENDING).count(), 1)
+
+        self.assertEqual(run_pending(), 2)  # the search document and the content neighbours
+        self.assertEqual(list(search_queryset(Movie.objects.all(), 'zabriskie')), [movie])
+
+        movie.delete()
+        run_pending()
+        self.assertEqual(search_queryset(Movie.objects.all(), 'zabriskie').count(), 0)
+
+    def test_failures_are_retried_with_backoff(self):
+        queued = enqueue('test_flaky', {'fail_times': 2})
+        with self.assertLogs('movies.tasks', 'WARNING'):
+            self.assertEqual(run_pending(), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.PENDING, 1))
+        self.assertIn('transient failure', queued.last_error)
+        self.assertGreater(queued.run_after, timezone.now())
+
+        # Not due until the backoff passes
+        self.assertEqual(run_pending(), 0)
+        with self.assertLogs('movies.tasks', 'INFO'):
+            for _ in range(2):
+                self.make_due()
+                run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.DONE, 3))
+
+    def test_gives_up_after_max_attempts(self):
+        queued = enqueue('test_flaky', {'fail_times': 10})
+        Task.objects.filter(pk=queued.pk).update(max_attempts=2)
+        with self.assertLogs('movies.tasks', 'WARNING') as logs:
+            run_pending()
+            self.make_due()
+            run_pending()
+        self.assertIn('failed after 2 attempts', logs.output[-1])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+
+    def test_stale_running_tasks_are_requeued(self):
+        first = enqueue('test_flaky', {'fail_times': 0}, key='job')
+        Task.objects.filter(pk=first.pk).update(status=Task.RUNNING, started_at=timezone.now() - timedelta(hours=1))
+        second = enqueue('test_flaky', {'fail_times': 0}, key='job')
+        self.assertNotEqual(first.pk, second.pk)
+
+        # The newer pending copy covers the abandoned one
+        self.assertEqual(requeue_stale(), 1)
+        first.refresh_from_db()
+        self.assertEqual(first.status, Task.DONE)
+        self.assertEqual(run_pending(), 1)
+
+    def test_latency_stats(self):
+        for _ in range(3):
+            enqueue('test_flaky', {'fail_times': 0})
+        enqueue('test_flaky', {'fail_times': 0}, delay=60)
+        run_pending()
+        stats = latency_stats()['test_flaky']
+        self.assertEqual((stats['done'], stats['failed'], stats['pending']), (3, 0, 1))
+        self.assertGreaterEqual(stats['wait_p95'], stats['wait_p50'])
+
+
+class CatalogImportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='importer')
+        cls.drama = Category.objects.create(name='Drama')
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root, TASK_QUEUE_EAGER=True))
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        Image.new('RGB', (240, 360), 'green').save(os.path.join(self.source_dir, 'poster.jpg'))
+
+    def write(self, name, text):
+        path = os.path.join(self.source_dir, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(text)
+        return path
+
+    def test_csv_import_in_batches(self):
+        path = self.write('movies.csv', (
+            'title,description,release_date,actors,rating,category,youtube_trailer,poster\n'
+            'Alpha,First,2020-01-01,"Ann Lee, Bo Chan",7.5,drama,,poster.jpg\n'
+            'Beta,Second,2021-02-02,Bo Chan,8,Thriller,,\n'
+            'Gamma,Third,not a date,,5,Drama,,\n'
+            'Delta,Fourth,2022-03-03,,11,Drama,,\n'
+            'Epsilon,Fifth,2023-04-04,,6,DRAMA,,missing.jpg\n'
+        ))
+        with open(path, newline='') as stream:
+            importer = CatalogImporter(self.user, batch_size=2, poster_root=self.source_dir).run(read_rows(stream, 'csv'))
+
+        self.assertEqual((importer.rows, importer.imported, importer.skipped), (5, 3, 2))
+        self.assertEqual((importer.posters, importer.poster_failures), (1, 1))
+        self.assertEqual(len(importer.errors), 3)
+
+        # Category names resolve case-insensitively to one row each
+        self.assertEqual(sorted(Category.objects.values_list('name', flat=True)), ['Drama', 'Thriller'])
+        self.assertEqual(Movie.objects.filter(category=self.drama).count(), 2)
+
+        alpha = Movie.objects.get(title='Alpha')
+        names = [credit.actor.name for credit in alpha.cast_credits.select_related('actor')]
+        self.assertEqual(names, ['Ann Lee', 'Bo Chan'])
+        self.assertEqual(Actor.objects.filter(name='Bo Chan').count(), 1)
+        self.assertEqual(get_manifest(alpha.poster)['widths'], [80, 160])
+        self.assertEqual(list(search_queryset(Movie.objects.all(), 'epsilon')), [Movie.objects.get(title='Epsilon')])
+
+    def test_jsonl_round_trip(self):
+        make_movie(self.drama, self.user, title='Solaris', actors='Donatas Banionis', rating=8.1)
+        make_movie(self.drama, self.user, title='Stalker, "the zone"', description='Line one\nline two')
+        exported = os.path.join(self.source_dir, 'export.jsonl')
+        call_command('export_movies', exported, stdout=StringIO())
+
+        with open(exported, encoding='utf-8') as stream:
+            rows = [json.loads(line) for line in stream]
+        self.assertEqual([row['title'] for row in rows], ['Solaris', 'Stalker, "the zone"'])
+
+        Movie.objects.all().delete()
+        path = self.write('broken.jsonl', open(exported, encoding='utf-8').read() + '{not json\n')
+        out = StringIO()
+        call_command('import_movies', path, user='importer', stdout=out, stderr=StringIO())
+        self.assertIn('Imported 2 of 3 rows (1 skipped)', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        stalker = Movie.objects.get(title='Stalker, "the zone"')
+        self.assertEqual(stalker.description, 'Line one\nline two')
+        self.assertEqual(Movie.objects.get(title='Solaris').rating, 8.1)
+
+
+class RatingsImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='curator')
+        category = Category.objects.create(name='Sci-Fi')
+        cls.matrix = make_movie(category, cls.user, title='The Matrix', release_date=date(1999, 3, 31))
+        cls.alien = make_movie(category, cls.user, title='Alien', release_date=date(1979, 5, 25))
+
+    def test_rescale(self):
+        self.assertEqual([rescale(value) for value in ('1', '2', '3', '4', '5')], [1, 2, 3, 4, 5])
+        self.assertEqual([rescale(value) for value in ('0.5', '1.5', '2.5', '3.5', '4.5')], [1, 2, 3, 4, 5])
+        with self.assertRaises(ValueError):
+            rescale('5.5')
+
+    def test_titles_are_matched_by_name_and_year(self):
+        mapping = match_movies(StringIO(
+            'movieId,title,genres\n'
+            '2571,"Matrix, The (1999)",Action|Sci-Fi\n'
+            '1214,Alien (1979),Horror|Sci-Fi\n'
+            '1,Toy Story (1995),Animation\n'
+        ))
+        self.assertEqual(mapping, {2571: self.matrix.pk, 1214: self.alien.pk})
+
+    def test_ratings_are_upserted(self):
+        Rating.objects.create(user=self.user, movie=self.matrix, rating=2)
+        ratings = StringIO(
+            'userId,movieId,rating,timestamp\n'
+            '1,2571,4.5,964982703\n'
+            '1,1214,0.5,964982224\n'
+            '2,2571,3.0,1445714835\n'
+            '2,99999,3.0,1445714835\n'
+            'bad,row\n'
+        )
+        importer = RatingsImporter({2571: self.matrix.pk, 1214: self.alien.pk}, batch_size=2).run(ratings)
+        self.assertEqual((importer.rows, importer.written, importer.skipped, importer.users_created), (5, 3, 2, 2))
+
+        imported = User.objects.get(username='movielens_1')
+        self.assertFalse(imported.has_usable_password())
+        self.assertTrue(hasattr(imported, 'profile'))
+        rating = Rating.objects.get(user=imported, movie=self.matrix)
+        self.assertEqual(rating.rating, 5)
+        self.assertEqual(rating.created_at, datetime(2000, 7, 30, 18, 45, 3, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(refresh_rating_aggregates(), 2)
+        self.matrix.refresh_from_db()
+        self.assertEqual((self.matrix.rating_sum, self.matrix.rating_count), (10, 3))
+
+        # Replaying the file doesn't overwrite a newer rating made on the site
+        rating.rating = 1
+        rating.save()
+        ratings.seek(0)
+        RatingsImporter({2571: self.matrix.pk, 1214: self.alien.pk}).run(ratings)
+        rating.refresh_from_db()
+        self.assertEqual(rating.rating, 1)
+        self.assertEqual(Rating.objects.filter(movie=self.matrix).count(), 3)
+        self.assertEqual(Rating.objects.get(user=self.user).rating, 2)
+
+    def test_command_refreshes_totals(self):
+        path = tempfile.mkstemp(suffix='.csv')[1]
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as stream:
+            stream.write('userId,movieId,rating,timestamp\n1,%d,4,1\n2,%d,2,1\n' % (self.alien.pk, self.alien.pk))
+        out = StringIO()
+        call_command('import_ratings', path, stdout=out)
+        self.assertIn('Wrote 2 of 2 ratings', out.getvalue())
+        self.alien.refresh_from_db()
+        self.assertEqual((self.alien.rating_sum, self.alien.rating_count), (6, 2))
+
+
+
+
+class FactorizationTests(TestCase):
+    def synthetic(self, users=300, movies=60, factors=3, seed=0):
+        rng = np.random.default_rng(seed)
+        user_vectors, movie_vectors = rng.normal(0, 1, (users, factors)), rng.normal(0, 1, (movies, factors))
+        user_ids, movie_ids = np.nonzero(rng.random((users, movies)) < 0.3)
+        signal = np.einsum('ij,ij->i', user_vectors[user_ids], movie_vectors[movie_ids])
+        ratings = np.clip(np.rint(3 + 0.7 * signal), 1, 5)
+        return user_ids + 1, movie_ids + 1, ratings
+
+    def test_explicit_als_beats_the_mean(self):
+        train_set, test_set = split_ratings(*self.synthetic(), test_fraction=0.2)
+        epochs = []
+        model = train(*train_set, factors=8, iterations=6, on_epoch=lambda epoch, seconds: epochs.append(epoch))
+        self.assertEqual(epochs, [1, 2, 3, 4, 5, 6])
+
+        results = evaluate(model, train_set, test_set, k=5)
+        baseline = np.sqrt(np.mean((test_set[2] - train_set[2].mean()) ** 2))
+        self.assertLess(results['rmse'], 0.75 * baseline)
+        self.assertGreater(results['evaluated_users'], 0)
+
+    def test_recommend_ranks_unrated_movies(self):
+        model = FactorModel(
+            user_ids=np.array([7]), movie_ids=np.array([10, 20, 30, 40]),
+            user_factors=np.array([[1.0, 0.0]]), item_factors=np.array([[0.1, 0], [0.9, 0], [0.5, 0], [0.7, 0]]),
+        )
+        self.assertEqual([movie for movie, _ in model.recommend(7, n=2)], [20, 40])
+        self.assertEqual([movie for movie, _ in model.recommend(7, n=3, exclude={20, 99})], [40, 30, 10])
+        self.assertEqual(model.recommend(8), [])
+
+    def test_saved_model_is_memory_mapped(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        user = User.objects.create(username='rater')
+        category = Category.objects.create(name='Drama')
+        movies = [make_movie(category, user, title=f'Movie {i}') for i in range(4)]
+        Rating.objects.create(user=user, movie=movies[0], rating=5)
+
+        with override_settings(RECOMMENDER_MODEL_DIR=directory):
+            self.assertIsNone(get_model())
+            triples = [(rater, movie.pk, (rater + i) % 5 + 1) for rater in (user.pk, 1000, 1001)
+                       for i, movie in enumerate(movies)]
+            train(*zip(*triples), factors=2, iterations=2).save()
+            model = get_model()
+            self.assertIsInstance(model.item_factors, np.memmap)
+            recommended = [movie for movie, _ in recommend_for_user(user, n=4)]
+            self.assertEqual(sorted(recommended), sorted(movie.pk for movie in movies[1:]))
+
+    def test_saves_swap_whole_models(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        def model(value, users=1):
+            return FactorModel(user_ids=np.arange(users), movie_ids=np.array([10]),
+                               user_factors=np.full((users, 1), value), item_factors=np.ones((1, 1)))
+
+        with override_settings(RECOMMENDER_MODEL_DIR=directory):
+            model(1.0).save()
+            loaded = get_model()
+            # A reader that started on the old model keeps the old arrays and metadata together
+            old = FactorModel.load(version=current_version())
+            for value in (2.0, 3.0, 4.0):
+                model(value, users=2).save()
+            self.assertEqual(old.user_factors.tolist(), [[1.0]])
+            self.assertEqual(loaded.user_factors.tolist(), [[1.0]])
+            self.assertEqual(get_model().user_factors.tolist(), [[4.0], [4.0]])
+            self.assertEqual(len([name for name in os.listdir(directory) if name.startswith('factors-')]), 2)
+
+
+class EmbeddingStoreTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'embeddings.bin')
+        settings_override = override_settings(EMBEDDING_STORE_PATH=self.path, RECOMMENDER_MODEL_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_build_from_the_database(self):
+        user = User.objects.create(username='rater')
+        category = Category.objects.create(name='Drama')
+        movies = [make_movie(category, user, title=f'Movie {i}') for i in range(3)]
+        Rating.objects.create(user=user, movie=movies[2], rating=5)
+        MovieSimilarity.objects.create(movie=movies[0], similar_movie=movies[2], score=0.4)
+        MovieSimilarity.objects.create(movie=movies[0], similar_movie=movies[1], score=0.9)
+
+        self.assertIsNone(get_store())
+        build_store(neighbours=4)
+        store = get_store()
+        self.assertIsInstance(store.movie_ids, np.ndarray)
+        self.assertFalse(store.item_factors.flags.writeable)
+        self.assertEqual(list(store.movie_ids), sorted(movie.pk for movie in movies))
+        self.assertEqual(store.factors, 0)
+        self.assertEqual([movie for movie, _ in store.neighbours(movies[0].pk)], [movies[1].pk, movies[2].pk])
+        self.assertEqual(store.neighbours(movies[1].pk), [])
+        self.assertEqual(store.most_popular(1), [movies[2].pk])
+        self.assertEqual(store.most_popular(1, exclude={movies[2].pk}), [movies[0].pk])
+
+    def test_replacement_is_picked_up(self):
+        write_store([2, 1], [[0.5, 0.5], [1.0, 0.0]], [[1], [-1]], [[0.3], [0.0]], [0.2, 0.1], path=self.path)
+        first = get_store()
+        self.assertIs(get_store(), first)
+        self.assertEqual(first.vector(1).tolist(), [1.0, 0.0])
+        self.assertEqual(first.neighbours(2), [(1, float(np.float32(0.3)))])
+        vectors = first.item_factors
+
+        write_store([3], [[0.0, 1.0]], [[-1]], [[0.0]], [1.0], path=self.path)
+        second = get_store()
+        self.assertIsNot(second, first)
+        self.assertEqual(list(second.movie_ids), [3])
+        self.assertEqual(vectors.tolist(), [[1.0, 0.0], [0.5, 0.5]])  # the old mapping stays readable
+
+        with open(self.path, 'r+b') as stream:
+            stream.truncate(100)
+        with self.assertRaises(ValueError):
+            EmbeddingStore(self.path)
+
+
+class NearestNeighbourTests(TestCase):
+    def test_recall_against_exact_search(self):
+        rng = np.random.default_rng(0)
+        centres = rng.normal(size=(40, 16))
+        vectors = centres[rng.integers(0, 40, 3000)] + 0.5 * rng.normal(size=(3000, 16))
+        vectors[7] = 0
+        index = LSHIndex(np.arange(3000, 0, -1), vectors)
+        self.assertEqual(len(index), 2999)
+        self.assertEqual(index.query_id(3000 - 7), [])
+
+        recalls = []
+        for item_id in rng.choice(index.ids, 100, replace=False):
+            found = index.query_id(item_id, 10)
+            exact = index.query_id(item_id, 10, exact=True)
+            self.assertNotIn(item_id, [other for other, _ in found])
+            self.assertEqual([score for _, score in found], sorted((score for _, score in found), reverse=True))
+            recalls.append(len({other for other, _ in found} & {other for other, _ in exact}) / 10)
+        self.assertGreater(np.mean(recalls), 0.8)
+
+    def test_detail_page_falls_back_to_factor_neighbours(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        user = User.objects.create(username='adder')
+        category = Category.objects.create(name='Drama')
+        movie, near, far = (make_movie(category, user, title=title) for title in ('Solaris', 'Stalker', 'Cats'))
+
+        with override_settings(EMBEDDING_STORE_PATH=os.path.join(directory, 'embeddings.bin')):
+            write_store([movie.pk, near.pk, far.pk], [[1, 0.1], [0.9, 0.2], [-1, 0]],
+                        np.full((3, 1), -1), np.zeros((3, 1)), np.zeros(3))
+            response = self.client.get(reverse('movie_detail', args=[movie.pk]))
+        self.assertEqual(response.context['similar_movies'], [near])
+
+
+@override_settings(TASK_QUEUE_EAGER=True)
+class ContentSimilarityTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(RECOMMENDER_MODEL_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(username='adder')
+        self.scifi = Category.objects.create(name='Sci-Fi')
+        self.drama = Category.objects.create(name='Drama')
+        self.alien = make_movie(self.scifi, self.user, title='Alien', actors='Sigourney Weaver, Tom Skerritt',
+                                description='A spaceship crew is hunted by a deadly alien creature.')
+        self.aliens = make_movie(self.scifi, self.user, title='Aliens', actors='Sigourney Weaver, Michael Biehn',
+                                 description='Marines return to the alien planet to fight the creature.')
+        self.letters = make_movie(self.drama, self.user, title='Letters', actors='Someone Else',
+                                  description='Two sisters exchange letters across a long winter.')
+
+    def neighbours(self, movie):
+        return [similar.pk for similar in movie.similar_by_content()]
+
+    def test_rebuild(self):
+        self.assertIsNone(ContentModel.load())
+        model = rebuild_content_similarity(k=2)
+        self.assertTrue(os.path.exists(content_path()))
+        self.assertIn('actor:sigourney weaver', model.terms)
+        self.assertNotIn('the', model.terms)
+        self.assertEqual(self.neighbours(self.alien), [self.aliens.pk])
+        self.assertEqual(self.neighbours(self.letters), [])
+        scores = ContentSimilarity.objects.filter(movie=self.alien).values_list('score', flat=True)
+        self.assertTrue(all(0 < score <= 1 for score in scores))
+
+    def test_movie_form_saves_update_incrementally(self):
+        rebuild_content_similarity(k=2)
+        form = MovieForm(data={
+            'title': 'Alien 3', 'description': 'The alien creature follows her to a prison planet.',
+            'release_date': '1992-05-22', 'actors': 'Sigourney Weaver, Charles Dance', 'rating': 6,
+            'category': self.scifi.pk,
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        sequel = form.save(commit=False)
+        sequel.added_by = self.user
+        sequel.save()
+        self.assertEqual(set(self.neighbours(sequel)), {self.alien.pk, self.aliens.pk})
+        self.assertIn(sequel.pk, self.neighbours(self.aliens))
+
+        form = MovieForm(instance=Movie.objects.get(pk=sequel.pk), data={
+            **form.data, 'description': 'Two sisters trade letters every winter.', 'actors': 'Someone Else',
+            'category': self.drama.pk,
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(self.neighbours(sequel), [self.letters.pk])
+        self.assertNotIn(sequel.pk, self.neighbours(self.aliens))
+        self.assertEqual(self.neighbours(self.letters), [sequel.pk])
+
+        sequel.delete()
+        self.assertEqual(self.neighbours(self.letters), [])
+        self.assertNotIn(sequel.pk, ContentModel.load().movie_ids)
+
+    def test_only_content_changes_are_queued(self):
+        movie = Movie.objects.get(pk=self.alien.pk)
+        queued = Task.objects.filter(name='update_content_similarity', key=f'content:{movie.pk}')
+        with override_settings(TASK_QUEUE_EAGER=False):
+            movie.title = 'Alien (Director\'s Cut)'
+            movie.save()
+            self.assertFalse(queued.exists())
+            movie.description += ' Extended.'
+            movie.save()
+            self.assertTrue(queued.exists())
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.users = [User.objects.create(username=f'user{i}') for i in range(4)]
+        category = Category.objects.create(name='Drama')
+        self.fresh, self.steady, self.old = (
+            make_movie(category, self.users[0], title=title) for title in ('Fresh', 'Steady', 'Old'))
+
+    def rate(self, movie, user, rating, days_ago):
+        Rating.objects.create(movie=movie, user=user, rating=rating)
+        Rating.objects.filter(movie=movie, user=user).update(updated_at=self.now - timedelta(days=days_ago))
+
+    def board(self, name):
+        return [movie.pk for movie, _ in trending_boards()[name]]
+
+    def counters(self):
+        return {counter.pk: (round(counter.activity, 6), round(counter.rating_sum, 6), round(counter.watchlist_adds, 6))
+                for counter in TrendingCounter.objects.all()}
+
+    def test_boards_favour_recent_activity(self):
+        for user in self.users[:2]:
+            self.rate(self.fresh, user, 5, days_ago=0.5)
+        for user in self.users:
+            self.rate(self.steady, user, 4, days_ago=6)
+        self.rate(self.old, self.users[0], 5, days_ago=60)
+        Watchlist.objects.create(movie=self.steady, user=self.users[0])
+        Watchlist.objects.filter(movie=self.steady).update(added_at=self.now - timedelta(days=1))
+
+        refresh_trending(now=self.now)
+        self.assertEqual(self.board(TrendingRank.TRENDING), [self.fresh.pk, self.steady.pk])
+        self.assertEqual(self.board(TrendingRank.TOP_RATED_WEEK), [self.fresh.pk, self.steady.pk])
+        self.assertEqual(self.board(TrendingRank.MOST_WATCHLISTED), [self.steady.pk])
+        self.assertFalse(TrendingCounter.objects.filter(movie=self.old).exists())
+
+        counter = TrendingCounter.objects.get(movie=self.fresh)
+        self.assertAlmostEqual(counter.activity, 2 * 2 ** -0.25)
+        self.assertAlmostEqual(counter.rating_sum / counter.rating_count, 5)
+
+    def test_incremental_refresh_matches_a_full_one(self):
+        self.rate(self.fresh, self.users[0], 5, days_ago=3)
+        Review.objects.create(movie=self.steady, user=self.users[1], review_text='Good')
+        Review.objects.filter(movie=self.steady).update(created_at=self.now - timedelta(days=2))
+        refresh_trending(now=self.now - timedelta(days=1))
+
+        self.rate(self.steady, self.users[2], 2, days_ago=0.5)
+        self.rate(self.old, self.users[3], 4, days_ago=0.25)
+        refresh_trending(now=self.now)
+        incremental = self.counters()
+
+        TrendingCounter.objects.all().delete()
+        refresh_trending(now=self.now)
+        self.assertEqual(incremental, self.counters())
+        self.assertEqual(self.board(TrendingRank.TRENDING), [self.steady.pk, self.old.pk, self.fresh.pk])
+
+    def test_late_commits_are_counted_once(self):
+        self.rate(self.fresh, self.users[0], 5, days_ago=0)
+        refresh_trending(now=self.now)
+        # Stamped before that run but committed after it
+        self.rate(self.steady, self.users[1], 4, days_ago=30 / 86400)
+        later = self.now + timedelta(minutes=3)
+        refresh_trending(now=later)
+        incremental = self.counters()
+
+        TrendingCounter.objects.all().delete()
+        refresh_trending(now=later)
+        self.assertEqual(incremental, self.counters())
+        self.assertEqual(set(incremental), {self.fresh.pk, self.steady.pk})
+
+    def test_sections_on_home_and_dashboard(self):
+        self.rate(self.fresh, self.users[0], 5, days_ago=1)
+        self.rate(self.fresh, self.users[1], 4, days_ago=0)
+        call_command('refresh_trending', stdout=StringIO())
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual([title for title, _ in response.context['trending']], ['Trending now', 'Top rated this week'])
+        self.assertContains(response, 'Top rated this week')
+        self.assertEqual(self.client.get(reverse('home'), {'search': 'fresh'}).context['trending'], [])
+
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['trending'][0][1][0][0], self.fresh)
@@ -0,0 +1,197 @@
+"""
+Trending boards from exponentially time-decayed activity.
+
+Each event counts with weight 2 ** -(age / half-life), so a board reflects
+what is happening now rather than all-time totals. TrendingCounter keeps
+one row per movie with recent activity, holding these columns:
+
+- activity: ratings, reviews and watchlist adds, weighted by kind and
+  decayed with ACTIVITY_HALF_LIFE
+- rating_sum / rating_count: the stars and the number of ratings, decayed
+  with WEEKLY_HALF_LIFE
+- watchlist_adds: watchlist adds, decayed with WATCHLIST_HALF_LIFE
+
+``manage.py refresh_trending`` runs periodically (every few minutes from
+cron). Each run folds in the counters incrementally:
+
+1. Decay every counter from its decayed_to time to now with a single
+   UPDATE.
+2. Add the events written since the previous run, found through the
+   timestamp indexes. A row can commit after a run has passed its
+   timestamp, so each run reads LATE_COMMITS further back and skips the
+   events the previous run recorded in TrendingEvent as already counted.
+3. Delete counters that have decayed to almost nothing.
+4. Rewrite the TrendingRank boards.
+
+Request paths only read the boards, from the cache, invalidated through
+the trending scope.
+
+A re-rating counts as a new event at its new value. Deleted ratings and
+watchlist entries are not subtracted; their contribution simply decays.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .caching import bump_versions, get_version, source_key, source_timeout, trending_scope
+from .models import Rating, Review, TrendingCounter, TrendingEvent, TrendingRank, Watchlist
+
+ACTIVITY_HALF_LIFE = timedelta(days=2)
+WEEKLY_HALF_LIFE = timedelta(days=3.5)  # a week-old rating counts a quarter
+WATCHLIST_HALF_LIFE = timedelta(days=7)
+BACKFILL = timedelta(days=28)  # history read on the first run
+LATE_COMMITS = timedelta(minutes=5)  # how long after its timestamp a row may commit and still be counted
+
+RATING_WEIGHT = 1.0
+REVIEW_WEIGHT = 2.0
+WATCHLIST_WEIGHT = 1.5
+
+BOARD_SIZE = 20
+PRIOR_MEAN = 3.0
+PRIOR_COUNT = 2.0
+MIN_WEEKLY_RATINGS = 1.0  # decayed count needed to enter "top rated this week"
+PRUNE_BELOW = 0.01
+BOARDS_TIMEOUT = 60 * 60
+
+
+def decay(age, half_life):
+    """Weight of an event age old"""
+    return 2.0 ** -(age / half_life)
+
+
+def collect_events(since, until, seen=frozenset()):
+    """
+    ({movie id: {column: decayed weight}}, recent) for the events in (since, until].
+
+    The window starts LATE_COMMITS before since; events in seen, as
+    (kind, id, time), were counted by the previous run and are skipped.
+    recent holds every event of the last LATE_COMMITS before until, the
+    seen set for the next run.
+    """
+    totals = defaultdict(lambda: defaultdict(float))
+    recent = set()
+
+    def window(field):
+        return Q(**{f'{field}__gt': since - LATE_COMMITS}) if since else Q(**{f'{field}__gt': until - BACKFILL})
+
+    def unseen(kind, rows):
+        for pk, movie_id, when, *values in rows:
+            event = (kind, pk, when)
+            if when > until - LATE_COMMITS:
+                recent.add(event)
+            if event not in seen:
+                yield movie_id, when, *values
+
+    ratings = Rating.objects.filter(window('updated_at'), updated_at__lte=until).order_by()
+    rows = ratings.values_list('pk', 'movie_id', 'updated_at', 'rating').iterator()
+    for movie_id, when, rating in unseen(TrendingEvent.RATING, rows):
+        weekly = decay(until - when, WEEKLY_HALF_LIFE)
+        totals[movie_id]['activity'] += RATING_WEIGHT * decay(until - when, ACTIVITY_HALF_LIFE)
+        totals[movie_id]['rating_sum'] += rating * weekly
+        totals[movie_id]['rating_count'] += weekly
+
+    reviews = Review.objects.filter(window('created_at'), created_at__lte=until).order_by()
+    rows = reviews.values_list('pk', 'movie_id', 'created_at').iterator()
+    for movie_id, when in unseen(TrendingEvent.REVIEW, rows):
+        totals[movie_id]['activity'] += REVIEW_WEIGHT * decay(until - when, ACTIVITY_HALF_LIFE)
+
+    watchlist = Watchlist.objects.filter(window('added_at'), added_at__lte=until).order_by()
+    rows = watchlist.values_list('pk', 'movie_id', 'added_at').iterator()
+    for movie_id, when in unseen(TrendingEvent.WATCHLIST, rows):
+        totals[movie_id]['activity'] += WATCHLIST_WEIGHT * decay(until - when, ACTIVITY_HALF_LIFE)
+        totals[movie_id]['watchlist_adds'] += decay(until - when, WATCHLIST_HALF_LIFE)
+    return totals, recent
+
+
+def bayesian_weekly_average():
+    return (F('rating_sum') + PRIOR_MEAN * PRIOR_COUNT) / (F('rating_count') + PRIOR_COUNT)
+
+
+def rank_boards():
+    """Rewrite the TrendingRank rows from the counters; return the number of ranked entries"""
+    counters = TrendingCounter.objects.order_by()
+    boards = {
+        TrendingRank.TRENDING: counters.filter(activity__gt=PRUNE_BELOW).annotate(score=F('activity')),
+        TrendingRank.TOP_RATED_WEEK: counters.filter(rating_count__gte=MIN_WEEKLY_RATINGS).annotate(
+            score=bayesian_weekly_average()),
+        TrendingRank.MOST_WATCHLISTED: counters.filter(watchlist_adds__gt=PRUNE_BELOW).annotate(
+            score=F('watchlist_adds')),
+    }
+    ranks = []
+    for board, queryset in boards.items():
+        top = queryset.order_by('-score', 'movie_id').values_list('movie_id', 'score')[:BOARD_SIZE]
+        ranks.extend(
+            TrendingRank(board=board, position=position, movie_id=movie_id, score=score)
+            for position, (movie_id, score) in enumerate(top, start=1)
+        )
+    TrendingRank.objects.all().delete()
+    TrendingRank.objects.bulk_create(ranks)
+    return len(ranks)
+
+
+def refresh_trending(now=None):
+    """Fold the events since the last run into the counters and re-rank; return counts for reporting"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        since = TrendingCounter.objects.aggregate(latest=Max('decayed_to'))['latest']
+        if since is not None:
+            if since >= now:
+                return {'movies': 0, 'counters': TrendingCounter.objects.count(), 'ranked': 0}
+            elapsed = now - since
+            TrendingCounter.objects.update(
+                activity=F('activity') * decay(elapsed, ACTIVITY_HALF_LIFE),
+                rating_sum=F('rating_sum') * decay(elapsed, WEEKLY_HALF_LIFE),
+                rating_count=F('rating_count') * decay(elapsed, WEEKLY_HALF_LIFE),
+                watchlist_adds=F('watchlist_adds') * decay(elapsed, WATCHLIST_HALF_LIFE),
+                decayed_to=now,
+            )
+
+        seen = set(TrendingEvent.objects.values_list('kind', 'object_id', 'at')) if since else set()
+        totals, recent = collect_events(since, now, seen)
+        existing = TrendingCounter.objects.in_bulk(list(totals))
+        created, updated = [], []
+        for movie_id, columns in totals.items():
+            counter = existing.get(movie_id)
+            if counter is None:
+                created.append(TrendingCounter(movie_id=movie_id, decayed_to=now, **columns))
+                continue
+            for column, value in columns.items():
+                setattr(counter, column, getattr(counter, column) + value)
+            updated.append(counter)
+        TrendingCounter.objects.bulk_create(created, batch_size=1000)
+        TrendingCounter.objects.bulk_update(
+            updated, ['activity', 'rating_sum', 'rating_count', 'watchlist_adds'], batch_size=1000)
+
+        # If this empties the table the next run backfills, re-adding only
+        # events that had faded below PRUNE_BELOW anyway
+        TrendingCounter.objects.filter(
+            activity__lt=PRUNE_BELOW, rating_count__lt=PRUNE_BELOW, watchlist_adds__lt=PRUNE_BELOW,
+        ).delete()
+        TrendingEvent.objects.all().delete()
+        TrendingEvent.objects.bulk_create(
+            [TrendingEvent(kind=kind, object_id=pk, at=when) for kind, pk, when in recent], batch_size=1000)
+        ranked = rank_boards()
+    bump_versions(trending_scope())
+    return {'movies': len(totals), 'counters': TrendingCounter.objects.count(), 'ranked': ranked}
+
+
+def trending_boards():
+    """{board: [(Movie, score)]} best first, from the cache"""
+    key = source_key(f'trending-boards:{get_version(trending_scope())}')
+    boards = cache.get(key)
+    if boards is None:
+        boards = {board: [] for board, _ in TrendingRank.BOARD_CHOICES}
+        for rank in TrendingRank.objects.select_related('movie__category'):
+            boards[rank.board].append((rank.movie, rank.score))
+        cache.set(key, boards, source_timeout(BOARDS_TIMEOUT))
+    return boards
+
+
+def board_sections(limit=None):
+    """[(title, [(Movie, score)])] for templates, skipping empty boards"""
+    boards = trending_boards()
+    return [(title, boards[board][:limit]) for board, title in TrendingRank.BOARD_CHOICES if boards[board]]
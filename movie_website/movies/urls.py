@@ -1,12 +1,13 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
     # Public views
     path('', views.home, name='home'),
     path('movie/<int:pk>/', views.movie_detail, name='movie_detail'),
     path('category/<int:category_id>/', views.movies_by_category, name='movies_by_category'),
+    path('actor/<int:pk>/', views.actor_detail, name='actor_detail'),
     
     # Upcoming movies
     path('upcoming/', views.upcoming_movies, name='upcoming_movies'),
@@ -30,6 +31,7 @@ urlpatterns = [
     # Watchlist
     path('movie/<int:pk>/watchlist/', views.toggle_watchlist, name='toggle_watchlist'),
     path('watchlist/', views.watchlist_view, name='watchlist'),
+    path('for-you/', views.for_you, name='for_you'),
 
     # User profile
     path('profile/', views.profile, name='profile'),
@@ -42,4 +44,44 @@ urlpatterns = [
     path('admin/categories/<int:pk>/delete/', views.delete_category, name='delete_category'),
     path('admin/users/', views.manage_users, name='manage_users'),
     path('admin/users/<int:user_id>/delete/', views.delete_user, name='delete_user'),
-]
\ No newline at end of file
+
+    # Read-only JSON API
+    path('api/movies/', api.movie_list, name='api_movie_list'),
+    path('api/movies/<int:pk>/', api.movie_detail, name='api_movie_detail'),
+    path('api/categories/', api.category_list, name='api_category_list'),
+    path('api/upcoming/', api.upcoming_list, name='api_upcoming_list'),
+]
+
+# Maximum SQL queries per request (session and user lookups included).
+# QueryBudgetMiddleware logs a warning when a view goes over, and the
+# query budget tests fail.
+query_budgets = {
+    'home': 7,
+    'movie_detail': 8,
+    'movies_by_category': 5,
+    'actor_detail': 5,
+    'upcoming_movies': 5,
+    'rate_movie': 14,
+    'toggle_watchlist': 10,
+    'watchlist': 4,
+    'for_you': 3,
+    'profile': 8,
+    'admin_dashboard': 7,
+    'api_movie_list': 3,
+    'api_movie_detail': 3,
+    'api_category_list': 1,
+    'api_upcoming_list': 2,
+}
+
+# Read-only views whose GET requests may read from a replica (see movies/routers.py)
+replica_views = {
+    'home',
+    'movie_detail',
+    'movies_by_category',
+    'actor_detail',
+    'upcoming_movies',
+    'api_movie_list',
+    'api_movie_detail',
+    'api_category_list',
+    'api_upcoming_list',
+}
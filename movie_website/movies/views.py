@@ -1,12 +1,12 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import Count, F, FilteredRelation, Q
 from django.contrib.auth.models import User
 from django.core.paginator import Paginator
-from .models import Movie, Category, UserProfile
+from .models import Movie, Category, UserProfile, Actor
 from .forms import CustomUserCreationForm, MovieForm, CategoryForm, UserProfileForm
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
@@ -15,37 +15,66 @@ import json
 from .models import Rating, Review, Watchlist, UpcomingMovie
 from .forms import RatingForm, ReviewForm, UpcomingMovieForm
 from .forms import EditProfileForm
+from .search import search_queryset
+from .pagination import CursorPaginator
+from .recommendations import movies_sharing_cast
+from .ann import more_like_this
+from .feed import feed_for
+from .trending import board_sections
+from .coalescing import coalesce_window, write_buffer
+from .caching import all_movies_scope, category_scope, get_version, reviews_scope
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from asgiref.sync import sync_to_async
+
+REVIEWS_PER_PAGE = 20
+FOR_YOU_ON_HOME = 8
+TRENDING_ON_HOME = 5
+
 
 def home(request):
-    categories = Category.objects.all()
+    categories = Category.objects.annotate(movie_count=Count('movies'))
     recent_movies = Movie.objects.all()[:8]
     search_query = request.GET.get('search', '')
     category_filter = request.GET.get('category', '')
+    sort = request.GET.get('sort', '')
 
-    movies = Movie.objects.all()
-
-    if search_query:
-        movies = movies.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(actors__icontains=search_query)
-        )
+    movies = Movie.objects.select_related('category')
+    ordering = ('-created_at', '-id')
 
     if category_filter:
         movies = movies.filter(category_id=category_filter)
 
-    paginator = Paginator(movies, 12)
-    page = request.GET.get('page')
-    movies = paginator.get_page(page)
+    if sort == 'top_rated':
+        movies = movies.filter(rating_count__gt=0).annotate(
+            rating_average=F('rating_sum') * 1.0 / F('rating_count')
+        )
+        ordering = ('-rating_average', '-rating_count', '-id')
+
+    # After the filters, so the index only returns matches they keep
+    if search_query:
+        movies = search_queryset(movies, search_query)
+        ordering = ordering if sort == 'top_rated' else ('search_rank', 'id')
+
+    paginator = CursorPaginator(movies, 12, ordering)
+    movies = paginator.get_page(request.GET.get('cursor'))
+
+    for_you, trending = [], []
+    if not (search_query or category_filter or movies.has_previous()):
+        trending = board_sections(limit=TRENDING_ON_HOME)
+        if request.user.is_authenticated:
+            for_you = feed_for(request.user, limit=FOR_YOU_ON_HOME)
 
     context = {
         'categories': categories,
         'movies': movies,
+        'for_you': for_you,
+        'trending': trending,
         'recent_movies': recent_movies,
         'search_query': search_query,
         'selected_category': category_filter,
+        'sort': sort,
+        'list_version': get_version(all_movies_scope()),
     }
     return render(request, 'movies/home.html', context)
 
@@ -117,22 +146,27 @@ def delete_movie(request, pk):
     return render(request, 'movies/delete_movie.html', {'movie': movie})
 
 
-def movie_detail(request, pk):
-    movie = get_object_or_404(Movie, pk=pk)
+def movies_by_category(request, category_id):
+    category = get_object_or_404(Category, pk=category_id)
+    movies = Movie.objects.filter(category=category)
+    paginator = CursorPaginator(movies, 12, ('-created_at', '-id'))
+    movies = paginator.get_page(request.GET.get('cursor'))
     context = {
-        'movie': movie,
-        'can_edit': movie.can_edit(request.user) if request.user.is_authenticated else False
+        'category': category,
+        'movies': movies,
+        'list_version': get_version(category_scope(category.pk)),
     }
-    return render(request, 'movies/movie_detail.html', context)
+    return render(request, 'movies/category_movies.html', context)
 
 
-def movies_by_category(request, category_id):
-    category = get_object_or_404(Category, pk=category_id)
-    movies = Movie.objects.filter(category=category)
+def actor_detail(request, pk):
+    """Filmography of a single actor"""
+    actor = get_object_or_404(Actor, pk=pk)
+    movies = actor.movies.select_related('category')
     paginator = Paginator(movies, 12)
     page = request.GET.get('page')
     movies = paginator.get_page(page)
-    return render(request, 'movies/category_movies.html', {'category': category, 'movies': movies})
+    return render(request, 'movies/actor_detail.html', {'actor': actor, 'movies': movies})
 
 
 @login_required
@@ -162,8 +196,9 @@ def admin_dashboard(request):
     total_movies = Movie.objects.count()
     total_users = User.objects.count()
     total_categories = Category.objects.count()
-    recent_movies = Movie.objects.all()[:5]
+    recent_movies = Movie.objects.select_related('added_by')[:5]
     recent_users = User.objects.order_by('-date_joined')[:5]
+    trending = board_sections(limit=5)
 
     context = {
         'total_movies': total_movies,
@@ -171,13 +206,14 @@ def admin_dashboard(request):
         'total_categories': total_categories,
         'recent_movies': recent_movies,
         'recent_users': recent_users,
+        'trending': trending,
     }
     return render(request, 'movies/admin_dashboard.html', context)
 
 
 @staff_member_required
 def manage_categories(request):
-    categories = Category.objects.all()
+    categories = Category.objects.annotate(movie_count=Count('movies'))
     return render(request, 'movies/manage_categories.html', {'categories': categories})
 
 
@@ -206,10 +242,9 @@ def delete_category(request, pk):
 
 @staff_member_required
 def manage_users(request):
-    users = User.objects.all().order_by('-date_joined')
-    paginator = Paginator(users, 20)
-    page = request.GET.get('page')
-    users = paginator.get_page(page)
+    users = User.objects.annotate(movie_count=Count('movie'))
+    paginator = CursorPaginator(users, 20, ('-date_joined', '-id'))
+    users = paginator.get_page(request.GET.get('cursor'))
     return render(request, 'movies/manage_users.html', {'users': users})
 
 
@@ -228,9 +263,9 @@ def delete_user(request, user_id):
 
 @login_required
 @require_POST
-def rate_movie(request, pk):
+async def rate_movie(request, pk):
     """AJAX view to handle movie ratings"""
-    movie = get_object_or_404(Movie, pk=pk)
+    movie = await aget_object_or_404(Movie, pk=pk)
     
     try:
         data = json.loads(request.body)
@@ -239,18 +274,22 @@ def rate_movie(request, pk):
         if not (1 <= rating_value <= 5):
             return JsonResponse({'success': False, 'error': 'Rating must be between 1 and 5'})
         
-        rating, created = Rating.objects.update_or_create(
-            user=request.user,
-            movie=movie,
-            defaults={'rating': rating_value}
+        user = await request.auser()
+        buffered = write_buffer.rating(user.pk, movie.pk)
+        stored = buffered[0] if buffered else await (
+            Rating.objects.filter(user=user, movie=movie).values_list('rating', flat=True).afirst()
         )
+        previous = write_buffer.rate(user.pk, movie.pk, rating_value, stored)
+        if not coalesce_window():
+            await sync_to_async(write_buffer.flush)()
+        movie.rating_sum, movie.rating_count = await sync_to_async(write_buffer.rating_totals)(movie.pk)
         
         return JsonResponse({
             'success': True,
-            'rating': rating.rating,
+            'rating': rating_value,
             'average_rating': movie.average_rating(),
             'total_ratings': movie.total_ratings(),
-            'message': 'Rating updated!' if not created else 'Rating added!'
+            'message': 'Rating updated!' if previous is not None else 'Rating added!'
         })
     
     except (ValueError, json.JSONDecodeError):
@@ -302,22 +341,17 @@ def delete_review(request, pk):
 
 @login_required
 @require_POST
-def toggle_watchlist(request, pk):
+async def toggle_watchlist(request, pk):
     """AJAX view to add/remove movie from watchlist"""
-    movie = get_object_or_404(Movie, pk=pk)
+    movie = await aget_object_or_404(Movie, pk=pk)
     
-    watchlist_item, created = Watchlist.objects.get_or_create(
-        user=request.user,
-        movie=movie
-    )
-    
-    if not created:
-        watchlist_item.delete()
-        in_watchlist = False
-        message = 'Removed from watchlist'
-    else:
-        in_watchlist = True
-        message = 'Added to watchlist'
+    user = await request.auser()
+    buffered = write_buffer.in_watchlist(user.pk, movie.pk)
+    stored = buffered[0] if buffered else await Watchlist.objects.filter(user=user, movie=movie).aexists()
+    in_watchlist = write_buffer.toggle_watchlist(user.pk, movie.pk, stored)
+    if not coalesce_window():
+        await sync_to_async(write_buffer.flush)()
+    message = 'Added to watchlist' if in_watchlist else 'Removed from watchlist'
     
     return JsonResponse({
         'success': True,
@@ -329,7 +363,7 @@ def toggle_watchlist(request, pk):
 @login_required
 def watchlist_view(request):
     """View user's watchlist"""
-    watchlist_items = Watchlist.objects.filter(user=request.user).select_related('movie')
+    watchlist_items = Watchlist.objects.filter(user=request.user).select_related('movie__category')
     
     context = {
         'watchlist_items': watchlist_items,
@@ -338,22 +372,35 @@ def watchlist_view(request):
     return render(request, 'movies/watchlist.html', context)
 
 
+@login_required
+def for_you(request):
+    """Personalized recommendations for the signed-in user"""
+    return render(request, 'movies/for_you.html', {'movies': feed_for(request.user)})
+
+
 def upcoming_movies(request):
     """View upcoming movies"""
-    upcoming = UpcomingMovie.objects.all()
+    upcoming = UpcomingMovie.objects.select_related('category')
     categories = Category.objects.all()
     
+    ordering = ('expected_release_date', 'id')
+
     category_filter = request.GET.get('category', '')
     if category_filter:
         upcoming = upcoming.filter(category_id=category_filter)
+
+    search_query = request.GET.get('search', '')
+    if search_query:
+        upcoming = search_queryset(upcoming, search_query)
+        ordering = ('search_rank', 'id')
     
-    paginator = Paginator(upcoming, 12)
-    page = request.GET.get('page')
-    upcoming = paginator.get_page(page)
+    paginator = CursorPaginator(upcoming, 12, ordering)
+    upcoming = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'upcoming_movies': upcoming,
         'categories': categories,
+        'search_query': search_query,
         'selected_category': category_filter,
     }
     return render(request, 'movies/upcoming_movies.html', context)
@@ -380,32 +427,59 @@ def add_upcoming_movie(request):
     return render(request, 'movies/add_upcoming_movie.html', {'form': form})
 
 
-# Update your existing movie_detail view to include ratings and reviews
 def movie_detail(request, pk):
-    movie = get_object_or_404(Movie, pk=pk)
-    reviews = Review.objects.filter(movie=movie).select_related('user')
+    """
+    Movie page in a constant number of queries.
+
+    The movie, its category and adder, and the current user's rating, review
+    and watchlist entry all come from one row: each per-user relation is a
+    LEFT JOIN restricted to that user, which the unique (user, movie)
+    constraints keep to a single match. Other users' reviews are paginated.
+    """
+    movies = Movie.objects.select_related('category', 'added_by')
+    user = request.user
+    if user.is_authenticated:
+        movies = movies.annotate(
+            own_rating=FilteredRelation('user_ratings', condition=Q(user_ratings__user=user)),
+            own_review=FilteredRelation('reviews', condition=Q(reviews__user=user)),
+            own_watchlist=FilteredRelation('in_watchlists', condition=Q(in_watchlists__user=user)),
+        ).annotate(
+            user_rating_value=F('own_rating__rating'),
+            user_review_id=F('own_review__id'),
+            user_review_text=F('own_review__review_text'),
+            user_review_updated_at=F('own_review__updated_at'),
+            watchlist_entry_id=F('own_watchlist__id'),
+        )
+    movie = get_object_or_404(movies, pk=pk)
+
     user_review = None
-    user_rating = 0
-    in_watchlist = False
-    
-    if request.user.is_authenticated:
-        try:
-            user_review = Review.objects.get(user=request.user, movie=movie)
-        except Review.DoesNotExist:
-            pass
-        
-        user_rating = movie.user_rating(request.user)
-        in_watchlist = Watchlist.objects.filter(user=request.user, movie=movie).exists()
-    
+    if getattr(movie, 'user_review_id', None) is not None:
+        user_review = Review(
+            pk=movie.user_review_id,
+            user=user,
+            movie=movie,
+            review_text=movie.user_review_text,
+            updated_at=movie.user_review_updated_at,
+        )
+
+    reviews = movie.reviews.select_related('user__profile')
+    if user.is_authenticated:
+        reviews = reviews.exclude(user=user)
+    reviews = Paginator(reviews, REVIEWS_PER_PAGE).get_page(request.GET.get('reviews_page'))
+
     context = {
         'movie': movie,
         'reviews': reviews,
         'user_review': user_review,
-        'user_rating': user_rating,
-        'in_watchlist': in_watchlist,
-        'can_edit': movie.can_edit(request.user) if request.user.is_authenticated else False,
+        'user_rating': getattr(movie, 'user_rating_value', None) or 0,
+        'in_watchlist': getattr(movie, 'watchlist_entry_id', None) is not None,
+        'can_edit': movie.can_edit(user) if user.is_authenticated else False,
         'average_rating': movie.average_rating(),
         'total_ratings': movie.total_ratings(),
+        'similar_movies': (movie.similar_movies() or more_like_this(movie) or movie.similar_by_content()
+                           or movies_sharing_cast(movie)),
+        'cast': movie.cast_credits.select_related('actor'),
+        'reviews_version': get_version(reviews_scope(movie.pk)),
     }
     return render(request, 'movies/movie_detail.html', context)
 
@@ -468,7 +542,7 @@ def profile(request):
     """
     profile, created = UserProfile.objects.get_or_create(user=request.user)
 
-    user_movies = Movie.objects.filter(added_by=request.user)
+    user_movies = Movie.objects.filter(added_by=request.user).select_related('category')
 
     # Calculate profile completion percentage
     completion_fields = [